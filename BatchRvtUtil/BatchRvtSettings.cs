@@ -36,11 +36,17 @@ namespace BatchRvtUtil
 
         // General Task Script settings
         public readonly StringSetting TaskScriptFilePath = new StringSetting("taskScriptFilePath");
+        public readonly StringSetting AdditionalTaskScriptFilePaths = new StringSetting("additionalTaskScriptFilePaths");
         public readonly BooleanSetting ShowMessageBoxOnTaskScriptError = new BooleanSetting("showMessageBoxOnTaskScriptError");
         public readonly IntegerSetting ProcessingTimeOutInMinutes = new IntegerSetting("processingTimeOutInMinutes");
+        public readonly StringSetting PhaseTimeOuts = new StringSetting("phaseTimeOuts");
+        public readonly StringSetting PhaseTimeOutScaling = new StringSetting("phaseTimeOutScaling");
+        public readonly StringSetting ScriptOutputOverflowPolicy = new StringSetting("scriptOutputOverflowPolicy");
+        public readonly IntegerSetting ResourceSampleIntervalInSeconds = new IntegerSetting("resourceSampleIntervalInSeconds");
 
         // Revit File List settings
         public readonly StringSetting RevitFileListFilePath = new StringSetting("revitFileListFilePath");
+        public readonly StringSetting RevitFilePriorityRules = new StringSetting("revitFilePriorityRules");
 
         // Data Export settings
         public readonly BooleanSetting EnableDataExport = new BooleanSetting("enableDataExport");
@@ -58,6 +64,7 @@ namespace BatchRvtUtil
         public readonly EnumSetting<BatchRvt.CentralFileOpenOption> CentralFileOpenOption = new EnumSetting<BatchRvt.CentralFileOpenOption>("centralFileOpenOption");
         public readonly BooleanSetting DeleteLocalAfter = new BooleanSetting("deleteLocalAfter");
         public readonly BooleanSetting DiscardWorksetsOnDetach = new BooleanSetting("discardWorksetsOnDetach");
+        public readonly IntegerSetting CentralLockRetryLimit = new IntegerSetting("centralLockRetryLimit");
 
         // Revit Session settings
         public readonly EnumSetting<BatchRvt.RevitSessionOption> RevitSessionOption = new EnumSetting<BatchRvt.RevitSessionOption>("revitSessionOption");
@@ -74,6 +81,15 @@ namespace BatchRvtUtil
         public readonly EnumSetting<RevitVersion.SupportedRevitVersion> BatchRevitTaskRevitVersion = new EnumSetting<RevitVersion.SupportedRevitVersion>("batchRevitTaskRevitVersion");
         public readonly BooleanSetting OpenInUI = new BooleanSetting("openInUI");
 
+        // File Server Throttling settings
+        public readonly IntegerSetting MaxConcurrentOpensPerFileServer = new IntegerSetting("maxConcurrentOpensPerFileServer");
+        public readonly IntegerSetting MaxMegabytesPerSecondPerFileServer = new IntegerSetting("maxMegabytesPerSecondPerFileServer");
+        public readonly BooleanSetting ThrottlePerFileServerShare = new BooleanSetting("throttlePerFileServerShare");
+
+        // Concurrent Revit Session settings
+        public readonly IntegerSetting MaxConcurrentRevitSessions = new IntegerSetting("maxConcurrentRevitSessions");
+        public readonly StringSetting RevitVersionSessionLimits = new StringSetting("revitVersionSessionLimits");
+
         // UI settings
         public readonly BooleanSetting ShowAdvancedSettings = new BooleanSetting("showAdvancedSettings");
 
@@ -82,9 +98,15 @@ namespace BatchRvtUtil
             this.persistentSettings = new PersistentSettings(
                     new IPersistent[] {
                         this.TaskScriptFilePath,
+                        this.AdditionalTaskScriptFilePaths,
                         this.ShowMessageBoxOnTaskScriptError,
                         this.ProcessingTimeOutInMinutes,
+                        this.PhaseTimeOuts,
+                        this.PhaseTimeOutScaling,
+                        this.ScriptOutputOverflowPolicy,
+                        this.ResourceSampleIntervalInSeconds,
                         this.RevitFileListFilePath,
+                        this.RevitFilePriorityRules,
                         this.EnableDataExport,
                         this.DataExportFolderPath,
                         this.ExecutePreProcessingScript,
@@ -94,6 +116,7 @@ namespace BatchRvtUtil
                         this.CentralFileOpenOption,
                         this.DeleteLocalAfter,
                         this.DiscardWorksetsOnDetach,
+                        this.CentralLockRetryLimit,
                         this.RevitSessionOption,
                         this.RevitProcessingOption,
                         this.SingleRevitTaskRevitVersion,
@@ -101,6 +124,11 @@ namespace BatchRvtUtil
                         this.IfNotAvailableUseMinimumAvailableRevitVersion,
                         this.BatchRevitTaskRevitVersion,
                         this.OpenInUI,
+                        this.MaxConcurrentOpensPerFileServer,
+                        this.MaxMegabytesPerSecondPerFileServer,
+                        this.ThrottlePerFileServerShare,
+                        this.MaxConcurrentRevitSessions,
+                        this.RevitVersionSessionLimits,
                         this.ShowAdvancedSettings
                     }
                 );
@@ -33,6 +33,10 @@ namespace BatchRvtUtil
         public const string REVIT_FILE_LIST_OPTION = "file_list";
         public const string REVIT_VERSION_OPTION = "revit_version";
         public const string TASK_SCRIPT_FILE_PATH_OPTION = "task_script";
+        public const string PLAN_OPTION = "plan";
+        public const string WORK_QUEUE_FOLDER_PATH_OPTION = "work_queue";
+        public const string SHARD_OPTION = "shard";
+        public const string SHARD_HISTORY_FILE_PATH_OPTION = "shard_history";
         public const string HELP_OPTION = "help";
 
         private static readonly Dictionary<string, Func<string, object>> OPTION_PARSERS =
@@ -45,6 +49,10 @@ namespace BatchRvtUtil
                 { REVIT_VERSION_OPTION, ParseRevitVersionOptionValue },
                 { REVIT_FILE_LIST_OPTION, ParseExistingFilePathOptionValue },
                 { TASK_SCRIPT_FILE_PATH_OPTION, ParseExistingFilePathOptionValue },
+                { PLAN_OPTION, null },
+                { WORK_QUEUE_FOLDER_PATH_OPTION, ParseTextOptionValue },
+                { SHARD_OPTION, ParseTextOptionValue },
+                { SHARD_HISTORY_FILE_PATH_OPTION, ParseExistingFilePathOptionValue },
                 { HELP_OPTION, null }
             };
 
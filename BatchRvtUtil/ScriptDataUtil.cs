@@ -28,8 +28,13 @@ namespace BatchRvtUtil
     public static class ScriptDataUtil
     {
         private const string SCRIPT_DATA_FILENAME_PREFIX = "Session.ScriptData.";
-        private const string SESSION_PROGRESS_RECORD_PREFIX = "Session.ProgressRecord.";
+        private const string SESSION_SCRIPT_OUTPUT_SPILL_PREFIX = "Session.ScriptOutputSpill.";
         private const string JSON_FILE_EXTENSION = ".json";
+        private const string TEXT_FILE_EXTENSION = ".txt";
+
+        private const string SESSION_MANIFEST_VERSION_PROPERTY = "sessionManifestVersion";
+        private const string SESSION_MANIFEST_SHARED_PROPERTY = "shared";
+        private const int SESSION_MANIFEST_VERSION = 1;
 
         public class ScriptData : IPersistent
         {
@@ -39,6 +44,7 @@ namespace BatchRvtUtil
             public readonly StringSetting RevitFilePath = new StringSetting("revitFilePath");
             public readonly BooleanSetting EnableDataExport = new BooleanSetting("enableDataExport");
             public readonly StringSetting TaskScriptFilePath = new StringSetting("taskScriptFilePath");
+            public readonly StringSetting AdditionalTaskScriptFilePaths = new StringSetting("additionalTaskScriptFilePaths");
             public readonly StringSetting TaskData = new StringSetting("taskData");
             public readonly StringSetting SessionDataFolderPath = new StringSetting("sessionDataFolderPath");
             public readonly StringSetting DataExportFolderPath = new StringSetting("dataExportFolderPath");
@@ -60,6 +66,7 @@ namespace BatchRvtUtil
                             this.RevitFilePath,
                             this.EnableDataExport,
                             this.TaskScriptFilePath,
+                            this.AdditionalTaskScriptFilePaths,
                             this.TaskData,
                             this.SessionDataFolderPath,
                             this.DataExportFolderPath,
@@ -157,7 +164,17 @@ namespace BatchRvtUtil
             }
         }
 
+        // A session's script datas are saved as a manifest: a header line holding the settings that all of the script
+        // datas share (e.g. the task data), followed by one compact line per script data holding only the settings
+        // that differ (e.g. the Revit file path and progress number). Script data files in the older format (a JSON
+        // array of complete script datas) can still be loaded.
+
         public static IEnumerable<ScriptData> LoadManyFromFile(string filePath)
+        {
+            return LoadManyFromFile(filePath, 0);
+        }
+
+        public static IEnumerable<ScriptData> LoadManyFromFile(string filePath, int minimumProgressNumber)
         {
             List<ScriptData> scriptDatas = null;
 
@@ -165,25 +182,25 @@ namespace BatchRvtUtil
             {
                 try
                 {
-                    var text = File.ReadAllText(filePath);
-
-                    var jarray = JsonUtil.DeserializeArrayFromJson(text);
-
-                    scriptDatas = new List<ScriptData>();
-
-                    foreach (var jtoken in jarray)
+                    using (var streamReader = new StreamReader(filePath))
                     {
-                        var jobject = jtoken as JObject;
+                        var firstLine = streamReader.ReadLine() ?? string.Empty;
 
-                        if (jobject != null)
+                        if (firstLine.TrimStart().StartsWith("["))
                         {
-                            var scriptData = new ScriptData();
-
-                            scriptData.Load(jobject);
+                            var text = firstLine + Environment.NewLine + streamReader.ReadToEnd();
 
-                            scriptDatas.Add(scriptData);
+                            scriptDatas = LoadManyFromJArray(JsonUtil.DeserializeArrayFromJson(text));
+                        }
+                        else
+                        {
+                            scriptDatas = LoadManyFromManifest(JsonUtil.DeserializeFromJson(firstLine), streamReader, minimumProgressNumber);
                         }
                     }
+
+                    scriptDatas = scriptDatas
+                        .Where(scriptData => scriptData.ProgressNumber.GetValue() >= minimumProgressNumber)
+                        .ToList();
                 }
                 catch (Exception e)
                 {
@@ -194,75 +211,134 @@ namespace BatchRvtUtil
             return scriptDatas;
         }
 
-        public static bool SaveManyToFile(string filePath, IEnumerable<ScriptData> scriptDatas)
+        private static List<ScriptData> LoadManyFromJArray(JArray jarray)
         {
-            bool success = false;
+            var scriptDatas = new List<ScriptData>();
 
-            try
+            foreach (var jtoken in jarray)
             {
-                var jarray = new JArray();
+                var jobject = jtoken as JObject;
 
-                foreach (var scriptData in scriptDatas)
+                if (jobject != null)
                 {
-                    var jobject = new JObject();
+                    var scriptData = new ScriptData();
 
-                    scriptData.Store(jobject);
+                    scriptData.Load(jobject);
 
-                    jarray.Add(jobject);
+                    scriptDatas.Add(scriptData);
                 }
+            }
 
-                var settingsText = JsonUtil.SerializeToJson(jarray, true);
-                
-                var fileInfo = new FileInfo(filePath);
-                
-                fileInfo.Directory.Create();
+            return scriptDatas;
+        }
 
-                File.WriteAllText(fileInfo.FullName, settingsText);
+        private static List<ScriptData> LoadManyFromManifest(JObject header, StreamReader streamReader, int minimumProgressNumber)
+        {
+            var manifestVersion = (header[SESSION_MANIFEST_VERSION_PROPERTY] as JValue).ToObject<int>();
 
-                success = true;
-            }
-            catch (Exception e)
+            if (manifestVersion > SESSION_MANIFEST_VERSION)
             {
-                success = false;
+                throw new InvalidDataException("Unsupported session manifest version: " + manifestVersion);
             }
 
-            return success;
-        }
+            var sharedJObject = header[SESSION_MANIFEST_SHARED_PROPERTY] as JObject;
 
-        public static string GetUniqueScriptDataFilePath()
-        {
-            string uniqueId = Guid.NewGuid().ToString();
+            var progressNumberName = new ScriptData().ProgressNumber.GetName();
 
-            return Path.Combine(
-                    BatchRvt.GetDataFolderPath(),
-                    SCRIPT_DATA_FILENAME_PREFIX + uniqueId + JSON_FILE_EXTENSION
-                );
-        }
+            var sharedProgressNumber = sharedJObject[progressNumberName];
 
-        public static string GetProgressRecordFilePath(string scriptDataFilePath)
-        {
-            string uniqueId = (
-                    Path.GetFileNameWithoutExtension(scriptDataFilePath)
-                    .Substring(SCRIPT_DATA_FILENAME_PREFIX.Length)
-                );
+            // The shared settings are copied once into a working object. Each row's (small) per-file settings are
+            // added to it to load the row and then removed again, so the shared settings (e.g. a large task data) are
+            // not copied per row. (Rows only hold the settings that are not shared, see SaveManyToFile.)
+            var jobject = new JObject(sharedJObject);
 
-            return Path.Combine(
-                    Path.GetDirectoryName(scriptDataFilePath),
-                    SESSION_PROGRESS_RECORD_PREFIX + uniqueId + JSON_FILE_EXTENSION
-                );
+            var scriptDatas = new List<ScriptData>();
+
+            // The rows are read one line at a time. Rows before minimumProgressNumber are skipped without being loaded.
+            string line = null;
+
+            while ((line = streamReader.ReadLine()) != null)
+            {
+                if (string.IsNullOrWhiteSpace(line))
+                {
+                    continue;
+                }
+
+                var row = JsonUtil.DeserializeFromJson(line);
+
+                var progressNumber = row[progressNumberName] ?? sharedProgressNumber;
+
+                if (progressNumber != null && progressNumber.ToObject<int>() < minimumProgressNumber)
+                {
+                    continue;
+                }
+
+                foreach (var jproperty in row.Properties())
+                {
+                    jobject[jproperty.Name] = jproperty.Value;
+                }
+
+                var scriptData = new ScriptData();
+
+                scriptData.Load(jobject);
+
+                scriptDatas.Add(scriptData);
+
+                foreach (var jproperty in row.Properties())
+                {
+                    if (sharedJObject.Property(jproperty.Name) != null)
+                    {
+                        jobject[jproperty.Name] = sharedJObject[jproperty.Name];
+                    }
+                    else
+                    {
+                        jobject.Remove(jproperty.Name);
+                    }
+                }
+            }
+
+            return scriptDatas;
         }
 
-        public static bool SetProgressNumber(string progressRecordFilePath, int progressNumber)
+        public static bool SaveManyToFile(string filePath, IEnumerable<ScriptData> scriptDatas)
         {
             bool success = false;
 
             try
             {
-                var fileInfo = new FileInfo(progressRecordFilePath);
+                var jobjects = scriptDatas
+                    .Select(scriptData => {
+                            var jobject = new JObject();
+                            scriptData.Store(jobject);
+                            return jobject;
+                        })
+                    .ToList();
+
+                var sharedJObject = GetSharedProperties(jobjects);
+
+                var header = new JObject();
+
+                header[SESSION_MANIFEST_VERSION_PROPERTY] = SESSION_MANIFEST_VERSION;
+                header[SESSION_MANIFEST_SHARED_PROPERTY] = sharedJObject;
+
+                var fileInfo = new FileInfo(filePath);
 
                 fileInfo.Directory.Create();
 
-                File.WriteAllText(fileInfo.FullName, progressNumber.ToString());
+                using (var streamWriter = new StreamWriter(fileInfo.FullName))
+                {
+                    streamWriter.WriteLine(JsonUtil.SerializeToJson(header));
+
+                    foreach (var jobject in jobjects)
+                    {
+                        var row = new JObject(
+                                jobject.Properties()
+                                .Where(jproperty => sharedJObject.Property(jproperty.Name) == null)
+                            );
+
+                        streamWriter.WriteLine(JsonUtil.SerializeToJson(row));
+                    }
+                }
 
                 success = true;
             }
@@ -274,22 +350,47 @@ namespace BatchRvtUtil
             return success;
         }
 
-        public static int? GetProgressNumber(string progressRecordFilePath)
+        private static JObject GetSharedProperties(List<JObject> jobjects)
         {
-            int? progressNumber = null;
+            var sharedJObject = new JObject();
 
-            try
-            {
-                var fileInfo = new FileInfo(progressRecordFilePath);
+            var firstJObject = jobjects.FirstOrDefault();
 
-                progressNumber = int.Parse(File.ReadAllText(fileInfo.FullName).Trim());
-            }
-            catch (Exception e)
+            if (firstJObject != null)
             {
-                progressNumber = null;
+                foreach (var jproperty in firstJObject.Properties())
+                {
+                    if (jobjects.All(jobject => JToken.DeepEquals(jobject[jproperty.Name], jproperty.Value)))
+                    {
+                        sharedJObject[jproperty.Name] = jproperty.Value;
+                    }
+                }
             }
 
-            return progressNumber;
+            return sharedJObject;
+        }
+
+        public static string GetUniqueScriptDataFilePath()
+        {
+            string uniqueId = Guid.NewGuid().ToString();
+
+            return Path.Combine(
+                    BatchRvt.GetDataFolderPath(),
+                    SCRIPT_DATA_FILENAME_PREFIX + uniqueId + JSON_FILE_EXTENSION
+                );
+        }
+
+        public static string GetScriptOutputSpillFilePath(string scriptDataFilePath)
+        {
+            string uniqueId = (
+                    Path.GetFileNameWithoutExtension(scriptDataFilePath)
+                    .Substring(SCRIPT_DATA_FILENAME_PREFIX.Length)
+                );
+
+            return Path.Combine(
+                    Path.GetDirectoryName(scriptDataFilePath),
+                    SESSION_SCRIPT_OUTPUT_SPILL_PREFIX + uniqueId + TEXT_FILE_EXTENSION
+                );
         }
     }
 }
@@ -28,9 +28,19 @@ import global_test_mode
 import time_util
 import path_util
 import logging_util
+import metrics_util
+import record_tables
+import execution_plan
+import shard_util
 import snapshot_data_util
 import session_data_util
 import revit_file_list
+import revit_file_priority
+import session_scheduler
+import session_watchdog
+import ipc_protocol
+import resource_sampler
+import revit_process
 import batch_rvt_util
 import script_util
 from batch_rvt_util import CommandSettings, CommandLineUtil, BatchRvtSettings, BatchRvt, RevitVersion
@@ -45,20 +55,34 @@ class BatchRvtConfig:
     self.SettingsFilePath = None
     self.LogFolderPath = None
     self.LogFilePath = None
+    self.RecordsFolderPath = None
     self.SessionId = None
     self.SessionStartTime = None
     self.TaskData = None
     self.TestModeFolderPath = None
     self.SessionDataFolderPath = None
+    self.PlanOnly = False
+    self.PlanFilePath = None
+    self.WorkQueueFolderPath = None
+    self.ShardNumber = None
+    self.ShardsCount = None
+    self.ShardHistoryFilePath = None
 
     # General Task Script settings
     self.ScriptFilePath = None
+    self.AdditionalScriptFilePaths = []
     self.ShowMessageBoxOnTaskError = None
     self.ProcessingTimeOutInMinutes = 0
+    self.PhaseTimeOuts = dict(session_watchdog.DEFAULT_PHASE_TIMEOUTS_IN_MINUTES)
+    self.PhaseTimeOutScaling = session_watchdog.PHASE_TIMEOUT_SCALING_NONE
+    self.ScriptOutputOverflowPolicy = ipc_protocol.OUTPUT_OVERFLOW_POLICY_BLOCK
+    self.ResourceSampleIntervalInSeconds = resource_sampler.DEFAULT_SAMPLE_INTERVAL_IN_SECONDS
 
     # Revit File List settings
     self.RevitFileListFilePath = None
     self.RevitFileList = None
+    self.RevitFilePriorities = {}
+    self.RevitFilePriorityRules = []
 
     # Data Export settings
     self.EnableDataExport = None
@@ -76,6 +100,7 @@ class BatchRvtConfig:
     self.CentralFileOpenOption = None
     self.DeleteLocalAfter = None
     self.DiscardWorksetsOnDetach = None
+    self.CentralLockRetryLimit = 0
 
     # Revit Session settings
     self.RevitSessionOption = None
@@ -92,6 +117,18 @@ class BatchRvtConfig:
     self.BatchRevitTaskRevitVersion = None
     self.OpenInUI = False
 
+    # File Server Throttling settings
+    self.MaxConcurrentOpensPerFileServer = 0
+    self.MaxMegabytesPerSecondPerFileServer = 0
+    self.ThrottlePerFileServerShare = False
+
+    # Concurrent Revit Session settings
+    self.MaxConcurrentRevitSessions = 1
+    self.RevitVersionSessionLimits = {}
+
+    # Metrics settings
+    self.MetricsFilePath = None
+
     return
 
   def ReadRevitFileList(self, output):
@@ -113,7 +150,14 @@ class BatchRvtConfig:
           output()
           output("ERROR: Could not read from the Excel Revit File list. An Excel installation was not detected!")
         else:
-          revitFileList = revit_file_list.GetRevitFileList(self.RevitFileListFilePath)
+          revitFileListWithPriorities = revit_file_list.GetRevitFileListWithPriorities(self.RevitFileListFilePath)
+          if revitFileListWithPriorities is not None:
+            revitFileList = [revitFilePath for revitFilePath, priority in revitFileListWithPriorities]
+            self.RevitFilePriorities = dict(
+                (revitFilePath, priority)
+                for revitFilePath, priority in revitFileListWithPriorities
+                if priority is not None
+              )
           self.RevitFileList = revitFileList  
 
       if revitFileList is None:
@@ -151,11 +195,42 @@ def ConfigureBatchRvtSettings(batchRvtConfig, batchRvtSettings, output):
 
   # General Task Script settings
   batchRvtConfig.ScriptFilePath = batchRvtSettings.TaskScriptFilePath.GetValue()
+  batchRvtConfig.AdditionalScriptFilePaths = script_util.ParseTaskScriptFilePaths(
+      batchRvtSettings.AdditionalTaskScriptFilePaths.GetValue()
+    )
   batchRvtConfig.ShowMessageBoxOnTaskError = batchRvtSettings.ShowMessageBoxOnTaskScriptError.GetValue()
   batchRvtConfig.ProcessingTimeOutInMinutes = batchRvtSettings.ProcessingTimeOutInMinutes.GetValue()
+  try:
+    batchRvtConfig.PhaseTimeOuts = session_watchdog.ParsePhaseTimeOuts(batchRvtSettings.PhaseTimeOuts.GetValue())
+    batchRvtConfig.PhaseTimeOutScaling = session_watchdog.ParsePhaseTimeOutScaling(
+        batchRvtSettings.PhaseTimeOutScaling.GetValue()
+      )
+  except Exception, e:
+    output()
+    output("ERROR: Invalid phase time-out settings. " + e.message)
+    aborted = True
+  try:
+    batchRvtConfig.ScriptOutputOverflowPolicy = ipc_protocol.ParseOutputOverflowPolicy(
+        batchRvtSettings.ScriptOutputOverflowPolicy.GetValue()
+      )
+  except Exception, e:
+    output()
+    output("ERROR: Invalid script output overflow policy setting. " + e.message)
+    aborted = True
+  batchRvtConfig.ResourceSampleIntervalInSeconds = resource_sampler.GetSampleIntervalInSeconds(
+      batchRvtSettings.ResourceSampleIntervalInSeconds.GetValue()
+    )
 
   # Revit File List settings
   batchRvtConfig.RevitFileListFilePath = batchRvtSettings.RevitFileListFilePath.GetValue()
+  try:
+    batchRvtConfig.RevitFilePriorityRules = revit_file_priority.ParsePriorityRules(
+        batchRvtSettings.RevitFilePriorityRules.GetValue()
+      )
+  except Exception, e:
+    output()
+    output("ERROR: Invalid Revit file priority rules setting. " + e.message)
+    aborted = True
 
   # Data Export settings
   batchRvtConfig.EnableDataExport = batchRvtSettings.EnableDataExport.GetValue()
@@ -173,6 +248,7 @@ def ConfigureBatchRvtSettings(batchRvtConfig, batchRvtSettings, output):
   batchRvtConfig.CentralFileOpenOption = batchRvtSettings.CentralFileOpenOption.GetValue()
   batchRvtConfig.DeleteLocalAfter = batchRvtSettings.DeleteLocalAfter.GetValue()
   batchRvtConfig.DiscardWorksetsOnDetach = batchRvtSettings.DiscardWorksetsOnDetach.GetValue()
+  batchRvtConfig.CentralLockRetryLimit = batchRvtSettings.CentralLockRetryLimit.GetValue()
 
   # Revit Session settings
   batchRvtConfig.RevitSessionOption = batchRvtSettings.RevitSessionOption.GetValue()
@@ -189,6 +265,22 @@ def ConfigureBatchRvtSettings(batchRvtConfig, batchRvtSettings, output):
   batchRvtConfig.BatchRevitTaskRevitVersion = batchRvtSettings.BatchRevitTaskRevitVersion.GetValue()
   batchRvtConfig.OpenInUI = batchRvtSettings.OpenInUI.GetValue()
 
+  # File Server Throttling settings
+  batchRvtConfig.MaxConcurrentOpensPerFileServer = batchRvtSettings.MaxConcurrentOpensPerFileServer.GetValue()
+  batchRvtConfig.MaxMegabytesPerSecondPerFileServer = batchRvtSettings.MaxMegabytesPerSecondPerFileServer.GetValue()
+  batchRvtConfig.ThrottlePerFileServerShare = batchRvtSettings.ThrottlePerFileServerShare.GetValue()
+
+  # Concurrent Revit Session settings
+  batchRvtConfig.MaxConcurrentRevitSessions = max(batchRvtSettings.MaxConcurrentRevitSessions.GetValue(), 1)
+  try:
+    batchRvtConfig.RevitVersionSessionLimits = session_scheduler.ParseRevitVersionSessionLimits(
+        batchRvtSettings.RevitVersionSessionLimits.GetValue()
+      )
+  except Exception, e:
+    output()
+    output("ERROR: Invalid Revit version session limits setting. " + e.message)
+    aborted = True
+
   if not File.Exists(batchRvtConfig.ScriptFilePath):
     output()
     output("ERROR: No script file specified or script file not found.")
@@ -199,6 +291,21 @@ def ConfigureBatchRvtSettings(batchRvtConfig, batchRvtSettings, output):
     output()
     output("\t" + batchRvtConfig.ScriptFilePath)
 
+    if len(batchRvtConfig.AdditionalScriptFilePaths) > 0:
+      output()
+      output("Additional Task Scripts (run in order against the same opened document):")
+      output()
+      for additionalScriptFilePath in batchRvtConfig.AdditionalScriptFilePaths:
+        output("\t" + additionalScriptFilePath)
+        if not File.Exists(additionalScriptFilePath):
+          output()
+          output("ERROR: Additional task script file not found.")
+          aborted = True
+        elif path_util.HasFileExtension(additionalScriptFilePath, script_util.DYNAMO_SCRIPT_FILE_EXTENSION):
+          output()
+          output("ERROR: Dynamo scripts are not supported as additional task scripts.")
+          aborted = True
+
     isDynamoTaskScript = path_util.HasFileExtension(batchRvtConfig.ScriptFilePath, script_util.DYNAMO_SCRIPT_FILE_EXTENSION)
 
     if isDynamoTaskScript:
@@ -222,6 +329,27 @@ def ConfigureBatchRvtSettings(batchRvtConfig, batchRvtSettings, output):
           " " + ("minute" if batchRvtConfig.ProcessingTimeOutInMinutes == 1 else "minutes")
         )
 
+    if any(phaseTimeOut > 0 for phaseTimeOut in batchRvtConfig.PhaseTimeOuts.values()):
+      output()
+      output("Phase time-out settings (scaling: " + batchRvtConfig.PhaseTimeOutScaling + "):")
+      output()
+      for phase in session_watchdog.KNOWN_PHASES:
+        phaseTimeOut = batchRvtConfig.PhaseTimeOuts.get(phase, 0)
+        if phaseTimeOut > 0:
+          output("\t" + phase + " : " + str(phaseTimeOut) + " " + ("minute" if phaseTimeOut == 1 else "minutes"))
+
+    if batchRvtConfig.ScriptOutputOverflowPolicy != ipc_protocol.OUTPUT_OVERFLOW_POLICY_BLOCK:
+      output()
+      output("Script output overflow policy: " + batchRvtConfig.ScriptOutputOverflowPolicy)
+
+    output()
+    output(
+        "Revit process resource sampling: " + (
+          ("every " + str(batchRvtConfig.ResourceSampleIntervalInSeconds) + " second(s)")
+          if batchRvtConfig.ResourceSampleIntervalInSeconds is not None else "off"
+        )
+      )
+
     revitProcessingModeDescription = (
         "Batch Revit File processing" if batchRvtConfig.RevitProcessingOption == BatchRvt.RevitProcessingOption.BatchRevitFileProcessing
         else "Single Revit Task processing"
@@ -295,6 +423,34 @@ def ConfigureBatchRvtSettings(batchRvtConfig, batchRvtSettings, output):
         if (batchRvtConfig.DiscardWorksetsOnDetach):
           output()
           output("\t" + "Worksets will be discarded upon detach.")
+      if batchRvtConfig.CentralLockRetryLimit > 0:
+        output()
+        output("\t" + "Files deferred due to a locked central will be retried up to " + str(batchRvtConfig.CentralLockRetryLimit) + " time(s).")
+
+      if batchRvtConfig.MaxConcurrentOpensPerFileServer > 0 or batchRvtConfig.MaxMegabytesPerSecondPerFileServer > 0:
+        output()
+        output("File Server throttling (" + ("per share" if batchRvtConfig.ThrottlePerFileServerShare else "per server") + "):")
+        if batchRvtConfig.MaxConcurrentOpensPerFileServer > 0:
+          output()
+          output("\t" + "Maximum concurrent opens: " + str(batchRvtConfig.MaxConcurrentOpensPerFileServer))
+        if batchRvtConfig.MaxMegabytesPerSecondPerFileServer > 0:
+          output()
+          output("\t" + "Maximum rate: " + str(batchRvtConfig.MaxMegabytesPerSecondPerFileServer) + "MB/s")
+
+      if batchRvtConfig.MaxConcurrentRevitSessions > 1:
+        output()
+        output("Concurrent Revit sessions:")
+        output()
+        output("\t" + "Maximum concurrent sessions: " + str(batchRvtConfig.MaxConcurrentRevitSessions))
+        for revitVersionText, sessionLimit in sorted(batchRvtConfig.RevitVersionSessionLimits.items()):
+          output("\t" + "Revit " + revitVersionText + " sessions: " + str(sessionLimit))
+
+      if batchRvtConfig.RevitFilePriorityRules:
+        output()
+        output("Revit file priority rules:")
+        output()
+        for pattern, priority in batchRvtConfig.RevitFilePriorityRules:
+          output("\t" + pattern + " : " + str(priority))
 
   return aborted
 
@@ -343,9 +499,19 @@ def ConfigureBatchRvt(commandSettingsData, output):
   # NOTE: use of output function must occur after the log file initialization
   batchRvtConfig.LogFilePath = InitializeLogging(batchRvtConfig.LogFolderPath, batchRvtConfig.SessionStartTime)
 
+  batchRvtConfig.MetricsFilePath = metrics_util.GetMetricsFilePathForLogFilePath(batchRvtConfig.LogFilePath)
+  metrics_util.InitializeMetrics(batchRvtConfig.MetricsFilePath)
+
+  batchRvtConfig.RecordsFolderPath = record_tables.GetRecordsFolderPathForLogFilePath(batchRvtConfig.LogFilePath)
+  record_tables.InitializeRecordTables(batchRvtConfig.RecordsFolderPath)
+
   if commandSettingsData is not None:
     commandSettingsData.GeneratedLogFilePath = batchRvtConfig.LogFilePath
 
+  batchRvtConfig.PlanOnly = options[CommandSettings.PLAN_OPTION]
+  if batchRvtConfig.PlanOnly:
+    batchRvtConfig.PlanFilePath = execution_plan.GetPlanFilePathForLogFilePath(batchRvtConfig.LogFilePath)
+
   testModeFolderPath = None
   if commandSettingsData is not None:
     testModeFolderPath = commandSettingsData.TestModeFolderPath
@@ -381,7 +547,7 @@ def ConfigureBatchRvt(commandSettingsData, output):
     output()
     output("\t" + "Usage (using a settings file):")
     output()
-    output("\t\t" + "BatchRvt.exe --settings_file <SETTINGS FILE PATH> [--log_folder <LOG FOLDER PATH>]")
+    output("\t\t" + "BatchRvt.exe --settings_file <SETTINGS FILE PATH> [--log_folder <LOG FOLDER PATH>] [--plan]")
     output()
     output("\t" + "Example:")
     output()
@@ -390,13 +556,22 @@ def ConfigureBatchRvt(commandSettingsData, output):
     output()
     output("\t" + "Usage (without a settings file):")
     output()
-    output("\t\t" + "BatchRvt.exe --file_list <REVIT FILE LIST PATH> --task_script <TASK SCRIPT FILE PATH> [--revit_version <REVIT VERSION>] [--log_folder <LOG FOLDER PATH>]")
+    output("\t\t" + "BatchRvt.exe --file_list <REVIT FILE LIST PATH> --task_script <TASK SCRIPT FILE PATH> [--revit_version <REVIT VERSION>] [--log_folder <LOG FOLDER PATH>] [--plan]")
     output()
     output("\t" + "(NOTE: this mode operates in batch mode only; operates in detach mode for central files.)")
     output()
     output("\t" + "Example:")
     output()
     output("\t\t" + "BatchRvt.exe --task_script MyDynamoWorkspace.dyn --file_list RevitFileList.xlsx")
+    output()
+    output()
+    output("\t" + "(NOTE: the --plan option writes an execution plan (.plan.json) next to the log file without starting Revit.)")
+    output()
+    output("\t" + "(NOTE: the --work_queue <FOLDER PATH> option shares the Revit file list between machines via a queue in a shared folder.)")
+    output("\t" + "(      The first machine to start seeds the queue from its file list. Use a new empty folder for each batch.)")
+    output()
+    output("\t" + "(NOTE: the --shard <SHARD NUMBER>/<SHARDS COUNT> option processes only this machine's share of the Revit file list.)")
+    output("\t" + "(      Shards are balanced by file size, or by the durations in a copy of a processing history file given by --shard_history <FILE PATH>.)")
 
     aborted = True
 
@@ -425,6 +600,51 @@ def ConfigureBatchRvt(commandSettingsData, output):
       output("ERROR: Missing Revit file list option value!")
       aborted = True
 
+  if not aborted:
+    if CommandLineUtil.HasCommandLineOption(CommandSettings.WORK_QUEUE_FOLDER_PATH_OPTION):
+      workQueueFolderPathOption = options[CommandSettings.WORK_QUEUE_FOLDER_PATH_OPTION]
+      batchRvtConfig.WorkQueueFolderPath = path_util.GetFullPath(workQueueFolderPathOption)
+      output()
+      output("Using shared work queue:")
+      output()
+      output("\t" + batchRvtConfig.WorkQueueFolderPath)
+    elif CommandLineUtil.HasCommandLineOption(CommandSettings.WORK_QUEUE_FOLDER_PATH_OPTION, False):
+      output()
+      output("ERROR: Missing work queue folder option value!")
+      aborted = True
+
+  if not aborted:
+    if CommandLineUtil.HasCommandLineOption(CommandSettings.SHARD_OPTION):
+      shard = shard_util.ParseShardOption(options[CommandSettings.SHARD_OPTION])
+      if shard is None:
+        output()
+        output("ERROR: Invalid value for " + CommandLineUtil.OptionSwitchPrefix + CommandSettings.SHARD_OPTION + " option! Expected <SHARD NUMBER>/<SHARDS COUNT>, e.g. 2/6.")
+        aborted = True
+      elif batchRvtConfig.WorkQueueFolderPath is not None:
+        output()
+        output("ERROR: The " + CommandLineUtil.OptionSwitchPrefix + CommandSettings.SHARD_OPTION + " and " + CommandLineUtil.OptionSwitchPrefix + CommandSettings.WORK_QUEUE_FOLDER_PATH_OPTION + " options cannot be used together!")
+        aborted = True
+      else:
+        batchRvtConfig.ShardNumber, batchRvtConfig.ShardsCount = shard
+        output()
+        output("Processing shard " + str(batchRvtConfig.ShardNumber) + " of " + str(batchRvtConfig.ShardsCount) + " of the Revit file list.")
+    elif CommandLineUtil.HasCommandLineOption(CommandSettings.SHARD_OPTION, False):
+      output()
+      output("ERROR: Missing shard option value!")
+      aborted = True
+
+  if not aborted:
+    if CommandLineUtil.HasCommandLineOption(CommandSettings.SHARD_HISTORY_FILE_PATH_OPTION):
+      batchRvtConfig.ShardHistoryFilePath = options[CommandSettings.SHARD_HISTORY_FILE_PATH_OPTION]
+      if batchRvtConfig.ShardHistoryFilePath is None:
+        output()
+        output("ERROR: Shard history file not found.")
+        aborted = True
+    elif CommandLineUtil.HasCommandLineOption(CommandSettings.SHARD_HISTORY_FILE_PATH_OPTION, False):
+      output()
+      output("ERROR: Missing shard history file option value!")
+      aborted = True
+
   taskScriptFilePathOption = None
   if not aborted:
     if CommandLineUtil.HasCommandLineOption(CommandSettings.TASK_SCRIPT_FILE_PATH_OPTION):
@@ -438,7 +658,7 @@ def ConfigureBatchRvt(commandSettingsData, output):
       output("ERROR: Missing Task script file option value!")
       aborted = True
 
-  if (not RevitVersion.GetInstalledRevitVersions().Any()):
+  if len(revit_process.GetInstalledRevitVersions()) == 0:
     output()
     output("ERROR: Could not detect the BatchRvt addin for any version of Revit installed on this machine!")
     output()
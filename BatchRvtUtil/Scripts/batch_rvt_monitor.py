@@ -25,6 +25,12 @@ clr.ImportExtensions(System.Linq)
 
 from System.IO import Path
 
+import import_profiler
+import_profiler.InstallImportProfiler()
+
+import compiled_script_modules
+compiled_script_modules.LoadOrCompileScriptModules()
+
 import path_util
 import revit_file_list
 import batch_rvt_monitor_util
@@ -34,30 +40,51 @@ import session_data_exporter
 import exception_util
 import time_util
 import script_util
+import file_server_throttle
+import session_scheduler
+import processing_history
+import revit_file_metadata_cache
+import execution_plan
+import shared_work_queue
+import shard_util
+import revit_file_priority
+import session_watchdog
+import ipc_protocol
+import thread_util
+import revit_process
+import session_cache
+import record_tables
 from script_util import Output
 import batch_rvt_config
 import batch_rvt_util
 from batch_rvt_util import RevitVersion, ScriptDataUtil, BatchRvt
 
+# Maximum number of work queue items claimed for a single Revit session (when using the same session for files
+# of the same version). Kept small so that the remaining items stay available to other nodes.
+WORK_QUEUE_MAX_SESSION_FILES_COUNT = 5
+
 def HasSupportedRevitFilePath(supportedRevitFileInfo):
   fullFilePath = supportedRevitFileInfo.GetRevitFileInfo().GetFullPath()
   return True
 
 def HasSupportedRevitVersion(supportedRevitFileInfo):
-  return (
-      supportedRevitFileInfo.TryGetRevitVersionNumber() in RevitVersion.GetInstalledRevitVersions()
-    )
+  return HasSupportedFileRevitVersion(supportedRevitFileInfo.TryGetRevitVersionNumber())
+
+def HasSupportedFileRevitVersion(fileRevitVersion):
+  return fileRevitVersion in revit_process.GetInstalledRevitVersions()
 
 def GetRevitFileSize(supportedRevitFileInfo):
   return supportedRevitFileInfo.GetRevitFileInfo().GetFileSize()
 
 def HasAllowedRevitVersion(batchRvtConfig, supportedRevitFileInfo):
+  return HasAllowedFileRevitVersion(batchRvtConfig, supportedRevitFileInfo.TryGetRevitVersionNumber())
+
+def HasAllowedFileRevitVersion(batchRvtConfig, fileRevitVersion):
   hasAllowedRevitVersion = False
   if (batchRvtConfig.RevitFileProcessingOption == BatchRvt.RevitFileProcessingOption.UseSpecificRevitVersion):
-    revitVersion = supportedRevitFileInfo.TryGetRevitVersionNumber()
-    if revitVersion is None or revitVersion <= batchRvtConfig.BatchRevitTaskRevitVersion:
+    if fileRevitVersion is None or fileRevitVersion <= batchRvtConfig.BatchRevitTaskRevitVersion:
       hasAllowedRevitVersion = True
-  elif HasSupportedRevitVersion(supportedRevitFileInfo):
+  elif HasSupportedFileRevitVersion(fileRevitVersion):
     hasAllowedRevitVersion = True
   elif batchRvtConfig.IfNotAvailableUseMinimumAvailableRevitVersion:
     hasAllowedRevitVersion = True
@@ -66,14 +93,23 @@ def HasAllowedRevitVersion(batchRvtConfig, supportedRevitFileInfo):
 def RevitFileExists(supportedRevitFileInfo):
   return supportedRevitFileInfo.GetRevitFileInfo().Exists()
 
-def GetSupportedRevitFiles(batchRvtConfig):
+def GetSupportedRevitFiles(batchRvtConfig, skippedRevitFiles=None, revitFileShards=None):
   supportedRevitFileList = None
 
   revitFileList = batchRvtConfig.ReadRevitFileList(Output)
 
   if revitFileList is not None:
+    revit_file_metadata_cache.InitializeMetadataCache()
+
     supportedRevitFileList = list(
-        revit_file_list.SupportedRevitFileInfo(revitFilePath.Trim('"'))
+        revit_file_list.SupportedRevitFileInfo(
+            revitFilePath.Trim('"'),
+            revit_file_priority.GetRevitFilePriority(
+                revitFilePath.Trim('"'),
+                batchRvtConfig.RevitFilePriorities.get(revitFilePath),
+                batchRvtConfig.RevitFilePriorityRules
+              )
+          )
         for revitFilePath in revitFileList
       )
 
@@ -89,6 +125,24 @@ def GetSupportedRevitFiles(batchRvtConfig):
         if RevitFileExists(supportedRevitFileInfo)
       )
 
+    if batchRvtConfig.ShardsCount is not None:
+      # NOTE: sharding happens before the Revit version checks because those depend on the Revit versions
+      #       installed on each node, and every node must compute the same split.
+      shards = shard_util.PartitionRevitFiles(
+          supportedRevitFileList,
+          batchRvtConfig.ShardsCount,
+          shard_util.GetShardCostFunction(batchRvtConfig.ShardHistoryFilePath)
+        )
+      if revitFileShards is not None:
+        revitFileShards.extend(shards)
+      existingCount = len(supportedRevitFileList)
+      supportedRevitFileList = list(shards[batchRvtConfig.ShardNumber - 1].SupportedRevitFiles)
+      Output()
+      Output(
+          "Shard " + str(batchRvtConfig.ShardNumber) + " of " + str(batchRvtConfig.ShardsCount) + ": " +
+          str(len(supportedRevitFileList)) + " of " + str(existingCount) + " Revit files."
+        )
+
     unsupportedRevitFileList = list(
         supportedRevitFileInfo
         for supportedRevitFileInfo in supportedRevitFileList
@@ -107,14 +161,28 @@ def GetSupportedRevitFiles(batchRvtConfig):
         supportedRevitFileInfo
         for supportedRevitFileInfo in supportedRevitFileList
         if (
-            RevitFileExists(supportedRevitFileInfo)
-            and
             HasAllowedRevitVersion(batchRvtConfig, supportedRevitFileInfo)
             and
             HasSupportedRevitFilePath(supportedRevitFileInfo)
           )
       ).OrderBy(lambda supportedRevitFileInfo: GetRevitFileSize(supportedRevitFileInfo)).ToList()
 
+    revit_file_metadata_cache.SaveMetadataCache()
+
+    if skippedRevitFiles is not None:
+      skippedRevitFiles.extend(
+          (supportedRevitFileInfo, execution_plan.SKIPPED_REASON_NOT_FOUND)
+          for supportedRevitFileInfo in nonExistentRevitFileList
+        )
+      skippedRevitFiles.extend(
+          (supportedRevitFileInfo, execution_plan.SKIPPED_REASON_UNSUPPORTED_VERSION)
+          for supportedRevitFileInfo in unsupportedRevitFileList
+        )
+      skippedRevitFiles.extend(
+          (supportedRevitFileInfo, execution_plan.SKIPPED_REASON_UNSUPPORTED_FILE_PATH)
+          for supportedRevitFileInfo in unsupportedRevitFilePathRevitFileList
+        )
+
     nonExistentCount = len(nonExistentRevitFileList)
     unsupportedCount = len(unsupportedRevitFileList)
     unsupportedRevitFilePathCount = len(unsupportedRevitFilePathRevitFileList)
@@ -145,6 +213,7 @@ def InitializeScriptUtil(batchRvtConfig):
   script_util.SetExportFolderPath(batchRvtConfig)
   script_util.SetSessionDataFolderPath(batchRvtConfig)
   script_util.SetRevitFileListFilePath(batchRvtConfig)
+  script_util.SetRecordsFolderPath(batchRvtConfig)
   return
 
 def ExecutePreProcessingScript(batchRvtConfig, output):
@@ -167,6 +236,7 @@ def ExecutePostProcessingScript(batchRvtConfig, output):
   aborted = False
   try:
     InitializeScriptUtil(batchRvtConfig)
+    record_tables.FlushRecordTables(output)
     output()
     output("Post-processing script operation started.")
     script_util.ExecuteScript(batchRvtConfig.PostProcessingScriptFilePath)
@@ -188,7 +258,7 @@ def RunSingleRevitTask(batchRvtConfig):
   Output()
   Output("\t" + RevitVersion.GetRevitVersionText(revitVersion))
 
-  if revitVersion not in RevitVersion.GetInstalledRevitVersions():
+  if revitVersion not in revit_process.GetInstalledRevitVersions():
     Output()
     Output("ERROR: The specified Revit version is not installed or the addin is not installed for it.")
     aborted = True
@@ -207,6 +277,9 @@ def RunSingleRevitTask(batchRvtConfig):
     scriptData = ScriptDataUtil.ScriptData()
     scriptData.SessionId.SetValue(batchRvtConfig.SessionId)
     scriptData.TaskScriptFilePath.SetValue(batchRvtConfig.ScriptFilePath)
+    scriptData.AdditionalTaskScriptFilePaths.SetValue(
+        str.Join(script_util.TASK_SCRIPT_FILE_PATHS_SEPARATOR, batchRvtConfig.AdditionalScriptFilePaths)
+      )
     scriptData.TaskData.SetValue(batchRvtConfig.TaskData)
     scriptData.EnableDataExport.SetValue(batchRvtConfig.EnableDataExport)
     scriptData.SessionDataFolderPath.SetValue(batchRvtConfig.SessionDataFolderPath)
@@ -224,7 +297,11 @@ def RunSingleRevitTask(batchRvtConfig):
         [scriptData],
         1,
         batchRvtConfig.ProcessingTimeOutInMinutes,
+        session_watchdog.PhaseTimeOutPolicy(batchRvtConfig.PhaseTimeOuts, batchRvtConfig.PhaseTimeOutScaling),
+        batchRvtConfig.ScriptOutputOverflowPolicy,
+        batchRvtConfig.ResourceSampleIntervalInSeconds,
         batchRvtConfig.TestModeFolderPath,
+        None,
         Output
       )
 
@@ -235,11 +312,14 @@ def RunSingleRevitTask(batchRvtConfig):
   return aborted
 
 def GetRevitVersionForRevitFileSession(batchRvtConfig, supportedRevitFileInfo):
-  revitVersion = RevitVersion.GetMinimumInstalledRevitVersion()
+  return GetRevitVersionForFileRevitVersion(batchRvtConfig, supportedRevitFileInfo.TryGetRevitVersionNumber())
+
+def GetRevitVersionForFileRevitVersion(batchRvtConfig, fileRevitVersion):
+  revitVersion = revit_process.GetMinimumInstalledRevitVersion()
   if (batchRvtConfig.RevitFileProcessingOption == BatchRvt.RevitFileProcessingOption.UseSpecificRevitVersion):
     revitVersion = batchRvtConfig.BatchRevitTaskRevitVersion
-  elif HasSupportedRevitVersion(supportedRevitFileInfo):
-    revitVersion = supportedRevitFileInfo.TryGetRevitVersionNumber()
+  elif HasSupportedFileRevitVersion(fileRevitVersion):
+    revitVersion = fileRevitVersion
   return revitVersion
 
 def GroupByRevitVersion(batchRvtConfig, supportedRevitFileList):
@@ -253,131 +333,578 @@ def GroupByRevitVersion(batchRvtConfig, supportedRevitFileList):
       ).ToList()
     )
 
-def ProcessRevitFiles(batchRvtConfig, supportedRevitFileList):
+def ProcessRevitFiles(batchRvtConfig, supportedRevitFileList, revitFileResults):
   aborted = False
 
-  totalFilesCount = len(supportedRevitFileList)
-  progressNumber = 1
+  progressAllocator = session_scheduler.ProgressAllocator(len(supportedRevitFileList))
 
-  for revitVersion, supportedRevitFiles in GroupByRevitVersion(batchRvtConfig, supportedRevitFileList):
+  centralLockRetryCounts = {}
 
-    sessionRevitFiles = []
-    queuedRevitFiles = list(supportedRevitFiles)
+  fileServerThrottle = file_server_throttle.CreateFileServerThrottle(batchRvtConfig)
 
-    while queuedRevitFiles.Any():
-      scriptDatas = []
-      snapshotDataExportFolderPaths = []
+  processingHistory = processing_history.LoadProcessingHistory()
 
-      if batchRvtConfig.RevitSessionOption == BatchRvt.RevitSessionOption.UseSameSessionForFilesOfSameVersion:
-        sessionRevitFiles = queuedRevitFiles
-        queuedRevitFiles = []
-      else:
-        sessionRevitFiles = [queuedRevitFiles[0]]
-        queuedRevitFiles = queuedRevitFiles[1:]
+  useSameSession = (batchRvtConfig.RevitSessionOption == BatchRvt.RevitSessionOption.UseSameSessionForFilesOfSameVersion)
 
-      sessionFilesCount = len(sessionRevitFiles)
-      if len(sessionRevitFiles) == 1:
-        Output()
-        Output(
-            "Processing Revit file (" + str(progressNumber) + " of " + str(totalFilesCount) + ")" +
-            " in Revit " + RevitVersion.GetRevitVersionText(revitVersion) + " session."
-          )
-      else:
-        Output()
-        Output(
-            "Processing Revit files (" + str(progressNumber) + " to " + str(progressNumber+sessionFilesCount-1) +
-            " of " + str(totalFilesCount) + ")" +
-            " in Revit " + RevitVersion.GetRevitVersionText(revitVersion) + " session."
-          )
+  def createWorkerAction(revitVersionQueue):
+    def workerAction(output, sessionSlots):
+      while True:
+        sessionRevitFiles = revitVersionQueue.TakeSessionFiles(useSameSession)
+        if sessionRevitFiles is None:
+          break
+        requeuedRevitFiles = []
+        try:
+          requeuedRevitFiles = ProcessRevitFileSessionFiles(
+              batchRvtConfig,
+              revitVersionQueue.RevitVersion,
+              sessionRevitFiles,
+              progressAllocator,
+              centralLockRetryCounts,
+              fileServerThrottle,
+              processingHistory,
+              revitFileResults,
+              sessionSlots,
+              output
+            )
+        finally:
+          revitVersionQueue.CompleteSession(requeuedRevitFiles)
+      return
+    return workerAction
+
+  workers = []
+  revitVersionGroups = session_scheduler.OrderRevitVersionGroupsByPriority(
+      GroupByRevitVersion(batchRvtConfig, supportedRevitFileList)
+    )
+  for revitVersion, supportedRevitFiles in revitVersionGroups:
+    workersCount = session_scheduler.GetRevitVersionSessionLimit(
+        batchRvtConfig.RevitVersionSessionLimits,
+        revitVersion,
+        batchRvtConfig.MaxConcurrentRevitSessions
+      )
+    revitVersionQueue = session_scheduler.RevitVersionQueue(revitVersion, supportedRevitFiles, workersCount)
+    for workerIndex in range(workersCount):
+      workerName = "Revit " + RevitVersion.GetRevitVersionText(revitVersion)
+      if workersCount > 1:
+        workerName += " #" + str(workerIndex + 1)
+      workers.append((workerName, createWorkerAction(revitVersionQueue)))
 
-      for supportedRevitFileInfo in sessionRevitFiles:
-        batch_rvt_monitor_util.ShowSupportedRevitFileInfo(supportedRevitFileInfo, Output)
+  try:
+    aborted = session_scheduler.RunWorkers(workers, batchRvtConfig.MaxConcurrentRevitSessions, Output)
+  finally:
+    processingHistory.Save()
 
-      Output()
-      Output("Starting Revit " + RevitVersion.GetRevitVersionText(revitVersion) + " session...")
-
-      for index, supportedRevitFileInfo in enumerate(sessionRevitFiles):
-        snapshotDataExportFolderPath = str.Empty
-        revitFilePath = supportedRevitFileInfo.GetRevitFileInfo().GetFullPath()
-        
-        if batchRvtConfig.EnableDataExport:
-          snapshotDataExportFolderPath = snapshot_data_util.GetSnapshotFolderPath(
-              batchRvtConfig.DataExportFolderPath,
-              revitFilePath,
-              batchRvtConfig.SessionStartTime
-            )
-          path_util.CreateDirectory(snapshotDataExportFolderPath)
-          snapshotDataExportFolderPaths.append(snapshotDataExportFolderPath)
-
-        revitFilePath = supportedRevitFileInfo.GetRevitFileInfo().GetFullPath()
-        scriptData = ScriptDataUtil.ScriptData()
-        scriptData.SessionId.SetValue(batchRvtConfig.SessionId)
-        scriptData.TaskScriptFilePath.SetValue(batchRvtConfig.ScriptFilePath)
-        scriptData.RevitFilePath.SetValue(revitFilePath)
-        scriptData.TaskData.SetValue(batchRvtConfig.TaskData)
-        scriptData.OpenInUI.SetValue(batchRvtConfig.OpenInUI)
-        scriptData.EnableDataExport.SetValue(batchRvtConfig.EnableDataExport)
-        scriptData.SessionDataFolderPath.SetValue(batchRvtConfig.SessionDataFolderPath)
-        scriptData.DataExportFolderPath.SetValue(snapshotDataExportFolderPath)
-        scriptData.ShowMessageBoxOnTaskScriptError.SetValue(batchRvtConfig.ShowMessageBoxOnTaskError)
-        scriptData.RevitProcessingOption.SetValue(batchRvtConfig.RevitProcessingOption)
-        scriptData.CentralFileOpenOption.SetValue(batchRvtConfig.CentralFileOpenOption)
-        scriptData.DeleteLocalAfter.SetValue(batchRvtConfig.DeleteLocalAfter)
-        scriptData.DiscardWorksetsOnDetach.SetValue(batchRvtConfig.DiscardWorksetsOnDetach)
-        scriptData.ProgressNumber.SetValue(progressNumber+index)
-        scriptData.ProgressMax.SetValue(totalFilesCount)
-        scriptDatas.append(scriptData)
-
-      batchRvtScriptsFolderPath = BatchRvt.GetBatchRvtScriptsFolderPath()
-
-      while scriptDatas.Any():
-        nextProgressNumber = batch_rvt_monitor_util.RunScriptedRevitSession(
-            revitVersion,
-            batchRvtScriptsFolderPath,
-            batchRvtConfig.ScriptFilePath,
-            scriptDatas,
-            progressNumber,
-            batchRvtConfig.ProcessingTimeOutInMinutes,
-            batchRvtConfig.TestModeFolderPath,
-            Output
-          )
+  fileServerThrottle.ShowStats(Output)
+
+  return aborted
+
+def ProcessWorkQueue(batchRvtConfig, supportedRevitFileList, revitFileResults):
+  aborted = False
+
+  workQueue = shared_work_queue.SharedWorkQueue(batchRvtConfig.WorkQueueFolderPath)
+
+  workItemsData = [
+      shared_work_queue.CreateWorkItemData(
+          path_util.ExpandedFullNetworkPath(supportedRevitFileInfo.GetRevitFileInfo().GetFullPath()),
+          (
+            RevitVersion.GetRevitVersionText(supportedRevitFileInfo.TryGetRevitVersionNumber())
+            if supportedRevitFileInfo.TryGetRevitVersionNumber() is not None
+            else None
+          ),
+          supportedRevitFileInfo.GetPriority()
+        )
+      for supportedRevitFileInfo in supportedRevitFileList
+    ]
+
+  if workQueue.TrySeed(workItemsData):
+    Output()
+    Output("Seeded the work queue with " + str(len(workItemsData)) + " Revit file(s).")
+  elif workQueue.WaitUntilSeeded():
+    Output()
+    Output("Joined the existing work queue.")
+  else:
+    Output()
+    Output("ERROR: Timed-out waiting for another node to finish seeding the work queue.")
+    aborted = True
+
+  if aborted:
+    return aborted
+
+  progressAllocator = session_scheduler.ProgressAllocator(workQueue.GetItemsCount())
+
+  centralLockRetryCounts = {}
+
+  fileServerThrottle = file_server_throttle.CreateFileServerThrottle(batchRvtConfig)
+
+  processingHistory = processing_history.LoadProcessingHistory()
+
+  revitVersionSessionSlots = session_scheduler.RevitVersionSessionSlots(
+      batchRvtConfig.RevitVersionSessionLimits,
+      batchRvtConfig.MaxConcurrentRevitSessions
+    )
 
-        if nextProgressNumber is None:
-          Output()
-          Output("WARNING: The Revit session failed to initialize properly! No Revit files were processed in this session!")
-          progressNumber += len(scriptDatas)
+  useSameSession = (batchRvtConfig.RevitSessionOption == BatchRvt.RevitSessionOption.UseSameSessionForFilesOfSameVersion)
+  maxSessionFilesCount = WORK_QUEUE_MAX_SESSION_FILES_COUNT if useSameSession else 1
+
+  def isClaimableFileRevitVersionText(fileRevitVersionText):
+    return IsClaimableWorkItemFileRevitVersionText(batchRvtConfig, fileRevitVersionText)
+
+  def workerAction(output, sessionSlots):
+    while True:
+      workItems, revitVersion = ClaimWorkItems(
+          batchRvtConfig,
+          workQueue,
+          maxSessionFilesCount,
+          revitVersionSessionSlots,
+          output
+        )
+      if not workItems:
+        # Stop once only items this node cannot process remain (they are left for other nodes).
+        if not workQueue.HasPendingOrLeasedItems(isClaimableFileRevitVersionText):
           break
-        else:
-          progressNumber = nextProgressNumber
+        # Other nodes still hold leases that may expire and return to the queue.
+        thread_util.SleepForSeconds(shared_work_queue.QUEUE_POLL_INTERVAL_IN_SECONDS)
+        continue
+      ProcessWorkItems(
+          batchRvtConfig,
+          workQueue,
+          workItems,
+          revitVersion,
+          progressAllocator,
+          centralLockRetryCounts,
+          fileServerThrottle,
+          processingHistory,
+          revitFileResults,
+          revitVersionSessionSlots,
+          sessionSlots,
+          output
+        )
+    return
+
+  workers = [
+      ("Queue worker #" + str(workerIndex + 1), workerAction)
+      for workerIndex in range(batchRvtConfig.MaxConcurrentRevitSessions)
+    ]
+
+  workQueue.StartHeartbeat()
+  try:
+    aborted = session_scheduler.RunWorkers(workers, batchRvtConfig.MaxConcurrentRevitSessions, Output)
+  finally:
+    workQueue.StopHeartbeat()
+    processingHistory.Save()
+
+  fileServerThrottle.ShowStats(Output)
+
+  return aborted
 
-        scriptDatas = (
-            scriptDatas
-            .Where(lambda scriptData: scriptData.ProgressNumber.GetValue() >= progressNumber)
-            .ToList()
+def GetWorkItemFileRevitVersion(fileRevitVersionText):
+  return (
+      RevitVersion.GetSupportedRevitVersion(fileRevitVersionText)
+      if fileRevitVersionText is not None and RevitVersion.IsSupportedRevitVersionNumber(fileRevitVersionText)
+      else None
+    )
+
+def IsClaimableWorkItemFileRevitVersionText(batchRvtConfig, fileRevitVersionText):
+  # Items of unknown version are claimable; their version is checked again once the file is opened for reading.
+  return (
+      fileRevitVersionText is None or
+      HasAllowedFileRevitVersion(batchRvtConfig, GetWorkItemFileRevitVersion(fileRevitVersionText))
+    )
+
+def ClaimWorkItems(batchRvtConfig, workQueue, maxItemsCount, revitVersionSessionSlots, output):
+  # Reserves a Revit session slot before claiming so that claimed items are never left leased (and unavailable to
+  # other nodes) while this node waits for a slot. Only versions this node can process are claimed.
+  for fileRevitVersionText in workQueue.GetPendingFileRevitVersionTexts():
+    if not IsClaimableWorkItemFileRevitVersionText(batchRvtConfig, fileRevitVersionText):
+      continue
+    revitVersion = GetRevitVersionForFileRevitVersion(batchRvtConfig, GetWorkItemFileRevitVersion(fileRevitVersionText))
+    if not revitVersionSessionSlots.TryAcquire(revitVersion):
+      continue
+    workItems = workQueue.ClaimItems(
+        maxItemsCount,
+        output,
+        lambda itemFileRevitVersionText: itemFileRevitVersionText == fileRevitVersionText
+      )
+    if workItems:
+      return workItems, revitVersion
+    revitVersionSessionSlots.Release(revitVersion)
+  return [], None
+
+def ProcessWorkItems(
+    batchRvtConfig,
+    workQueue,
+    workItems,
+    revitVersion,
+    progressAllocator,
+    centralLockRetryCounts,
+    fileServerThrottle,
+    processingHistory,
+    revitFileResults,
+    revitVersionSessionSlots,
+    sessionSlots,
+    output
+  ):
+  # NOTE: the session slot for revitVersion has already been acquired by ClaimWorkItems() and is released here.
+  sessionWorkItems = []
+  sessionRevitFiles = []
+
+  for workItem in workItems:
+    supportedRevitFileInfo = revit_file_list.SupportedRevitFileInfo(workItem.GetRevitFilePath(), workItem.GetPriority())
+    if not RevitFileExists(supportedRevitFileInfo):
+      output()
+      output("WARNING: Work queue Revit file does not exist: " + workItem.GetRevitFilePath())
+      workQueue.SkipItem(workItem, execution_plan.SKIPPED_REASON_NOT_FOUND + " (" + workQueue.nodeName + ")", output)
+    elif not HasAllowedRevitVersion(batchRvtConfig, supportedRevitFileInfo):
+      output()
+      output("WARNING: Work queue Revit file is of a version that is not supported on this machine: " + workItem.GetRevitFilePath())
+      workQueue.SkipItem(workItem, execution_plan.SKIPPED_REASON_UNSUPPORTED_VERSION + " (" + workQueue.nodeName + ")", output)
+    else:
+      sessionWorkItems.append(workItem)
+      sessionRevitFiles.append(supportedRevitFileInfo)
+
+  if not sessionRevitFiles:
+    revitVersionSessionSlots.Release(revitVersion)
+    return
+
+  try:
+    requeuedRevitFiles = ProcessRevitFileSessionFiles(
+        batchRvtConfig,
+        revitVersion,
+        sessionRevitFiles,
+        progressAllocator,
+        centralLockRetryCounts,
+        fileServerThrottle,
+        processingHistory,
+        revitFileResults,
+        sessionSlots,
+        output
+      )
+  except Exception, e:
+    for workItem in sessionWorkItems:
+      workQueue.RequeueItem(workItem, output)
+    raise
+  finally:
+    revitVersionSessionSlots.Release(revitVersion)
+
+  # Only the files that completed go to the completed folder; files that crashed, timed out, were aborted, failed or
+  # were deferred beyond the central lock retry limit go to the failed folder, with their result as the reason.
+  for workItem, supportedRevitFileInfo in zip(sessionWorkItems, sessionRevitFiles):
+    status, reason = revitFileResults.GetFileResult(supportedRevitFileInfo.GetRevitFileInfo().GetFullPath())
+    if supportedRevitFileInfo in requeuedRevitFiles:
+      workQueue.RequeueItem(workItem, output, reason)
+    elif status == ipc_protocol.RESULT_STATUS_COMPLETED:
+      workQueue.CompleteItem(workItem, output)
+    else:
+      workQueue.FailItem(
+          workItem,
+          batch_rvt_monitor_util.GetFileResultText(status, reason) + " (" + workQueue.nodeName + ")",
+          output
+        )
+
+  return
+
+def ProcessRevitFileSessionFiles(
+    batchRvtConfig,
+    revitVersion,
+    sessionRevitFiles,
+    progressAllocator,
+    centralLockRetryCounts,
+    fileServerThrottle,
+    processingHistory,
+    revitFileResults,
+    sessionSlots,
+    output
+  ):
+  requeuedRevitFiles = []
+
+  sessionSlots.acquire()
+  try:
+    sessionFilesCount = len(sessionRevitFiles)
+    progressNumber = progressAllocator.Allocate(sessionFilesCount)
+    totalFilesCount = progressAllocator.GetTotal()
+
+    scriptDatas = []
+    snapshotDataExportFolderPaths = []
+
+    if len(sessionRevitFiles) == 1:
+      output()
+      output(
+          "Processing Revit file (" + str(progressNumber) + " of " + str(totalFilesCount) + ")" +
+          " in Revit " + RevitVersion.GetRevitVersionText(revitVersion) + " session."
+        )
+    else:
+      output()
+      output(
+          "Processing Revit files (" + str(progressNumber) + " to " + str(progressNumber+sessionFilesCount-1) +
+          " of " + str(totalFilesCount) + ")" +
+          " in Revit " + RevitVersion.GetRevitVersionText(revitVersion) + " session."
+        )
+
+    for supportedRevitFileInfo in sessionRevitFiles:
+      batch_rvt_monitor_util.ShowSupportedRevitFileInfo(supportedRevitFileInfo, output)
+
+    output()
+    output("Starting Revit " + RevitVersion.GetRevitVersionText(revitVersion) + " session...")
+
+    for index, supportedRevitFileInfo in enumerate(sessionRevitFiles):
+      snapshotDataExportFolderPath = str.Empty
+      revitFilePath = supportedRevitFileInfo.GetRevitFileInfo().GetFullPath()
+      
+      if batchRvtConfig.EnableDataExport:
+        snapshotDataExportFolderPath = snapshot_data_util.GetSnapshotFolderPath(
+            batchRvtConfig.DataExportFolderPath,
+            revitFilePath,
+            batchRvtConfig.SessionStartTime
           )
+        path_util.CreateDirectory(snapshotDataExportFolderPath)
+        snapshotDataExportFolderPaths.append(snapshotDataExportFolderPath)
+
+      revitFilePath = supportedRevitFileInfo.GetRevitFileInfo().GetFullPath()
+      scriptData = ScriptDataUtil.ScriptData()
+      scriptData.SessionId.SetValue(batchRvtConfig.SessionId)
+      scriptData.TaskScriptFilePath.SetValue(batchRvtConfig.ScriptFilePath)
+      scriptData.AdditionalTaskScriptFilePaths.SetValue(
+          str.Join(script_util.TASK_SCRIPT_FILE_PATHS_SEPARATOR, batchRvtConfig.AdditionalScriptFilePaths)
+        )
+      scriptData.RevitFilePath.SetValue(revitFilePath)
+      scriptData.TaskData.SetValue(batchRvtConfig.TaskData)
+      scriptData.OpenInUI.SetValue(batchRvtConfig.OpenInUI)
+      scriptData.EnableDataExport.SetValue(batchRvtConfig.EnableDataExport)
+      scriptData.SessionDataFolderPath.SetValue(batchRvtConfig.SessionDataFolderPath)
+      scriptData.DataExportFolderPath.SetValue(snapshotDataExportFolderPath)
+      scriptData.ShowMessageBoxOnTaskScriptError.SetValue(batchRvtConfig.ShowMessageBoxOnTaskError)
+      scriptData.RevitProcessingOption.SetValue(batchRvtConfig.RevitProcessingOption)
+      scriptData.CentralFileOpenOption.SetValue(batchRvtConfig.CentralFileOpenOption)
+      scriptData.DeleteLocalAfter.SetValue(batchRvtConfig.DeleteLocalAfter)
+      scriptData.DiscardWorksetsOnDetach.SetValue(batchRvtConfig.DiscardWorksetsOnDetach)
+      scriptData.ProgressNumber.SetValue(progressNumber+index)
+      scriptData.ProgressMax.SetValue(totalFilesCount)
+      scriptDatas.append(scriptData)
+
+    batchRvtScriptsFolderPath = BatchRvt.GetBatchRvtScriptsFolderPath()
+
+    sessionStartTimeUtc = time_util.GetDateTimeUtcNow()
+
+    # NOTE: file server throttling is applied to each file as the session opens it (see file_server_throttle.FileOpenGate).
+    fileResults = ProcessRevitFileSession(
+        batchRvtConfig,
+        revitVersion,
+        batchRvtScriptsFolderPath,
+        scriptDatas,
+        snapshotDataExportFolderPaths,
+        progressNumber,
+        session_watchdog.PhaseTimeOutPolicy(
+            batchRvtConfig.PhaseTimeOuts,
+            batchRvtConfig.PhaseTimeOutScaling,
+            processingHistory
+          ),
+        fileServerThrottle,
+        output
+      )
+  finally:
+    sessionSlots.release()
+
+  deferredProgressNumbers = [
+      fileProgressNumber
+      for fileProgressNumber, (status, reason) in fileResults.items()
+      if status == ipc_protocol.RESULT_STATUS_DEFERRED
+    ]
+
+  RecordSessionProcessingHistory(
+      processingHistory,
+      sessionRevitFiles,
+      progressNumber,
+      deferredProgressNumbers,
+      time_util.GetTotalSecondsElapsedSinceUtc(sessionStartTimeUtc)
+    )
+
+  for index, supportedRevitFileInfo in enumerate(sessionRevitFiles):
+    status, reason = fileResults[progressNumber + index]
+    revitFileResults.Record(supportedRevitFileInfo.GetRevitFileInfo().GetFullPath(), status, reason)
+
+  for deferredProgressNumber in deferredProgressNumbers:
+    supportedRevitFileInfo = sessionRevitFiles[deferredProgressNumber - progressNumber]
+    revitFilePath = supportedRevitFileInfo.GetRevitFileInfo().GetFullPath()
+    retryCount = centralLockRetryCounts.get(revitFilePath, 0)
+    if retryCount < batchRvtConfig.CentralLockRetryLimit:
+      centralLockRetryCounts[revitFilePath] = retryCount + 1
+      requeuedRevitFiles.append(supportedRevitFileInfo)
+      progressAllocator.AddToTotal(1)
+      output()
+      output(
+          "Deferred Revit file has been requeued (retry " + str(retryCount + 1) +
+          " of " + str(batchRvtConfig.CentralLockRetryLimit) + "): " + revitFilePath
+        )
+    else:
+      output()
+      output("WARNING: Deferred Revit file will not be retried (retry limit reached): " + revitFilePath)
+
+  return requeuedRevitFiles
+
+def RecordSessionProcessingHistory(
+    processingHistory,
+    sessionRevitFiles,
+    progressNumber,
+    deferredProgressNumbers,
+    sessionSeconds
+  ):
+  # NOTE: per-file times are not measured, so the session's time (including Revit start-up) is shared
+  #       evenly between the files that were processed (i.e. not deferred) in the session.
+  processedRevitFiles = [
+      supportedRevitFileInfo
+      for index, supportedRevitFileInfo in enumerate(sessionRevitFiles)
+      if (progressNumber + index) not in deferredProgressNumbers
+    ]
+  for supportedRevitFileInfo in processedRevitFiles:
+    revitFileInfo = supportedRevitFileInfo.GetRevitFileInfo()
+    processingHistory.RecordFileDuration(
+        revitFileInfo.GetFullPath(),
+        revitFileInfo.GetFileSize(),
+        sessionSeconds / len(processedRevitFiles)
+      )
+  return
+
+def ProcessRevitFileSession(
+    batchRvtConfig,
+    revitVersion,
+    batchRvtScriptsFolderPath,
+    scriptDatas,
+    snapshotDataExportFolderPaths,
+    progressNumber,
+    phaseTimeOutPolicy,
+    fileServerThrottle,
+    output
+  ):
+  sessionFileResults = {}
+  sessionProgressNumbers = [scriptData.ProgressNumber.GetValue() for scriptData in scriptDatas]
+
+  while scriptDatas.Any():
+    nextProgressNumber, fileResults = batch_rvt_monitor_util.RunScriptedRevitSession(
+        revitVersion,
+        batchRvtScriptsFolderPath,
+        batchRvtConfig.ScriptFilePath,
+        scriptDatas,
+        progressNumber,
+        batchRvtConfig.ProcessingTimeOutInMinutes,
+        phaseTimeOutPolicy,
+        batchRvtConfig.ScriptOutputOverflowPolicy,
+        batchRvtConfig.ResourceSampleIntervalInSeconds,
+        batchRvtConfig.TestModeFolderPath,
+        fileServerThrottle,
+        output
+      )
+
+    sessionFileResults.update(fileResults)
+
+    if nextProgressNumber is None:
+      output()
+      output("WARNING: The Revit session failed to initialize properly! No Revit files were processed in this session!")
+      progressNumber += len(scriptDatas)
+      break
+    else:
+      progressNumber = nextProgressNumber
+
+    scriptDatas = (
+        scriptDatas
+        .Where(lambda scriptData: scriptData.ProgressNumber.GetValue() >= progressNumber)
+        .ToList()
+      )
+
+    if batchRvtConfig.EnableDataExport:
+      output()
+      output("Consolidating snapshots data.")
+      for snapshotDataExportFolderPath in snapshotDataExportFolderPaths:
+        snapshot_data_util.ConsolidateSnapshotData(snapshotDataExportFolderPath, output)
+        # NOTE: Have disabled copying of journal files for now because if many files were processed
+        #       in the same Revit session, too many copies of a potentially large journal file
+        #       will be made. Consider modifying the logic so that the journal file is copied only
+        #       once per Revit seesion. Perhaps copy it to the BatchRvt session folder.
+        if False:
+          try:
+            snapshot_data_util.CopySnapshotRevitJournalFile(snapshotDataExportFolderPath, output)
+          except Exception, e:
+            output()
+            output("WARNING: failed to copy the Revit session's journal file to snapshot data folder:")
+            output()
+            output("\t" + snapshotDataExportFolderPath)
+            exception_util.LogOutputErrorDetails(e, output)
+
+  # The files still without a result are those that were being processed when Revit crashed or was terminated (the
+  # files after them are run again in a new Revit session), or all of them if a Revit session failed to start.
+  for sessionProgressNumber in sessionProgressNumbers:
+    if sessionProgressNumber not in sessionFileResults:
+      sessionFileResults[sessionProgressNumber] = (
+          batch_rvt_monitor_util.RESULT_STATUS_NO_RESULT,
+          batch_rvt_monitor_util.NO_RESULT_REASON
+        )
+
+  batch_rvt_monitor_util.ShowFileResultCounts(
+      "Revit session file results",
+      [status for status, reason in sessionFileResults.values()],
+      output
+    )
+
+  return sessionFileResults
+
+def PlanBatchRevitTasks(batchRvtConfig):
+  aborted = False
+
+  skippedRevitFiles = []
+  revitFileShards = []
+  supportedRevitFileList = GetSupportedRevitFiles(batchRvtConfig, skippedRevitFiles, revitFileShards)
+  if supportedRevitFileList is None:
+    aborted = True
+
+  if not aborted:
+    if len(supportedRevitFileList) == 0:
+      Output()
+      Output("ERROR: All specified Revit Files are of an unsupported version or have an unsupported file path.")
+      aborted = True
+
+    processingHistory = processing_history.LoadProcessingHistory()
+
+    executionPlan = execution_plan.BuildExecutionPlan(
+        batchRvtConfig,
+        GroupByRevitVersion(batchRvtConfig, supportedRevitFileList),
+        skippedRevitFiles,
+        processingHistory
+      )
+
+    if batchRvtConfig.ShardsCount is not None:
+      execution_plan.AddShardsToExecutionPlan(
+          executionPlan,
+          batchRvtConfig,
+          [
+            (
+              revitFileShard,
+              execution_plan.BuildExecutionPlan(
+                  batchRvtConfig,
+                  GroupByRevitVersion(batchRvtConfig, revitFileShard.SupportedRevitFiles.ToList()),
+                  [],
+                  processingHistory
+                )
+            )
+            for revitFileShard in revitFileShards
+          ]
+        )
+    ExportAndShowExecutionPlan(batchRvtConfig, executionPlan)
 
-        if batchRvtConfig.EnableDataExport:
-          Output()
-          Output("Consolidating snapshots data.")
-          for snapshotDataExportFolderPath in snapshotDataExportFolderPaths:
-            snapshot_data_util.ConsolidateSnapshotData(snapshotDataExportFolderPath, Output)
-            # NOTE: Have disabled copying of journal files for now because if many files were processed
-            #       in the same Revit session, too many copies of a potentially large journal file
-            #       will be made. Consider modifying the logic so that the journal file is copied only
-            #       once per Revit seesion. Perhaps copy it to the BatchRvt session folder.
-            if False:
-              try:
-                snapshot_data_util.CopySnapshotRevitJournalFile(snapshotDataExportFolderPath, Output)
-              except Exception, e:
-                Output()
-                Output("WARNING: failed to copy the Revit session's journal file to snapshot data folder:")
-                Output()
-                Output("\t" + snapshotDataExportFolderPath)
-                exception_util.LogOutputErrorDetails(e, Output)
-        
   return aborted
 
-def RunBatchRevitTasks(batchRvtConfig):
+def PlanSingleRevitTask(batchRvtConfig):
+  ExportAndShowExecutionPlan(batchRvtConfig, execution_plan.BuildSingleTaskExecutionPlan(batchRvtConfig))
+  return False
+
+def ExportAndShowExecutionPlan(batchRvtConfig, executionPlan):
+  execution_plan.ExportExecutionPlan(batchRvtConfig.PlanFilePath, executionPlan)
+  if "groups" in executionPlan:
+    execution_plan.ShowExecutionPlanSummary(executionPlan, Output)
+  Output()
+  Output("Execution plan file:")
+  Output()
+  Output("\t" + batchRvtConfig.PlanFilePath)
+  return
+
+def RunBatchRevitTasks(batchRvtConfig, revitFileResults):
   aborted = False
 
   if not aborted:
@@ -415,7 +942,11 @@ def RunBatchRevitTasks(batchRvtConfig):
   if not aborted:
     Output()
     Output("Starting batch operation...")
-    aborted = ProcessRevitFiles(batchRvtConfig, supportedRevitFileList)
+    if batchRvtConfig.WorkQueueFolderPath is not None:
+      aborted = ProcessWorkQueue(batchRvtConfig, supportedRevitFileList, revitFileResults)
+    else:
+      aborted = ProcessRevitFiles(batchRvtConfig, supportedRevitFileList, revitFileResults)
+    revitFileResults.ShowSummary(Output)
 
   if not aborted:
     if batchRvtConfig.ExecutePostProcessingScript:
@@ -434,12 +965,22 @@ def TryGetCommandSettingsData():
 def Main():
   aborted = False
 
+  # A run in which any Revit file did not complete successfully is reported as failed (see RevitFileResults).
+  revitFileResults = batch_rvt_monitor_util.RevitFileResults()
+
   commandSettingsData = TryGetCommandSettingsData()
 
   batchRvtConfig = batch_rvt_config.ConfigureBatchRvt(commandSettingsData, Output)
 
   if batchRvtConfig is None:
     aborted = True
+  elif batchRvtConfig.PlanOnly:
+    Output()
+    Output("Planning only. Revit will not be started.")
+    if batchRvtConfig.RevitProcessingOption == BatchRvt.RevitProcessingOption.BatchRevitFileProcessing:
+      aborted = PlanBatchRevitTasks(batchRvtConfig)
+    else:
+      aborted = PlanSingleRevitTask(batchRvtConfig)
   else:
     if batchRvtConfig.EnableDataExport:
       path_util.CreateDirectory(batchRvtConfig.SessionDataFolderPath)
@@ -455,7 +996,7 @@ def Main():
     sessionError = None
     try:
       if batchRvtConfig.RevitProcessingOption == BatchRvt.RevitProcessingOption.BatchRevitFileProcessing:
-        aborted = RunBatchRevitTasks(batchRvtConfig)
+        aborted = RunBatchRevitTasks(batchRvtConfig, revitFileResults)
       else:
         aborted = RunSingleRevitTask(batchRvtConfig)
     except Exception, e:
@@ -465,6 +1006,9 @@ def Main():
       if batchRvtConfig.EnableDataExport:
         sessionEndTime = time_util.GetDateTimeNow()
 
+        if sessionError is None and revitFileResults.HasUnsuccessfulFiles():
+          sessionError = revitFileResults.GetSummaryText()
+
         session_data_exporter.ExportSessionData(
             batchRvtConfig.SessionId,
             batchRvtConfig.SessionStartTime,
@@ -472,10 +1016,25 @@ def Main():
             batchRvtConfig.SessionDataFolderPath,
             sessionError
           )
+
+      record_tables.FlushRecordTables(Output)
+      recordTableNames = record_tables.GetRecordTableNames(batchRvtConfig.RecordsFolderPath)
+      if len(recordTableNames) > 0:
+        Output()
+        Output("Record tables (" + str.Join(", ", recordTableNames) + ") were written to:")
+        Output()
+        Output("\t" + batchRvtConfig.RecordsFolderPath)
+
+      # The task script's disk-backed session caches only live for the duration of the run.
+      session_cache.DeleteSessionCacheFolder(batchRvtConfig.SessionId)
+
+  import_profiler.ShowImportProfile(Output)
   
   Output()
   if aborted:
     Output("Operation aborted.")
+  elif revitFileResults.HasUnsuccessfulFiles():
+    Output("Operation failed: " + revitFileResults.GetSummaryText())
   else:
     Output("Operation completed.")
   Output()
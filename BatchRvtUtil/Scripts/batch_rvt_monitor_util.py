@@ -25,11 +25,20 @@ clr.ImportExtensions(System.Linq)
 
 from System.IO import File
 
+import threading
+
 import global_test_mode
 import server_util
 import stream_io_util
 import revit_process_host
+import monitor_process
 import monitor_revit_process
+import ipc_protocol
+import session_watchdog
+import file_server_throttle
+import resource_sampler
+import metrics_util
+import record_tables
 import snapshot_data_util
 import revit_dialog_detection
 import exception_util
@@ -39,8 +48,30 @@ from batch_rvt_util import ScriptDataUtil
 
 SECONDS_PER_MINUTE = 60
 REVIT_PROCESS_EXIT_TIMEOUT_IN_SECONDS = 10 * SECONDS_PER_MINUTE
-REVIT_PROGRESS_CHECK_INTERVAL_IN_SECONDS = 5
+REVIT_PROCESSING_TIMEOUT_CHECK_INTERVAL_IN_SECONDS = 5
 REVIT_PROCESS_BEGIN_PROCESSING_TIMEOUT_IN_SECONDS = 10 * SECONDS_PER_MINUTE
+SNAPSHOT_DATA_FILES_RECHECK_INTERVAL_IN_SECONDS = 30
+REVIT_DIALOG_CHECK_INTERVAL_IN_SECONDS = 1
+# Scanning for dialog boxes enumerates the Revit process's windows, so it is only done once the script host has been
+# quiet for a while (a dialog box blocks Revit's main thread, so no output, progress or phases arrive; heartbeats come
+# from a background thread and do not count). While the scans find nothing, the interval between them is doubled up
+# to REVIT_DIALOG_CHECK_MAX_INTERVAL_IN_SECONDS.
+REVIT_DIALOG_CHECK_QUIET_PERIOD_IN_SECONDS = 2
+REVIT_DIALOG_CHECK_MAX_INTERVAL_IN_SECONDS = 16
+
+# The status recorded for a file that the script host did not report a result for (e.g. Revit crashed or was
+# terminated while the file was being processed, or the session failed to start).
+RESULT_STATUS_NO_RESULT = "no result"
+NO_RESULT_REASON = "the Revit session ended without reporting a result for the file."
+
+FILE_RESULT_STATUSES = [
+    ipc_protocol.RESULT_STATUS_COMPLETED,
+    ipc_protocol.RESULT_STATUS_PARTIAL,
+    ipc_protocol.RESULT_STATUS_FAILED,
+    ipc_protocol.RESULT_STATUS_DEFERRED,
+    ipc_protocol.RESULT_STATUS_ABORTED,
+    RESULT_STATUS_NO_RESULT
+  ]
 
 
 def ShowSupportedRevitFileInfo(supportedRevitFileInfo, output):
@@ -67,30 +98,144 @@ def UsingClientHandle(serverStream, action):
     serverStream.DisposeLocalCopyOfClientHandle()
   return result
 
-def ShowRevitScriptOutput(scriptOutputStream, output, pendingReadLineTask=None):
-  outputLines, pendingReadLineTask = stream_io_util.ReadAvailableLines(scriptOutputStream, pendingReadLineTask)
-  if outputLines.Any():
-    for line in outputLines:
-      output("\t" + "- " + line)
-  return pendingReadLineTask
-
-def ShowRevitProcessOutput(processOutputStream, output, pendingReadLineTask=None):
-  outputLines, pendingReadLineTask = stream_io_util.ReadAvailableLines(processOutputStream, pendingReadLineTask)
-  if outputLines.Any():
-    for line in outputLines:
-      if False: # Change to True to see Revit standard output (non-script output)
-        output("\t" + "- [ REVIT MESSAGE ] : " + line)
-  return pendingReadLineTask
-
-def ShowRevitProcessError(processErrorStream, output, pendingReadLineTask=None):
-  outputLines, pendingReadLineTask = stream_io_util.ReadAvailableLines(processErrorStream, pendingReadLineTask)
-  if outputLines.Any():
-    for line in outputLines:
-      if line.StartsWith("log4cplus:"): # ignore pesky log4cplus messages (an Autodesk thing?)
-        pass
-      else:
-        output("\t" + "- [ REVIT ERROR MESSAGE ] : " + line)
-  return pendingReadLineTask
+def ShowRevitScriptOutputLine(line, output):
+  output("\t" + "- " + line)
+  return
+
+def ShowRevitProcessOutputLines(lines, output):
+  if False: # Change to True to see Revit standard output (non-script output)
+    for line in lines:
+      output("\t" + "- [ REVIT MESSAGE ] : " + line)
+  return
+
+def ShowRevitProcessErrorLines(lines, output):
+  for line in lines:
+    if line.StartsWith("log4cplus:"): # ignore pesky log4cplus messages (an Autodesk thing?)
+      pass
+    else:
+      output("\t" + "- [ REVIT ERROR MESSAGE ] : " + line)
+  return
+
+class SnapshotDataFilesTracker:
+  # Tracks the snapshot data files that are still to be written in a session. The script host reports each one as it
+  # is exported; RecheckOutstanding() is a slow safety net that looks only at the files not yet seen.
+  def __init__(self, scriptDatas):
+    self.outstandingSnapshotDataFilePaths = dict(
+        (
+          scriptData.ProgressNumber.GetValue(),
+          snapshot_data_util.GetSnapshotDataFilePath(scriptData.DataExportFolderPath.GetValue())
+        )
+        for scriptData in scriptDatas
+      )
+    return
+
+  def OnSnapshotDataExported(self, progressNumber):
+    self.outstandingSnapshotDataFilePaths.pop(progressNumber, None)
+    return
+
+  def RecheckOutstanding(self):
+    for progressNumber, snapshotDataFilePath in self.outstandingSnapshotDataFilePaths.items():
+      if File.Exists(snapshotDataFilePath):
+        del self.outstandingSnapshotDataFilePaths[progressNumber]
+    return
+
+  def AllExported(self):
+    return len(self.outstandingSnapshotDataFilePaths) == 0
+
+def GetFileResultCountsText(fileResultStatuses):
+  counts = {}
+  for status in fileResultStatuses:
+    counts[status] = counts.get(status, 0) + 1
+  orderedStatuses = [status for status in FILE_RESULT_STATUSES if status in counts]
+  orderedStatuses += sorted(status for status in counts if status not in FILE_RESULT_STATUSES)
+  return str.Join(", ", [str(counts[status]) + " " + status for status in orderedStatuses])
+
+def GetFileResultText(status, reason):
+  return status + (": " + reason if not str.IsNullOrWhiteSpace(reason) else str.Empty)
+
+def ShowFileResultCounts(heading, fileResultStatuses, output):
+  if len(fileResultStatuses) > 0:
+    output()
+    output(heading + " (" + str(len(fileResultStatuses)) + "): " + GetFileResultCountsText(fileResultStatuses))
+  return
+
+class RevitFileResults:
+  # The final result of each Revit file in the run, shared by the session workers. A deferred file that is requeued is
+  # recorded again when it is retried.
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.fileResults = {} # The (status, reason) of each file, by Revit file path.
+    return
+
+  def Record(self, revitFilePath, status, reason):
+    with self.lock:
+      self.fileResults[revitFilePath] = (status, reason)
+    return
+
+  def GetFileResult(self, revitFilePath):
+    with self.lock:
+      return self.fileResults.get(revitFilePath, (RESULT_STATUS_NO_RESULT, NO_RESULT_REASON))
+
+  def GetFileResultStatuses(self):
+    with self.lock:
+      return [status for status, reason in self.fileResults.values()]
+
+  def GetUnsuccessfulFileResults(self):
+    with self.lock:
+      return sorted(
+          (revitFilePath, status, reason)
+          for revitFilePath, (status, reason) in self.fileResults.items()
+          if status != ipc_protocol.RESULT_STATUS_COMPLETED
+        )
+
+  def HasUnsuccessfulFiles(self):
+    return len(self.GetUnsuccessfulFileResults()) > 0
+
+  def GetSummaryText(self):
+    fileResultStatuses = self.GetFileResultStatuses()
+    return (
+        str(fileResultStatuses.count(ipc_protocol.RESULT_STATUS_COMPLETED)) + " of " +
+        str(len(fileResultStatuses)) + " Revit file(s) completed successfully (" +
+        GetFileResultCountsText(fileResultStatuses) + ")."
+      )
+
+  def ShowSummary(self, output):
+    ShowFileResultCounts("Revit file results", self.GetFileResultStatuses(), output)
+    unsuccessfulFileResults = self.GetUnsuccessfulFileResults()
+    if len(unsuccessfulFileResults) > 0:
+      output()
+      output("WARNING: the following Revit file(s) did not complete successfully:")
+      for revitFilePath, status, reason in unsuccessfulFileResults:
+        output()
+        output("\t" + revitFilePath)
+        output("\t\t" + GetFileResultText(status, reason))
+    return
+
+def RecordResourceUsage(resourceSampler, scriptDatas, output):
+  # Writes the per-file resource usage to the metrics stream and (if data export is enabled) the snapshot data.
+  scriptDatasByProgressNumber = dict(
+      (scriptData.ProgressNumber.GetValue(), scriptData)
+      for scriptData in scriptDatas
+    )
+  for progressNumber, fileUsage in resourceSampler.GetFileUsages():
+    scriptData = scriptDatasByProgressNumber.get(progressNumber)
+    if scriptData is None:
+      continue
+    resourceUsageData = fileUsage.ToData()
+    metricData = dict(resourceUsageData)
+    metricData["progressNumber"] = progressNumber
+    metricData["revitFilePath"] = scriptData.RevitFilePath.GetValue()
+    metrics_util.EmitMetric(resource_sampler.FILE_RESOURCE_USAGE_METRIC, metricData)
+    if scriptData.EnableDataExport.GetValue():
+      snapshot_data_util.AddSnapshotDataResourceUsage(
+          scriptData.DataExportFolderPath.GetValue(),
+          resourceUsageData,
+          output
+        )
+  sessionUsage = resourceSampler.GetSessionUsage()
+  if sessionUsage is not None:
+    metrics_util.EmitMetric(resource_sampler.SESSION_RESOURCE_USAGE_METRIC, sessionUsage.ToData())
+  return
 
 def TerminateHostRevitProcess(hostRevitProcess, output):
   try:
@@ -108,23 +253,36 @@ def RunScriptedRevitSession(
     scriptDatas,
     progressNumber,
     processingTimeOutInMinutes,
+    phaseTimeOutPolicy,
+    scriptOutputOverflowPolicy,
+    resourceSampleIntervalInSeconds,
     testModeFolderPath,
+    fileServerThrottle,
     output
   ):
   scriptDataFilePath = ScriptDataUtil.GetUniqueScriptDataFilePath()
   ScriptDataUtil.SaveManyToFile(scriptDataFilePath, scriptDatas)
-  progressRecordFilePath = ScriptDataUtil.GetProgressRecordFilePath(scriptDataFilePath)
 
+  # Messages from the script host (output, progress, phases, file results) arrive on the script output pipe.
+  # Commands to the script host are sent on the script control pipe.
   serverStream = server_util.CreateAnonymousPipeServer(
       server_util.IN,
       server_util.HandleInheritability.Inheritable
     )
-  
+
+  controlServerStream = server_util.CreateAnonymousPipeServer(
+      server_util.OUT,
+      server_util.HandleInheritability.Inheritable
+    )
+
+  lastProgressNumber = [None] # Needs to be a list so it can be captured by reference in closures.
+  fileResults = {} # The (status, reason) reported for each file, by progress number.
+
   def serverStreamAction():
-    scriptOutputStreamReader = stream_io_util.GetStreamReader(serverStream)
-    
-    def streamReaderAction():
+
+    def controlServerStreamAction():
       scriptOutputPipeHandleString = serverStream.GetClientHandleAsString()
+      scriptControlPipeHandleString = controlServerStream.GetClientHandleAsString()
 
       def clientHandleAction():
         hostRevitProcess = revit_process_host.StartHostRevitProcess(
@@ -134,47 +292,91 @@ def RunScriptedRevitSession(
             scriptDataFilePath,
             progressNumber,
             scriptOutputPipeHandleString,
+            scriptControlPipeHandleString,
+            scriptOutputOverflowPolicy,
             testModeFolderPath
           )
         return hostRevitProcess
 
-      hostRevitProcess = UsingClientHandle(serverStream, clientHandleAction)
+      hostRevitProcess = UsingClientHandle(
+          serverStream,
+          lambda: UsingClientHandle(controlServerStream, clientHandleAction)
+        )
 
       hostRevitProcessId = hostRevitProcess.Id
 
       global_test_mode.ExportRevitProcessId(hostRevitProcessId)
 
-      snapshotDataFilePaths = [
-          snapshot_data_util.GetSnapshotDataFilePath(scriptData.DataExportFolderPath.GetValue())
-          for scriptData in scriptDatas
-        ]
+      # NOTE: also e.g. ipc_protocol.COMMAND_END_SESSION can be sent to recycle the session.
+      hostCommandWriter = ipc_protocol.MessageWriter(controlServerStream)
+
+      snapshotDataFilesTracker = SnapshotDataFilesTracker(scriptDatas)
 
-      pendingReadLineTask = [None] # Needs to be a list so it can be captured by reference in closures.
-      pendingProcessOutputReadLineTask = [None] # As above.
-      pendingProcessErrorReadLineTask = [None] # As above.
-      
       snapshotDataFilesExistTimestamp = [None] # Needs to be a list so it can be captured by reference in closures.
 
-      currentProgressRecordNumber = [0]  # Needs to be a list so it can be captured by reference in closures.
-      progressRecordCheckTimeUtc = [time_util.GetDateTimeUtcNow()] # As above.
-      progressRecordChangedTimeUtc = [time_util.GetDateTimeUtcNow()] # As above.
-
-      def monitoringAction():
-        pendingProcessOutputReadLineTask[0] = ShowRevitProcessOutput(hostRevitProcess.StandardOutput, output, pendingProcessOutputReadLineTask[0])
-        pendingProcessErrorReadLineTask[0] = ShowRevitProcessError(hostRevitProcess.StandardError, output, pendingProcessErrorReadLineTask[0])
-        pendingReadLineTask[0] = ShowRevitScriptOutput(scriptOutputStreamReader, output, pendingReadLineTask[0])
-        
-        if time_util.GetSecondsElapsedSinceUtc(progressRecordCheckTimeUtc[0]) > REVIT_PROGRESS_CHECK_INTERVAL_IN_SECONDS:
-          progressRecordCheckTimeUtc[0] = time_util.GetDateTimeUtcNow()
-          progressRecordNumber = ScriptDataUtil.GetProgressNumber(progressRecordFilePath)
-          if progressRecordNumber is not None:
-            if currentProgressRecordNumber[0] != progressRecordNumber:
-              # Progress update detected.
-              currentProgressRecordNumber[0] = progressRecordNumber
-              progressRecordChangedTimeUtc[0] = time_util.GetDateTimeUtcNow()
+      progressRecordChangedTimeUtc = [time_util.GetDateTimeUtcNow()] # Needs to be a list so it can be captured by reference in closures.
+
+      lastScriptActivityTimeUtc = [time_util.GetDateTimeUtcNow()] # Needs to be a list so it can be captured by reference in closures.
+      dialogCheckIntervalInSeconds = [REVIT_DIALOG_CHECK_INTERVAL_IN_SECONDS] # As above.
+      nextDialogCheckTimeUtc = [None] # As above.
+
+      revitFilePaths = dict(
+          (scriptData.ProgressNumber.GetValue(), scriptData.RevitFilePath.GetValue())
+          for scriptData in scriptDatas
+        )
+
+      sessionWatchdog = session_watchdog.SessionWatchdog(phaseTimeOutPolicy)
+
+      fileOpenGate = file_server_throttle.FileOpenGate(
+          fileServerThrottle,
+          revitFilePaths,
+          lambda: hostCommandWriter.SendCommand(ipc_protocol.COMMAND_OPEN_GRANTED),
+          output
+        )
+
+      resourceSampler = (
+          resource_sampler.ResourceSampler(hostRevitProcess)
+          if resourceSampleIntervalInSeconds is not None else None
+        )
+
+      def onScriptMessage(message):
+        messageType = message[ipc_protocol.MESSAGE__TYPE]
+        if messageType != ipc_protocol.MESSAGE_TYPE_HEARTBEAT:
+          lastScriptActivityTimeUtc[0] = time_util.GetDateTimeUtcNow()
+          dialogCheckIntervalInSeconds[0] = REVIT_DIALOG_CHECK_INTERVAL_IN_SECONDS
+          nextDialogCheckTimeUtc[0] = None
+        if messageType == ipc_protocol.MESSAGE_TYPE_LOG:
+          ShowRevitScriptOutputLine(message[ipc_protocol.MESSAGE__TEXT], output)
+        elif messageType == ipc_protocol.MESSAGE_TYPE_PROGRESS:
+          # Progress update detected.
+          lastProgressNumber[0] = int(message[ipc_protocol.MESSAGE__PROGRESS_NUMBER])
+          progressRecordChangedTimeUtc[0] = time_util.GetDateTimeUtcNow()
+          if resourceSampler is not None:
+            resourceSampler.OnFileStarted(lastProgressNumber[0])
+        elif messageType == ipc_protocol.MESSAGE_TYPE_PHASE:
+          sessionWatchdog.OnPhase(message[ipc_protocol.MESSAGE__PHASE], revitFilePaths.get(lastProgressNumber[0]))
+          fileOpenGate.OnPhase(message[ipc_protocol.MESSAGE__PHASE])
+          if resourceSampler is not None:
+            resourceSampler.OnPhase(message[ipc_protocol.MESSAGE__PHASE])
+        elif messageType == ipc_protocol.MESSAGE_TYPE_HEARTBEAT:
+          sessionWatchdog.OnHeartbeat()
+        elif messageType == ipc_protocol.MESSAGE_TYPE_RESULT:
+          fileResults[int(message[ipc_protocol.MESSAGE__PROGRESS_NUMBER])] = (
+              message[ipc_protocol.MESSAGE__STATUS],
+              message.get(ipc_protocol.MESSAGE__REASON)
+            )
+        elif messageType == ipc_protocol.MESSAGE_TYPE_SNAPSHOT_EXPORTED:
+          snapshotDataFilesTracker.OnSnapshotDataExported(int(message[ipc_protocol.MESSAGE__PROGRESS_NUMBER]))
+          checkSnapshotDataFiles()
+        elif messageType == ipc_protocol.MESSAGE_TYPE_RECORD:
+          record_tables.AppendRecord(message[ipc_protocol.MESSAGE__TABLE], message[ipc_protocol.MESSAGE__RECORD], output)
+        elif messageType == ipc_protocol.MESSAGE_TYPE_OPEN_REQUEST:
+          fileOpenGate.OnOpenRequest(int(message[ipc_protocol.MESSAGE__PROGRESS_NUMBER]))
+        return
 
+      def checkProcessingTimeOuts():
         if processingTimeOutInMinutes > 0:
-          if currentProgressRecordNumber[0] != 0:
+          if lastProgressNumber[0] is not None:
             if time_util.GetSecondsElapsedSinceUtc(progressRecordChangedTimeUtc[0]) > (processingTimeOutInMinutes * SECONDS_PER_MINUTE):
               output()
               output("WARNING: Timed-out waiting for Revit task / file to be processed. Forcibly terminating the Revit process...")
@@ -184,16 +386,42 @@ def RunScriptedRevitSession(
             output("WARNING: Timed-out waiting for Revit script host to begin task / file processing. Forcibly terminating the Revit process...")
             TerminateHostRevitProcess(hostRevitProcess, output)
 
+        timeOutMessage = sessionWatchdog.GetTimeOutMessage()
+        if timeOutMessage is not None:
+          output()
+          output("WARNING: " + timeOutMessage + " Forcibly terminating the Revit process...")
+          TerminateHostRevitProcess(hostRevitProcess, output)
 
         if snapshotDataFilesExistTimestamp[0] is not None:
           if time_util.GetSecondsElapsedSinceUtc(snapshotDataFilesExistTimestamp[0]) > REVIT_PROCESS_EXIT_TIMEOUT_IN_SECONDS:
             output()
             output("WARNING: Timed-out waiting for the Revit process to exit. Forcibly terminating the Revit process...")
             TerminateHostRevitProcess(hostRevitProcess, output)
-        elif snapshotDataFilePaths.All(lambda snapshotDataFilePath: File.Exists(snapshotDataFilePath)):
+        return
+
+      def checkSnapshotDataFiles():
+        if snapshotDataFilesExistTimestamp[0] is None and snapshotDataFilesTracker.AllExported():
           output()
           output("Detected snapshot data files. Waiting for Revit process to exit...")
           snapshotDataFilesExistTimestamp[0] = time_util.GetDateTimeUtcNow()
+        return
+
+      def recheckSnapshotDataFiles():
+        if snapshotDataFilesExistTimestamp[0] is None:
+          snapshotDataFilesTracker.RecheckOutstanding()
+          checkSnapshotDataFiles()
+        return
+
+      def dismissRevitDialogBoxes():
+        # Returns the number of seconds until the next check is due.
+        quietSeconds = time_util.GetSecondsElapsedSinceUtc(lastScriptActivityTimeUtc[0])
+        if quietSeconds < REVIT_DIALOG_CHECK_QUIET_PERIOD_IN_SECONDS:
+          return max(REVIT_DIALOG_CHECK_QUIET_PERIOD_IN_SECONDS - quietSeconds, REVIT_DIALOG_CHECK_INTERVAL_IN_SECONDS)
+
+        if nextDialogCheckTimeUtc[0] is not None:
+          secondsUntilNextCheck = (nextDialogCheckTimeUtc[0] - time_util.GetDateTimeUtcNow()).TotalSeconds
+          if secondsUntilNextCheck > 0:
+            return secondsUntilNextCheck
 
         try:
           revit_dialog_detection.DismissCheekyRevitDialogBoxes(hostRevitProcessId, output)
@@ -201,18 +429,44 @@ def RunScriptedRevitSession(
           output()
           output("WARNING: an error occurred in the cheeky Revit dialog box dismisser!")
           exception_util.LogOutputErrorDetails(e, output)
-        
-        return
 
-      monitor_revit_process.MonitorHostRevitProcess(hostRevitProcess, monitoringAction, output)
+        nextDialogCheckTimeUtc[0] = time_util.GetDateTimeUtcNow().AddSeconds(dialogCheckIntervalInSeconds[0])
+        secondsUntilNextCheck = dialogCheckIntervalInSeconds[0]
+        dialogCheckIntervalInSeconds[0] = min(dialogCheckIntervalInSeconds[0] * 2, REVIT_DIALOG_CHECK_MAX_INTERVAL_IN_SECONDS)
+        return secondsUntilNextCheck
+
+      streamReaders = [
+          monitor_process.ChunkedLineReader(hostRevitProcess.StandardOutput, lambda lines: ShowRevitProcessOutputLines(lines, output)),
+          monitor_process.ChunkedLineReader(hostRevitProcess.StandardError, lambda lines: ShowRevitProcessErrorLines(lines, output)),
+          ipc_protocol.MessageReader(serverStream, onScriptMessage)
+        ]
+
+      periodicActions = [
+          (REVIT_PROCESSING_TIMEOUT_CHECK_INTERVAL_IN_SECONDS, checkProcessingTimeOuts),
+          (SNAPSHOT_DATA_FILES_RECHECK_INTERVAL_IN_SECONDS, recheckSnapshotDataFiles),
+          (REVIT_DIALOG_CHECK_INTERVAL_IN_SECONDS, dismissRevitDialogBoxes)
+        ]
+
+      if resourceSampler is not None:
+        periodicActions.append((resourceSampleIntervalInSeconds, resourceSampler.Sample))
+
+      try:
+        monitor_revit_process.MonitorHostRevitProcess(hostRevitProcess, streamReaders, periodicActions, output)
+      finally:
+        fileOpenGate.Close()
+
+      record_tables.FlushRecordTables(output)
+
+      if resourceSampler is not None:
+        resourceSampler.Finish()
+        RecordResourceUsage(resourceSampler, scriptDatas, output)
       return
-    
-    stream_io_util.UsingStream(scriptOutputStreamReader, streamReaderAction)
+
+    stream_io_util.UsingStream(controlServerStream, controlServerStreamAction)
     return
   
   stream_io_util.UsingStream(serverStream, serverStreamAction)
 
-  lastProgressNumber = ScriptDataUtil.GetProgressNumber(progressRecordFilePath)
-  nextProgressNumber = (lastProgressNumber + 1) if lastProgressNumber is not None else None
+  nextProgressNumber = (lastProgressNumber[0] + 1) if lastProgressNumber[0] is not None else None
 
-  return nextProgressNumber
\ No newline at end of file
+  return nextProgressNumber, fileResults
@@ -0,0 +1,126 @@
+#
+# Revit Batch Processor
+#
+# Copyright (c) 2017  Dan Rumery, BVN
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+
+
+import clr
+import System
+from System import Environment, BitConverter
+from System.IO import Path, File, Directory
+from System.Security.Cryptography import SHA256
+from System.Text import Encoding
+
+import sys
+
+# Precompiles the BatchRvt script modules into an assembly (clr.CompileModules) so that BatchRvt and each Revit session
+# load them without parsing and compiling every module from source. The assembly is keyed by a hash of the scripts'
+# contents (and the IronPython version), so any change to the scripts produces a new assembly.
+#
+# NOTE: this module must be imported (and LoadOrCompileScriptModules() called) before any other BatchRvt script module,
+# since modules that are already imported are not replaced by their compiled versions.
+
+COMPILED_SCRIPTS_FOLDER_NAME = "CompiledScripts"
+COMPILED_SCRIPTS_ASSEMBLY_NAME_PREFIX = "BatchRvtScripts."
+COMPILED_SCRIPTS_ASSEMBLY_FILE_EXTENSION = ".dll"
+SCRIPT_FILE_SEARCH_PATTERN = "*.py"
+
+def GetScriptsFolderPath():
+  return Path.GetDirectoryName(Path.GetFullPath(__file__))
+
+def GetCompiledScriptsFolderPath():
+  # NOTE: the BatchRvt part must match SCRIPT_DATA_FOLDER_NAME defined in BatchRvt.cs.
+  return Path.Combine(
+      Environment.GetFolderPath(Environment.SpecialFolder.LocalApplicationData),
+      "BatchRvt",
+      COMPILED_SCRIPTS_FOLDER_NAME
+    )
+
+def GetScriptFilePaths(scriptsFolderPath):
+  return sorted(Directory.GetFiles(scriptsFolderPath, SCRIPT_FILE_SEARCH_PATTERN), key=lambda filePath: filePath.ToLower())
+
+def GetScriptsContentHash(scriptFilePaths):
+  def hashBlock(sha256, blockBytes):
+    sha256.TransformBlock(blockBytes, 0, blockBytes.Length, None, 0)
+    return
+  sha256 = SHA256.Create()
+  try:
+    for scriptFilePath in scriptFilePaths:
+      hashBlock(sha256, Encoding.UTF8.GetBytes(Path.GetFileName(scriptFilePath).ToLower() + "\n"))
+      hashBlock(sha256, File.ReadAllBytes(scriptFilePath))
+    versionBytes = Encoding.UTF8.GetBytes(sys.version)
+    sha256.TransformFinalBlock(versionBytes, 0, versionBytes.Length)
+    hashBytes = sha256.Hash
+  finally:
+    sha256.Dispose()
+  return BitConverter.ToString(hashBytes).Replace("-", "").ToLower()
+
+def GetCompiledScriptsAssemblyFilePath(compiledScriptsFolderPath, contentHash):
+  return Path.Combine(
+      compiledScriptsFolderPath,
+      COMPILED_SCRIPTS_ASSEMBLY_NAME_PREFIX + contentHash + COMPILED_SCRIPTS_ASSEMBLY_FILE_EXTENSION
+    )
+
+def CompileScriptModules(assemblyFilePath, scriptFilePaths):
+  # Compiled to a temporary file first, so that a concurrent BatchRvt process never loads a partially written assembly.
+  tempAssemblyFilePath = Path.Combine(
+      Path.GetDirectoryName(assemblyFilePath),
+      Path.GetFileNameWithoutExtension(assemblyFilePath) + "." + System.Guid.NewGuid().ToString("N") +
+        COMPILED_SCRIPTS_ASSEMBLY_FILE_EXTENSION
+    )
+  clr.CompileModules(tempAssemblyFilePath, *scriptFilePaths)
+  try:
+    File.Move(tempAssemblyFilePath, assemblyFilePath)
+  except Exception, e:
+    # Another process has compiled the same scripts in the meantime.
+    File.Delete(tempAssemblyFilePath)
+  return
+
+def DeleteStaleCompiledScriptsAssemblies(compiledScriptsFolderPath, assemblyFilePath):
+  for existingAssemblyFilePath in Directory.GetFiles(
+      compiledScriptsFolderPath,
+      COMPILED_SCRIPTS_ASSEMBLY_NAME_PREFIX + "*" + COMPILED_SCRIPTS_ASSEMBLY_FILE_EXTENSION
+    ):
+    if existingAssemblyFilePath.ToLower() != assemblyFilePath.ToLower():
+      try:
+        File.Delete(existingAssemblyFilePath)
+      except Exception, e:
+        pass # Still loaded by a running BatchRvt or Revit process.
+  return
+
+def LoadOrCompileScriptModules(compileIfMissing=True):
+  # Returns True if the compiled script modules were loaded. On any failure the modules are simply imported from
+  # source as before.
+  loaded = False
+  try:
+    scriptFilePaths = GetScriptFilePaths(GetScriptsFolderPath())
+    compiledScriptsFolderPath = GetCompiledScriptsFolderPath()
+    assemblyFilePath = GetCompiledScriptsAssemblyFilePath(
+        compiledScriptsFolderPath,
+        GetScriptsContentHash(scriptFilePaths)
+      )
+    if not File.Exists(assemblyFilePath) and compileIfMissing:
+      Directory.CreateDirectory(compiledScriptsFolderPath)
+      CompileScriptModules(assemblyFilePath, scriptFilePaths)
+      DeleteStaleCompiledScriptsAssemblies(compiledScriptsFolderPath, assemblyFilePath)
+    if File.Exists(assemblyFilePath):
+      clr.AddReferenceToFileAndPath(assemblyFilePath)
+      loaded = True
+  except Exception, e:
+    loaded = False
+  return loaded
@@ -0,0 +1,48 @@
+#
+# Revit Batch Processor
+#
+# Copyright (c) 2017  Dan Rumery, BVN
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+
+
+import clr
+import System
+
+import exception_util
+
+CENTRAL_MODEL_CONTENTION_EXCEPTION_NAME = "CentralModelContentionException"
+
+class FileDeferredException(Exception):
+  def __init__(self, reason):
+    Exception.__init__(self, reason)
+    self.Reason = reason
+    return
+
+def IsCentralModelContentionException(exception):
+  clrException = exception_util.GetClrException(exception)
+  return (
+      clrException is not None and
+      clrException.GetType().Name == CENTRAL_MODEL_CONTENTION_EXCEPTION_NAME
+    )
+
+def GetDeferralReason(exception):
+  deferralReason = None
+  if isinstance(exception, FileDeferredException):
+    deferralReason = exception.Reason
+  elif IsCentralModelContentionException(exception):
+    deferralReason = "The central model is locked by another user."
+  return deferralReason
@@ -0,0 +1,213 @@
+#
+# Revit Batch Processor
+#
+# Copyright (c) 2017  Dan Rumery, BVN
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+
+
+import clr
+import System
+from System.IO import Path
+
+import heapq
+
+import time_util
+import json_util
+import text_file_util
+import session_scheduler
+import shard_util
+import batch_rvt_util
+from batch_rvt_util import RevitVersion, BatchRvt
+
+PLAN_FILE_EXTENSION = ".plan.json"
+
+SKIPPED_REASON_NOT_FOUND = "The file does not exist."
+SKIPPED_REASON_UNSUPPORTED_VERSION = "The file is of an unsupported Revit version."
+SKIPPED_REASON_UNSUPPORTED_FILE_PATH = "The file has an unsupported file path."
+
+def GetPlanFilePathForLogFilePath(logFilePath):
+  return Path.ChangeExtension(logFilePath, None) + PLAN_FILE_EXTENSION
+
+def GetFilePlan(supportedRevitFileInfo, processingHistory):
+  revitFileInfo = supportedRevitFileInfo.GetRevitFileInfo()
+  revitFilePath = revitFileInfo.GetFullPath()
+  fileSize = revitFileInfo.GetFileSize()
+  fileRevitVersion = supportedRevitFileInfo.TryGetRevitVersionNumber()
+  estimatedSeconds, estimateSource = processingHistory.EstimateFileDuration(revitFilePath, fileSize)
+  return {
+      "revitFilePath" : revitFilePath,
+      "priority" : supportedRevitFileInfo.GetPriority(),
+      "fileSize" : fileSize,
+      "fileRevitVersion" : RevitVersion.GetRevitVersionText(fileRevitVersion) if fileRevitVersion is not None else None,
+      "estimatedSeconds" : estimatedSeconds,
+      "estimateSource" : estimateSource
+    }
+
+def GetGroupSessions(revitVersion, supportedRevitFiles, workersCount, useSameSession, processingHistory):
+  # Uses the scheduler's own queue so that the planned order and chunking match an actual run.
+  sessions = []
+  revitVersionQueue = session_scheduler.RevitVersionQueue(revitVersion, supportedRevitFiles, workersCount)
+  while True:
+    sessionRevitFiles = revitVersionQueue.TakeSessionFiles(useSameSession)
+    if sessionRevitFiles is None:
+      break
+    revitVersionQueue.CompleteSession([])
+    sessionFilePlans = [GetFilePlan(supportedRevitFileInfo, processingHistory) for supportedRevitFileInfo in sessionRevitFiles]
+    sessions.append({
+        "files" : sessionFilePlans,
+        "estimatedSeconds" : sum(filePlan["estimatedSeconds"] for filePlan in sessionFilePlans)
+      })
+  return sessions
+
+def ScheduleSessions(groupPlans, maxConcurrentSessions):
+  # Simulates the session scheduler: each group's sessions run in order on the group's workers, and
+  # at most maxConcurrentSessions sessions run at once. Sessions are started in order of their
+  # earliest possible start time, which is also the order in which progress numbers are allocated.
+  sessionSlotFreeTimes = [0.0] * maxConcurrentSessions
+  groupWorkerFreeTimes = [[0.0] * groupPlan["workersCount"] for groupPlan in groupPlans]
+  nextSessionIndexes = [0] * len(groupPlans)
+  progressNumber = 1
+  makespanSeconds = 0.0
+
+  while True:
+    nextGroupIndex = None
+    nextStartSeconds = None
+    for groupIndex, groupPlan in enumerate(groupPlans):
+      if nextSessionIndexes[groupIndex] < len(groupPlan["sessions"]):
+        startSeconds = max(min(groupWorkerFreeTimes[groupIndex]), sessionSlotFreeTimes[0])
+        if nextStartSeconds is None or startSeconds < nextStartSeconds:
+          nextGroupIndex, nextStartSeconds = groupIndex, startSeconds
+    if nextGroupIndex is None:
+      break
+
+    session = groupPlans[nextGroupIndex]["sessions"][nextSessionIndexes[nextGroupIndex]]
+    nextSessionIndexes[nextGroupIndex] += 1
+    endSeconds = nextStartSeconds + session["estimatedSeconds"]
+
+    workerFreeTimes = groupWorkerFreeTimes[nextGroupIndex]
+    workerFreeTimes[workerFreeTimes.index(min(workerFreeTimes))] = endSeconds
+    heapq.heapreplace(sessionSlotFreeTimes, endSeconds)
+
+    session["firstProgressNumber"] = progressNumber
+    session["lastProgressNumber"] = progressNumber + len(session["files"]) - 1
+    session["estimatedStartSeconds"] = nextStartSeconds
+    for filePlan in session["files"]:
+      filePlan["progressNumber"] = progressNumber
+      progressNumber += 1
+    makespanSeconds = max(makespanSeconds, endSeconds)
+
+  return makespanSeconds
+
+def BuildExecutionPlan(batchRvtConfig, revitVersionGroups, skippedRevitFiles, processingHistory):
+  useSameSession = (batchRvtConfig.RevitSessionOption == BatchRvt.RevitSessionOption.UseSameSessionForFilesOfSameVersion)
+  maxConcurrentSessions = batchRvtConfig.MaxConcurrentRevitSessions
+
+  groupPlans = []
+  for revitVersion, supportedRevitFiles in session_scheduler.OrderRevitVersionGroupsByPriority(revitVersionGroups):
+    workersCount = session_scheduler.GetRevitVersionSessionLimit(
+        batchRvtConfig.RevitVersionSessionLimits,
+        revitVersion,
+        maxConcurrentSessions
+      )
+    sessions = GetGroupSessions(revitVersion, supportedRevitFiles, workersCount, useSameSession, processingHistory)
+    groupPlans.append({
+        "revitVersion" : RevitVersion.GetRevitVersionText(revitVersion),
+        "workersCount" : workersCount,
+        "filesCount" : len(supportedRevitFiles),
+        "estimatedProcessingSeconds" : sum(session["estimatedSeconds"] for session in sessions),
+        "sessions" : sessions
+      })
+
+  makespanSeconds = ScheduleSessions(groupPlans, maxConcurrentSessions)
+  planTime = time_util.GetDateTimeNow()
+
+  return {
+      "sessionId" : batchRvtConfig.SessionId,
+      "planTime" : time_util.GetTimestampObject(planTime),
+      "taskScriptFilePath" : batchRvtConfig.ScriptFilePath,
+      "revitFileListFilePath" : batchRvtConfig.RevitFileListFilePath,
+      "revitSessionOption" : str(batchRvtConfig.RevitSessionOption),
+      "maxConcurrentRevitSessions" : maxConcurrentSessions,
+      "filesCount" : sum(groupPlan["filesCount"] for groupPlan in groupPlans),
+      "sessionsCount" : sum(len(groupPlan["sessions"]) for groupPlan in groupPlans),
+      "estimatedProcessingSeconds" : sum(groupPlan["estimatedProcessingSeconds"] for groupPlan in groupPlans),
+      "estimatedDurationSeconds" : makespanSeconds,
+      "estimatedCompletionTime" : time_util.GetTimestampObject(planTime.AddSeconds(makespanSeconds)),
+      "groups" : groupPlans,
+      "skippedFiles" : [
+          {
+            "revitFilePath" : supportedRevitFileInfo.GetRevitFileInfo().GetFullPath(),
+            "reason" : reason
+          }
+          for supportedRevitFileInfo, reason in skippedRevitFiles
+        ]
+    }
+
+def AddShardsToExecutionPlan(executionPlan, batchRvtConfig, revitFileShardPlans):
+  executionPlan["shardNumber"] = batchRvtConfig.ShardNumber
+  executionPlan["shardsCount"] = batchRvtConfig.ShardsCount
+  executionPlan["shardCostSource"] = shard_util.GetShardCostSource(batchRvtConfig.ShardHistoryFilePath)
+  executionPlan["shards"] = [
+      {
+        "shardNumber" : revitFileShard.ShardNumber,
+        "filesCount" : len(revitFileShard.SupportedRevitFiles),
+        "cost" : revitFileShard.Cost,
+        "estimatedProcessingSeconds" : shardPlan["estimatedProcessingSeconds"],
+        "estimatedDurationSeconds" : shardPlan["estimatedDurationSeconds"]
+      }
+      for revitFileShard, shardPlan in revitFileShardPlans
+    ]
+  return
+
+def BuildSingleTaskExecutionPlan(batchRvtConfig):
+  return {
+      "sessionId" : batchRvtConfig.SessionId,
+      "planTime" : time_util.GetTimestampObject(time_util.GetDateTimeNow()),
+      "taskScriptFilePath" : batchRvtConfig.ScriptFilePath,
+      "revitProcessingOption" : str(batchRvtConfig.RevitProcessingOption),
+      "revitVersion" : RevitVersion.GetRevitVersionText(batchRvtConfig.SingleRevitTaskRevitVersion)
+    }
+
+def ExportExecutionPlan(planFilePath, executionPlan):
+  text_file_util.WriteToTextFile(planFilePath, json_util.SerializeObject(executionPlan, True))
+  return
+
+def ShowExecutionPlanSummary(executionPlan, output):
+  output()
+  output("Execution plan:")
+  output()
+  output("\t" + "Files: " + str(executionPlan["filesCount"]))
+  output("\t" + "Skipped files: " + str(len(executionPlan["skippedFiles"])))
+  output("\t" + "Revit sessions: " + str(executionPlan["sessionsCount"]))
+  for groupPlan in executionPlan["groups"]:
+    output(
+        "\t" + "Revit " + groupPlan["revitVersion"] + ": " +
+        str(groupPlan["filesCount"]) + " file(s) in " + str(len(groupPlan["sessions"])) + " session(s)" +
+        " using " + str(groupPlan["workersCount"]) + " worker(s)"
+      )
+  if "shards" in executionPlan:
+    output()
+    for shardPlan in executionPlan["shards"]:
+      output(
+          "\t" + "Shard " + str(shardPlan["shardNumber"]) + " of " + str(executionPlan["shardsCount"]) + ": " +
+          str(shardPlan["filesCount"]) + " file(s), estimated duration " +
+          System.TimeSpan.FromSeconds(int(shardPlan["estimatedDurationSeconds"])).ToString("c")
+        )
+  output()
+  output("\t" + "Estimated duration: " + System.TimeSpan.FromSeconds(int(executionPlan["estimatedDurationSeconds"])).ToString("c"))
+  output("\t" + "Estimated completion: " + executionPlan["estimatedCompletionTime"]["local"])
+  return
@@ -0,0 +1,264 @@
+#
+# Revit Batch Processor
+#
+# Copyright (c) 2017  Dan Rumery, BVN
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+
+
+import clr
+import System
+from System.Threading import Semaphore
+
+import threading
+
+import path_util
+import time_util
+import thread_util
+import metrics_util
+import exception_util
+import ipc_protocol
+
+UNC_PATH_PREFIX = "\\\\"
+SEMAPHORE_NAME_PREFIX = "Local\\BatchRvt.FileServerThrottle."
+BYTES_PER_MEGABYTE = 1024 * 1024
+
+FILE_SERVER_QUEUE_WAIT_METRIC = "fileServerQueueWait"
+
+def GetFileServerIdentity(revitFilePath, perShare):
+  # NOTE: files on local (non-network) drives are not associated with a file server and are never throttled.
+  fileServerIdentity = None
+  try:
+    fullNetworkPath = path_util.ExpandedFullNetworkPath(revitFilePath)
+  except Exception, e:
+    fullNetworkPath = None
+  if fullNetworkPath is not None and fullNetworkPath.StartsWith(UNC_PATH_PREFIX):
+    parts = [part for part in fullNetworkPath[len(UNC_PATH_PREFIX):].Split("\\") if part != str.Empty]
+    if len(parts) > 0:
+      identityParts = parts[:2] if perShare else parts[:1]
+      fileServerIdentity = UNC_PATH_PREFIX + str.Join("\\", identityParts).ToLowerInvariant()
+  return fileServerIdentity
+
+def GetSemaphoreName(fileServerIdentity, maxConcurrentOpens):
+  # NOTE: backslashes are not allowed in semaphore names (other than the namespace prefix).
+  # The limit is included in the name so that processes configured with different limits don't share a semaphore
+  # whose count was initialized by the other.
+  return SEMAPHORE_NAME_PREFIX + fileServerIdentity.Replace("\\", "/") + "." + str(maxConcurrentOpens)
+
+class FileServerStats:
+  def __init__(self):
+    self.OpenCount = 0
+    self.TotalWaitSeconds = 0.0
+    self.MaxWaitSeconds = 0.0
+    return
+
+  def AddWait(self, waitSeconds):
+    self.OpenCount += 1
+    self.TotalWaitSeconds += waitSeconds
+    self.MaxWaitSeconds = max(self.MaxWaitSeconds, waitSeconds)
+    return
+
+class FileServerLease:
+  def __init__(self, semaphores):
+    self.Semaphores = semaphores
+    return
+
+class FileServerThrottle:
+  def __init__(self, maxConcurrentOpens, maxMegabytesPerSecond, perShare):
+    self.MaxConcurrentOpens = maxConcurrentOpens
+    self.MaxBytesPerSecond = maxMegabytesPerSecond * BYTES_PER_MEGABYTE
+    self.PerShare = perShare
+    self.semaphores = {}
+    self.nextAvailableTimeUtc = {}
+    self.stats = {}
+    self.lock = threading.Lock()
+    return
+
+  def IsEnabled(self):
+    return self.MaxConcurrentOpens > 0 or self.MaxBytesPerSecond > 0
+
+  def GetSemaphore(self, fileServerIdentity):
+    with self.lock:
+      semaphore = self.semaphores.get(fileServerIdentity)
+      if semaphore is None:
+        semaphore = Semaphore(
+            self.MaxConcurrentOpens,
+            self.MaxConcurrentOpens,
+            GetSemaphoreName(fileServerIdentity, self.MaxConcurrentOpens)
+          )
+        self.semaphores[fileServerIdentity] = semaphore
+    return semaphore
+
+  def ReserveTransferTime(self, fileServerIdentity, fileSize):
+    # Returns the number of seconds to wait before the file may be handed out, such that the average rate of
+    # bytes handed out for this file server does not exceed the limit. (This limit is enforced per BatchRvt process.)
+    with self.lock:
+      nowUtc = time_util.GetDateTimeUtcNow()
+      availableTimeUtc = self.nextAvailableTimeUtc.get(fileServerIdentity, nowUtc)
+      startTimeUtc = availableTimeUtc if availableTimeUtc > nowUtc else nowUtc
+      transferSeconds = (fileSize if fileSize is not None else 0) / float(self.MaxBytesPerSecond)
+      self.nextAvailableTimeUtc[fileServerIdentity] = startTimeUtc.AddSeconds(transferSeconds)
+      waitSeconds = (startTimeUtc - nowUtc).TotalSeconds
+    return waitSeconds
+
+  def RecordWait(self, fileServerIdentity, waitSeconds):
+    with self.lock:
+      stats = self.stats.get(fileServerIdentity)
+      if stats is None:
+        stats = FileServerStats()
+        self.stats[fileServerIdentity] = stats
+      stats.AddWait(waitSeconds)
+    metrics_util.EmitMetric(
+        FILE_SERVER_QUEUE_WAIT_METRIC,
+        {
+          "fileServer" : fileServerIdentity,
+          "waitSeconds" : waitSeconds
+        }
+      )
+    return
+
+  def AcquireForFile(self, revitFilePath, output):
+    # Called just before the Revit session opens the file (see FileOpenGate), so that both the concurrent-opens slot
+    # and the byte-rate limit apply to the actual open rather than to the whole session.
+    acquiredSemaphores = []
+    fileServerIdentity = GetFileServerIdentity(revitFilePath, self.PerShare) if self.IsEnabled() else None
+    if fileServerIdentity is not None:
+      waitStartTimeUtc = time_util.GetDateTimeUtcNow()
+      try:
+        if self.MaxConcurrentOpens > 0:
+          semaphore = self.GetSemaphore(fileServerIdentity)
+          if not semaphore.WaitOne(0):
+            output()
+            output("Waiting for a free slot on file server: " + fileServerIdentity)
+            semaphore.WaitOne()
+          acquiredSemaphores.append(semaphore)
+        if self.MaxBytesPerSecond > 0:
+          waitSeconds = self.ReserveTransferTime(fileServerIdentity, path_util.GetFileSize(revitFilePath))
+          if waitSeconds > 0:
+            thread_util.SleepForMilliseconds(int(waitSeconds * 1000))
+      except:
+        self.Release(FileServerLease(acquiredSemaphores), output)
+        raise
+      self.RecordWait(fileServerIdentity, time_util.GetTotalSecondsElapsedSinceUtc(waitStartTimeUtc))
+    return FileServerLease(acquiredSemaphores)
+
+  def Release(self, fileServerLease, output):
+    for semaphore in fileServerLease.Semaphores:
+      try:
+        semaphore.Release()
+      except Exception, e:
+        output()
+        output("WARNING: failed to release a file server throttling slot!")
+        exception_util.LogOutputErrorDetails(e, output)
+    fileServerLease.Semaphores = []
+    return
+
+  def ShowStats(self, output):
+    with self.lock:
+      stats = list(self.stats.items())
+    if len(stats) > 0:
+      output()
+      output("File server queue wait times:")
+      for fileServerIdentity, serverStats in sorted(stats):
+        output()
+        output("\t" + fileServerIdentity)
+        output("\t" + "Opens: " + str(serverStats.OpenCount))
+        output("\t" + "Total wait: " + str.Format("{0:0.0}s", serverStats.TotalWaitSeconds))
+        output("\t" + "Max wait: " + str.Format("{0:0.0}s", serverStats.MaxWaitSeconds))
+    return
+
+# File opening phases; the file server slot for a file is held until the script host reports any other phase.
+FILE_OPENING_PHASES = [ipc_protocol.PHASE_OPENING, ipc_protocol.PHASE_UPGRADING]
+
+class FileOpenGate:
+  # Monitor side of the per-file open handshake: the script host asks before opening each file and waits until the
+  # open is granted, i.e. until the file's server has a free slot and its byte-rate allows the transfer.
+  def __init__(self, fileServerThrottle, revitFilePaths, sendOpenGranted, output):
+    self.fileServerThrottle = fileServerThrottle
+    self.revitFilePaths = revitFilePaths
+    self.sendOpenGranted = sendOpenGranted
+    self.output = output
+    self.lock = threading.Lock()
+    self.fileServerLease = None
+    self.isClosed = False
+    return
+
+  def IsEnabled(self):
+    return self.fileServerThrottle is not None and self.fileServerThrottle.IsEnabled()
+
+  def GrantOpen(self):
+    try:
+      self.sendOpenGranted()
+    except Exception, e:
+      pass # The script host has gone away.
+    return
+
+  def OnOpenRequest(self, progressNumber):
+    # NOTE: called on the monitor's message thread. The slot is acquired on a separate thread so that the monitor
+    # keeps handling the session's messages (and timeouts) while the script host waits.
+    self.ReleaseLease()
+    revitFilePath = self.revitFilePaths.get(progressNumber)
+    if not self.IsEnabled() or revitFilePath is None:
+      self.GrantOpen()
+    else:
+      def acquire():
+        fileServerLease = None
+        try:
+          fileServerLease = self.fileServerThrottle.AcquireForFile(revitFilePath, self.output)
+        except Exception, e:
+          self.output()
+          self.output("WARNING: failed to acquire a file server throttling slot! The file will be opened unthrottled.")
+          exception_util.LogOutputErrorDetails(e, self.output)
+        with self.lock:
+          isClosed = self.isClosed
+          if not isClosed:
+            self.fileServerLease = fileServerLease
+        if not isClosed:
+          self.GrantOpen()
+        elif fileServerLease is not None:
+          self.fileServerThrottle.Release(fileServerLease, self.output)
+        return
+      acquireThread = threading.Thread(target=acquire)
+      acquireThread.daemon = True
+      acquireThread.start()
+    return
+
+  def OnPhase(self, phase):
+    if phase not in FILE_OPENING_PHASES:
+      self.ReleaseLease()
+    return
+
+  def ReleaseLease(self):
+    with self.lock:
+      fileServerLease = self.fileServerLease
+      self.fileServerLease = None
+    if fileServerLease is not None:
+      self.fileServerThrottle.Release(fileServerLease, self.output)
+    return
+
+  def Close(self):
+    with self.lock:
+      self.isClosed = True
+    self.ReleaseLease()
+    return
+
+def CreateFileServerThrottle(batchRvtConfig):
+  return FileServerThrottle(
+      max(batchRvtConfig.MaxConcurrentOpensPerFileServer, 0),
+      max(batchRvtConfig.MaxMegabytesPerSecondPerFileServer, 0),
+      batchRvtConfig.ThrottlePerFileServerShare
+    )
+
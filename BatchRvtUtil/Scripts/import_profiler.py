@@ -0,0 +1,108 @@
+#
+# Revit Batch Processor
+#
+# Copyright (c) 2017  Dan Rumery, BVN
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+
+
+import clr
+import System
+from System import Environment
+from System.Diagnostics import Stopwatch
+
+import __builtin__
+import sys
+import threading
+
+# Opt-in profiling of module import times, for catching startup regressions in the BatchRvt monitor and the script
+# host. Enabled by setting the environment variable below to 1 (it is inherited by the Revit processes that BatchRvt
+# starts). Must be installed before the imports to be measured.
+IMPORT_PROFILER__ENVIRONMENT_VARIABLE_NAME = "BATCHRVT__IMPORT_PROFILER"
+
+IMPORT_PROFILE_REPORT_MAX_MODULES_COUNT = 40
+
+class ImportTimes(object):
+  def __init__(self):
+    self.InclusiveMilliseconds = 0.0
+    self.ExclusiveMilliseconds = 0.0
+    return
+
+IMPORT_TIMES = {} # Module name -> ImportTimes.
+IMPORT_TIMES_LOCK = threading.Lock()
+IS_INSTALLED = [False] # Needs to be a list so it can be captured by reference in closures.
+
+def IsImportProfilerEnabled():
+  return Environment.GetEnvironmentVariable(IMPORT_PROFILER__ENVIRONMENT_VARIABLE_NAME) == "1"
+
+def RecordImportTime(moduleName, inclusiveMilliseconds, exclusiveMilliseconds):
+  with IMPORT_TIMES_LOCK:
+    importTimes = IMPORT_TIMES.get(moduleName)
+    if importTimes is None:
+      importTimes = ImportTimes()
+      IMPORT_TIMES[moduleName] = importTimes
+    importTimes.InclusiveMilliseconds += inclusiveMilliseconds
+    importTimes.ExclusiveMilliseconds += exclusiveMilliseconds
+  return
+
+def InstallImportProfiler():
+  if IS_INSTALLED[0] or not IsImportProfilerEnabled():
+    return
+
+  originalImport = __builtin__.__import__
+  stopwatch = Stopwatch.StartNew()
+  # Per-thread stack of the time spent in nested imports, so that each module's own (exclusive) time can be recorded.
+  threadState = threading.local()
+
+  def profiledImport(name, *args, **kwargs):
+    if name in sys.modules:
+      return originalImport(name, *args, **kwargs)
+    nestedImportTimes = getattr(threadState, "nestedImportTimes", None)
+    if nestedImportTimes is None:
+      nestedImportTimes = []
+      threadState.nestedImportTimes = nestedImportTimes
+    startMilliseconds = stopwatch.Elapsed.TotalMilliseconds
+    nestedImportTimes.append(0.0)
+    try:
+      return originalImport(name, *args, **kwargs)
+    finally:
+      inclusiveMilliseconds = stopwatch.Elapsed.TotalMilliseconds - startMilliseconds
+      exclusiveMilliseconds = inclusiveMilliseconds - nestedImportTimes.pop()
+      if len(nestedImportTimes) > 0:
+        nestedImportTimes[-1] += inclusiveMilliseconds
+      RecordImportTime(name, inclusiveMilliseconds, exclusiveMilliseconds)
+
+  __builtin__.__import__ = profiledImport
+  IS_INSTALLED[0] = True
+  return
+
+def ShowImportProfile(output):
+  if not IS_INSTALLED[0]:
+    return
+  with IMPORT_TIMES_LOCK:
+    importTimes = sorted(IMPORT_TIMES.items(), key=lambda item: item[1].ExclusiveMilliseconds, reverse=True)
+  totalMilliseconds = sum(moduleImportTimes.ExclusiveMilliseconds for moduleName, moduleImportTimes in importTimes)
+  output()
+  output(
+      "Import profile: " + str(len(importTimes)) + " modules imported in " +
+      str.Format("{0:0}ms", totalMilliseconds) + " (columns: own time, time including nested imports)"
+    )
+  for moduleName, moduleImportTimes in importTimes[:IMPORT_PROFILE_REPORT_MAX_MODULES_COUNT]:
+    output(
+        "\t" + str.Format("{0,8:0.0}ms", moduleImportTimes.ExclusiveMilliseconds) +
+        str.Format("{0,9:0.0}ms", moduleImportTimes.InclusiveMilliseconds) + "  " + moduleName
+      )
+  return
@@ -0,0 +1,517 @@
+#
+# Revit Batch Processor
+#
+# Copyright (c) 2017  Dan Rumery, BVN
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+
+
+import clr
+import System
+import threading
+import collections
+
+from System import Array, Byte, BitConverter, Buffer
+from System.IO import IOException, StreamWriter
+from System.Text import Encoding
+from System.Threading.Tasks import TaskStatus
+
+import json_util
+import stream_io_util
+
+# Messages are exchanged between the monitor and the script host as frames: a 4-byte little-endian payload length
+# followed by a UTF-8 encoded JSON object. Every message has a "type" field.
+#
+# Log messages are by far the most frequent so they skip JSON: their payload is LOG_FRAME_MARKER followed by the
+# UTF-8 encoded text. (A JSON payload always starts with '{'.)
+
+FRAME_LENGTH_PREFIX_SIZE = 4
+MAX_FRAME_PAYLOAD_SIZE = 16 * 1024 * 1024
+READ_BUFFER_SIZE = 64 * 1024
+LOG_FRAME_MARKER = Byte(1)
+HEARTBEAT_INTERVAL_IN_SECONDS = 5
+
+MESSAGE__TYPE = "type"
+MESSAGE__TEXT = "text"
+MESSAGE__PROGRESS_NUMBER = "progressNumber"
+MESSAGE__PHASE = "phase"
+MESSAGE__REVIT_FILE_PATH = "revitFilePath"
+MESSAGE__STATUS = "status"
+MESSAGE__REASON = "reason"
+MESSAGE__COMMAND = "command"
+MESSAGE__TABLE = "table"
+MESSAGE__RECORD = "record"
+
+# Script host -> monitor.
+MESSAGE_TYPE_LOG = "log"
+MESSAGE_TYPE_PROGRESS = "progress"
+MESSAGE_TYPE_PHASE = "phase"
+MESSAGE_TYPE_HEARTBEAT = "heartbeat"
+MESSAGE_TYPE_RESULT = "result"
+MESSAGE_TYPE_SNAPSHOT_EXPORTED = "snapshotExported"
+MESSAGE_TYPE_RECORD = "record"
+MESSAGE_TYPE_OPEN_REQUEST = "openRequest"
+
+# Monitor -> script host.
+MESSAGE_TYPE_COMMAND = "command"
+
+PHASE_STARTUP = "startup"
+# Waiting for the monitor to grant the open of the next file (see MessageWriter.WaitForOpenGrant).
+PHASE_WAITING_FOR_OPEN = "waitingForOpen"
+PHASE_OPENING = "opening"
+PHASE_UPGRADING = "upgrading"
+PHASE_TASK = "task"
+PHASE_CLOSING = "closing"
+PHASE_EXPORTING = "exporting"
+
+RESULT_STATUS_COMPLETED = "completed"
+RESULT_STATUS_ABORTED = "aborted"
+RESULT_STATUS_DEFERRED = "deferred"
+RESULT_STATUS_PARTIAL = "partial" # Some (but not all) of the task scripts failed.
+RESULT_STATUS_FAILED = "failed" # All of the task scripts failed.
+
+# Asks the script host to end the Revit session once the current file is done. The remaining files are then
+# processed in a new session.
+COMMAND_END_SESSION = "endSession"
+
+# Answers an open request: the script host may now open the file (i.e. file server throttling allows it).
+COMMAND_OPEN_GRANTED = "openGranted"
+OPEN_GRANT_POLL_INTERVAL_IN_SECONDS = 1
+
+# How the script host handles log messages when its output queue is full (see QueuedMessageWriter).
+OUTPUT_OVERFLOW_POLICY_BLOCK = "block"
+OUTPUT_OVERFLOW_POLICY_DROP = "drop"
+OUTPUT_OVERFLOW_POLICY_SPILL = "spill"
+OUTPUT_OVERFLOW_POLICIES = [
+    OUTPUT_OVERFLOW_POLICY_BLOCK,
+    OUTPUT_OVERFLOW_POLICY_DROP,
+    OUTPUT_OVERFLOW_POLICY_SPILL
+  ]
+
+OUTPUT_QUEUE_MAX_SIZE_IN_BYTES = 8 * 1024 * 1024
+OUTPUT_BATCH_MAX_SIZE_IN_BYTES = 64 * 1024
+OUTPUT_BATCH_MAX_DELAY_IN_SECONDS = 0.05
+OUTPUT_CLOSE_TIMEOUT_IN_SECONDS = 30
+OUTPUT_FLUSH_POLL_INTERVAL_IN_SECONDS = 1
+
+def ParseOutputOverflowPolicy(outputOverflowPolicyText):
+  if str.IsNullOrWhiteSpace(outputOverflowPolicyText):
+    return OUTPUT_OVERFLOW_POLICY_BLOCK
+  outputOverflowPolicy = outputOverflowPolicyText.Trim()
+  if outputOverflowPolicy not in OUTPUT_OVERFLOW_POLICIES:
+    raise Exception("Unknown output overflow policy: " + outputOverflowPolicy)
+  return outputOverflowPolicy
+
+def EncodeFrame(message):
+  payload = Encoding.UTF8.GetBytes(json_util.SerializeObject(message))
+  frame = Array.CreateInstance(Byte, FRAME_LENGTH_PREFIX_SIZE + payload.Length)
+  Buffer.BlockCopy(BitConverter.GetBytes(payload.Length), 0, frame, 0, FRAME_LENGTH_PREFIX_SIZE)
+  Buffer.BlockCopy(payload, 0, frame, FRAME_LENGTH_PREFIX_SIZE, payload.Length)
+  return frame
+
+def EncodeLogFrame(text):
+  textByteCount = Encoding.UTF8.GetByteCount(text)
+  frame = Array.CreateInstance(Byte, FRAME_LENGTH_PREFIX_SIZE + 1 + textByteCount)
+  Buffer.BlockCopy(BitConverter.GetBytes(1 + textByteCount), 0, frame, 0, FRAME_LENGTH_PREFIX_SIZE)
+  frame[FRAME_LENGTH_PREFIX_SIZE] = LOG_FRAME_MARKER
+  Encoding.UTF8.GetBytes(text, 0, len(text), frame, FRAME_LENGTH_PREFIX_SIZE + 1)
+  return frame
+
+def DecodeMessage(bytes, offset, count):
+  if count > 0 and bytes[offset] == LOG_FRAME_MARKER:
+    return { MESSAGE__TYPE : MESSAGE_TYPE_LOG, MESSAGE__TEXT : Encoding.UTF8.GetString(bytes, offset + 1, count - 1) }
+  jobject = json_util.DeserializeToJObject(Encoding.UTF8.GetString(bytes, offset, count))
+  message = {}
+  for jproperty in jobject.Properties():
+    message[jproperty.Name] = json_util.GetValueFromJValue(jproperty.Value)
+  return message
+
+class FrameDecoder(object):
+  def __init__(self):
+    self.buffer = Array.CreateInstance(Byte, READ_BUFFER_SIZE)
+    self.count = 0
+    return
+
+  def Append(self, bytes, count):
+    if self.count + count > self.buffer.Length:
+      newBuffer = Array.CreateInstance(Byte, max(self.buffer.Length * 2, self.count + count))
+      Buffer.BlockCopy(self.buffer, 0, newBuffer, 0, self.count)
+      self.buffer = newBuffer
+    Buffer.BlockCopy(bytes, 0, self.buffer, self.count, count)
+    self.count += count
+    return
+
+  def DecodeMessages(self):
+    messages = []
+    offset = 0
+    while (self.count - offset) >= FRAME_LENGTH_PREFIX_SIZE:
+      payloadLength = BitConverter.ToInt32(self.buffer, offset)
+      if payloadLength < 0 or payloadLength > MAX_FRAME_PAYLOAD_SIZE:
+        raise IOException("Invalid message frame length: " + str(payloadLength))
+      if (self.count - offset - FRAME_LENGTH_PREFIX_SIZE) < payloadLength:
+        break
+      messages.append(DecodeMessage(self.buffer, offset + FRAME_LENGTH_PREFIX_SIZE, payloadLength))
+      offset += FRAME_LENGTH_PREFIX_SIZE + payloadLength
+    if offset > 0:
+      Buffer.BlockCopy(self.buffer, offset, self.buffer, 0, self.count - offset)
+      self.count -= offset
+    return messages
+
+class MessageWriter(object):
+  def __init__(self, stream):
+    self.stream = stream
+    self.lock = threading.Lock()
+    self.phase = None
+    return
+
+  def Send(self, message):
+    self.SendFrame(EncodeFrame(message))
+    return
+
+  def SendFrame(self, frame):
+    def write():
+      self.stream.Write(frame, 0, frame.Length)
+      self.stream.Flush()
+      return
+    # The lock keeps frames written from different threads (e.g. heartbeats) from interleaving.
+    with self.lock:
+      stream_io_util.WithIgnoredIOException(write)
+    return
+
+  def SendFrameAndWait(self, frame):
+    # Returns once the frame has been written. (Frames are always written synchronously here.)
+    self.SendFrame(frame)
+    return
+
+  def SendFrameWhenQueueHasRoom(self, frame):
+    # Blocks the sender while the output is backed up. (Frames are always written synchronously here.)
+    self.SendFrame(frame)
+    return
+
+  def SendLog(self, text):
+    self.SendFrame(EncodeLogFrame(text))
+    return
+
+  def SendProgress(self, progressNumber):
+    # Progress and file results are written before returning so that the monitor has them even if Revit dies straight
+    # after (the monitor resumes the session from the file after the last reported one).
+    self.SendFrameAndWait(EncodeFrame({ MESSAGE__TYPE : MESSAGE_TYPE_PROGRESS, MESSAGE__PROGRESS_NUMBER : progressNumber }))
+    return
+
+  def SendPhase(self, phase):
+    self.phase = phase
+    self.Send({ MESSAGE__TYPE : MESSAGE_TYPE_PHASE, MESSAGE__PHASE : phase })
+    return
+
+  def SendHeartbeat(self):
+    # Heartbeats are tagged with the current phase.
+    self.Send({ MESSAGE__TYPE : MESSAGE_TYPE_HEARTBEAT, MESSAGE__PHASE : self.phase })
+    return
+
+  def SendResult(self, progressNumber, revitFilePath, status, reason=None):
+    self.SendFrameAndWait(EncodeFrame({
+        MESSAGE__TYPE : MESSAGE_TYPE_RESULT,
+        MESSAGE__PROGRESS_NUMBER : progressNumber,
+        MESSAGE__REVIT_FILE_PATH : revitFilePath,
+        MESSAGE__STATUS : status,
+        MESSAGE__REASON : reason
+      }))
+    return
+
+  def SendSnapshotExported(self, progressNumber):
+    self.Send({ MESSAGE__TYPE : MESSAGE_TYPE_SNAPSHOT_EXPORTED, MESSAGE__PROGRESS_NUMBER : progressNumber })
+    return
+
+  def SendRecord(self, tableName, recordText):
+    # The record is sent as JSON text (rather than a nested object) so the monitor can append it to the table as is.
+    # Records are never dropped, so a script emitting them faster than the monitor reads them is held up instead.
+    self.SendFrameWhenQueueHasRoom(
+        EncodeFrame({ MESSAGE__TYPE : MESSAGE_TYPE_RECORD, MESSAGE__TABLE : tableName, MESSAGE__RECORD : recordText })
+      )
+    return
+
+  def SendOpenRequest(self, progressNumber):
+    self.Send({ MESSAGE__TYPE : MESSAGE_TYPE_OPEN_REQUEST, MESSAGE__PROGRESS_NUMBER : progressNumber })
+    return
+
+  def WaitForOpenGrant(self, progressNumber, openGranted, monitorDisconnected):
+    # Asks the monitor for permission to open the file and waits for COMMAND_OPEN_GRANTED (which sets openGranted).
+    # Stops waiting if the monitor goes away. The wait is reported as its own phase so that the time spent queued for
+    # the file server is not charged to the previous phase's timeout.
+    openGranted.clear()
+    self.SendPhase(PHASE_WAITING_FOR_OPEN)
+    self.SendOpenRequest(progressNumber)
+    while not openGranted.wait(OPEN_GRANT_POLL_INTERVAL_IN_SECONDS):
+      if monitorDisconnected.is_set():
+        break
+    return
+
+  def SendCommand(self, command):
+    self.Send({ MESSAGE__TYPE : MESSAGE_TYPE_COMMAND, MESSAGE__COMMAND : command })
+    return
+
+class QueuedMessageWriter(MessageWriter):
+  # Queues frames in memory and writes them in batches on a background thread, so that a slow reader does not hold up
+  # the sender (i.e. Revit's main thread). A batch is written once it reaches OUTPUT_BATCH_MAX_SIZE_IN_BYTES or
+  # OUTPUT_BATCH_MAX_DELAY_IN_SECONDS after its first frame was queued.
+  #
+  # When the queue is full, log messages are handled according to overflowPolicy (block the sender, drop the message
+  # or append it to the spill file). Records wait for room in the queue. Other messages are always queued, since the
+  # monitor relies on them.
+  #
+  # SendFrameAndWait() writes out the queue up to and including its frame before returning.
+  def __init__(self, stream, overflowPolicy=OUTPUT_OVERFLOW_POLICY_BLOCK, spillFilePath=None):
+    MessageWriter.__init__(self, stream)
+    self.overflowPolicy = overflowPolicy
+    self.spillFilePath = spillFilePath
+    self.spillWriter = None
+    self.queueCondition = threading.Condition()
+    self.queuedFrames = collections.deque()
+    self.queuedSize = 0
+    self.queuedFramesCount = 0 # Total number of frames ever queued.
+    self.writtenFramesCount = 0 # Total number of queued frames written (or given up on) by the writer thread.
+    self.flushFramesCount = 0 # The writer does not wait to fill a batch until this many frames have been written.
+    self.droppedLogsCount = 0
+    self.spilledLogsCount = 0
+    self.isClosed = False
+    self.writerThread = threading.Thread(target=self.WriteQueuedFrames)
+    self.writerThread.daemon = True
+    self.writerThread.start()
+    return
+
+  def IsQueueFull(self, frame):
+    # An empty queue always accepts a frame, however large.
+    return self.queuedSize > 0 and (self.queuedSize + frame.Length) > OUTPUT_QUEUE_MAX_SIZE_IN_BYTES
+
+  def EnqueueFrame(self, frame):
+    # NOTE: the caller must hold self.queueCondition.
+    wasEmpty = (self.queuedSize == 0)
+    self.queuedFrames.append(frame)
+    self.queuedSize += frame.Length
+    self.queuedFramesCount += 1
+    if wasEmpty or self.queuedSize >= OUTPUT_BATCH_MAX_SIZE_IN_BYTES:
+      self.queueCondition.notifyAll()
+    return
+
+  def SendFrame(self, frame):
+    with self.queueCondition:
+      if not self.isClosed:
+        self.EnqueueFrame(frame)
+    return
+
+  def SendFrameWhenQueueHasRoom(self, frame):
+    with self.queueCondition:
+      while self.IsQueueFull(frame) and not self.isClosed:
+        self.queueCondition.wait()
+      if not self.isClosed:
+        self.EnqueueFrame(frame)
+    return
+
+  def SendFrameAndWait(self, frame):
+    with self.queueCondition:
+      if self.isClosed:
+        return
+      self.EnqueueFrame(frame)
+      frameNumber = self.queuedFramesCount
+      self.flushFramesCount = max(self.flushFramesCount, frameNumber)
+      self.queueCondition.notifyAll()
+      while self.writtenFramesCount < frameNumber and self.writerThread.is_alive():
+        self.queueCondition.wait(OUTPUT_FLUSH_POLL_INTERVAL_IN_SECONDS)
+    return
+
+  def SendLog(self, text):
+    frame = EncodeLogFrame(text)
+    with self.queueCondition:
+      if self.isClosed:
+        return
+      if self.IsQueueFull(frame):
+        if self.overflowPolicy == OUTPUT_OVERFLOW_POLICY_DROP:
+          self.droppedLogsCount += 1
+          return
+        elif self.overflowPolicy == OUTPUT_OVERFLOW_POLICY_SPILL and self.spillFilePath is not None:
+          self.SpillLog(text)
+          return
+        else:
+          while self.IsQueueFull(frame) and not self.isClosed:
+            self.queueCondition.wait()
+          if self.isClosed: # Closed while blocked; the message is dropped as any sent after closing.
+            return
+      self.EnqueueFrame(frame)
+    return
+
+  def SpillLog(self, text):
+    # NOTE: the caller must hold self.queueCondition.
+    try:
+      if self.spillWriter is None:
+        self.spillWriter = StreamWriter(self.spillFilePath, True, Encoding.UTF8)
+      self.spillWriter.WriteLine(text)
+      self.spilledLogsCount += 1
+    except Exception, e:
+      self.droppedLogsCount += 1
+    return
+
+  def GetOverflowSummaryFrames(self):
+    # NOTE: the caller must hold self.queueCondition.
+    frames = []
+    if self.droppedLogsCount > 0:
+      frames.append(EncodeLogFrame(
+          "WARNING: " + str(self.droppedLogsCount) + " script output message(s) were dropped " +
+          "because the output queue was full."
+        ))
+      self.droppedLogsCount = 0
+    if self.spilledLogsCount > 0:
+      self.spillWriter.Flush()
+      frames.append(EncodeLogFrame(
+          "WARNING: " + str(self.spilledLogsCount) + " script output message(s) were written to the spill file " +
+          "because the output queue was full: " + self.spillFilePath
+        ))
+      self.spilledLogsCount = 0
+    return frames
+
+  def TakeBatch(self):
+    # NOTE: the caller must hold self.queueCondition.
+    frames = []
+    batchSize = 0
+    while self.queuedFrames and (not frames or (batchSize + self.queuedFrames[0].Length) <= OUTPUT_BATCH_MAX_SIZE_IN_BYTES):
+      frame = self.queuedFrames.popleft()
+      frames.append(frame)
+      batchSize += frame.Length
+    self.queuedSize -= batchSize
+    if not self.queuedFrames:
+      # Overflow is reported once the queue has drained.
+      frames.extend(self.GetOverflowSummaryFrames())
+    self.queueCondition.notifyAll() # Wakes senders that are blocked on a full queue.
+    return frames
+
+  def WriteBatch(self, frames):
+    batch = Array.CreateInstance(Byte, sum(frame.Length for frame in frames))
+    offset = 0
+    for frame in frames:
+      Buffer.BlockCopy(frame, 0, batch, offset, frame.Length)
+      offset += frame.Length
+    try:
+      self.stream.Write(batch, 0, batch.Length)
+      self.stream.Flush()
+    except Exception, e:
+      pass # The monitor has closed the pipe. Keep draining the queue so that senders are not blocked.
+    return
+
+  def WriteQueuedFrames(self):
+    while True:
+      with self.queueCondition:
+        while not self.queuedFrames and not self.isClosed:
+          self.queueCondition.wait()
+        if not self.queuedFrames:
+          break
+        if (
+            self.queuedSize < OUTPUT_BATCH_MAX_SIZE_IN_BYTES and
+            self.writtenFramesCount >= self.flushFramesCount and
+            not self.isClosed
+          ):
+          self.queueCondition.wait(OUTPUT_BATCH_MAX_DELAY_IN_SECONDS) # Gives the sender time to fill the batch.
+        frames = self.TakeBatch()
+        takenFramesCount = self.queuedFramesCount - len(self.queuedFrames)
+      self.WriteBatch(frames)
+      with self.queueCondition:
+        self.writtenFramesCount = takenFramesCount
+        self.queueCondition.notifyAll() # Wakes senders that are waiting for their frame to be written.
+    return
+
+  def Close(self, timeOutInSeconds=OUTPUT_CLOSE_TIMEOUT_IN_SECONDS):
+    # Writes the frames that are still queued (waiting at most timeOutInSeconds) and stops the writer thread.
+    with self.queueCondition:
+      self.isClosed = True
+      self.queueCondition.notifyAll()
+    self.writerThread.join(timeOutInSeconds)
+    with self.queueCondition:
+      if self.spillWriter is not None:
+        self.spillWriter.Dispose()
+        self.spillWriter = None
+    return
+
+class MessageReader(object):
+  # Reads messages asynchronously. Has the same interface as monitor_process.ChunkedLineReader so that
+  # monitor_process.MonitorProcessEvents() can wait on it.
+  def __init__(self, stream, onMessage):
+    self.stream = stream
+    self.onMessage = onMessage
+    self.readBuffer = Array.CreateInstance(Byte, READ_BUFFER_SIZE)
+    self.frameDecoder = FrameDecoder()
+    self.reachedEndOfStream = False
+    self.pendingReadTask = self.BeginRead()
+    return
+
+  def BeginRead(self):
+    return self.stream.ReadAsync(self.readBuffer, 0, self.readBuffer.Length)
+
+  def GetPendingReadTask(self):
+    return self.pendingReadTask
+
+  def IsFinished(self):
+    return self.reachedEndOfStream
+
+  def DeliverCompleted(self):
+    while not self.reachedEndOfStream and self.pendingReadTask.IsCompleted:
+      if self.pendingReadTask.Status != TaskStatus.RanToCompletion or self.pendingReadTask.Result == 0:
+        self.reachedEndOfStream = True
+      else:
+        self.frameDecoder.Append(self.readBuffer, self.pendingReadTask.Result)
+        self.pendingReadTask = self.BeginRead()
+        for message in self.frameDecoder.DecodeMessages():
+          self.onMessage(message)
+    return
+
+def ReadMessages(stream, onMessage):
+  readBuffer = Array.CreateInstance(Byte, READ_BUFFER_SIZE)
+  frameDecoder = FrameDecoder()
+  while True:
+    count = stream.Read(readBuffer, 0, readBuffer.Length)
+    if count == 0:
+      break
+    frameDecoder.Append(readBuffer, count)
+    for message in frameDecoder.DecodeMessages():
+      onMessage(message)
+  return
+
+def StartHeartbeat(messageWriter, intervalInSeconds=HEARTBEAT_INTERVAL_IN_SECONDS):
+  # Sends heartbeats on a background thread until the returned event is set.
+  stopHeartbeat = threading.Event()
+  def beat():
+    while not stopHeartbeat.wait(intervalInSeconds):
+      try:
+        messageWriter.SendHeartbeat()
+      except Exception, e:
+        break # The stream was disposed.
+    return
+  heartbeatThread = threading.Thread(target=beat)
+  heartbeatThread.daemon = True
+  heartbeatThread.start()
+  return stopHeartbeat
+
+def StartMessageListener(stream, onMessage, onClosed=None):
+  # Reads messages on a background thread until the stream is closed. NOTE: onMessage and onClosed are called on that thread.
+  def listen():
+    try:
+      ReadMessages(stream, onMessage)
+    except Exception, e:
+      pass # The other end of the pipe has gone away, or the stream was disposed.
+    if onClosed is not None:
+      onClosed()
+    return
+  listenerThread = threading.Thread(target=listen)
+  listenerThread.daemon = True
+  listenerThread.start()
+  return listenerThread
@@ -46,3 +46,11 @@ def ToString(jobject, prettyPrint=False):
 def SerializeObject(pythonObject, prettyPrint=False):
   return ToString(ToJObject(pythonObject), prettyPrint)
 
+def ToPythonObject(jtoken):
+  # Converts a deserialized JSON object / array / value to the equivalent dict / list / value.
+  if isinstance(jtoken, JObject):
+    return dict((jproperty.Name, ToPythonObject(jproperty.Value)) for jproperty in jtoken.Properties())
+  elif isinstance(jtoken, JArray):
+    return [ToPythonObject(item) for item in jtoken]
+  return GetValueFromJValue(jtoken)
+
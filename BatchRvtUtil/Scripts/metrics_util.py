@@ -0,0 +1,63 @@
+#
+# Revit Batch Processor
+#
+# Copyright (c) 2017  Dan Rumery, BVN
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+
+
+import clr
+import System
+from System.IO import File, Path
+
+import threading
+
+import path_util
+import time_util
+import json_util
+
+METRICS_FILE_EXTENSION = ".metrics.jsonl"
+
+METRICS_FILE_PATH = [None] # Needs to be a list so it can be captured by reference in closures.
+METRICS_LOCK = threading.Lock()
+
+def GetMetricsFilePathForLogFilePath(logFilePath):
+  return Path.ChangeExtension(logFilePath, None) + METRICS_FILE_EXTENSION
+
+def InitializeMetrics(metricsFilePath):
+  METRICS_FILE_PATH[0] = metricsFilePath
+  return
+
+def GetMetricsFilePath():
+  return METRICS_FILE_PATH[0]
+
+def EmitMetric(metricName, metricData):
+  metricsFilePath = GetMetricsFilePath()
+  if not str.IsNullOrWhiteSpace(metricsFilePath):
+    metric = {
+        "timestamp" : time_util.GetTimestampObject(time_util.GetDateTimeNow()),
+        "metric" : metricName,
+        "data" : metricData
+      }
+    line = json_util.SerializeObject(metric) + "\n"
+    with METRICS_LOCK:
+      try:
+        path_util.CreateDirectoryForFilePath(metricsFilePath)
+        File.AppendAllText(metricsFilePath, line)
+      except Exception, e:
+        pass # NOTE: metrics are best-effort; they must never interrupt the batch operation.
+  return
+
@@ -20,13 +20,21 @@
 
 import clr
 import System
+import heapq
 
 clr.AddReference("System.Windows.Forms")
 import System.Windows.Forms as WinForms
 
+from System import Array, Char, String
+from System.Diagnostics import Stopwatch
+from System.Threading import Timeout
+from System.Threading.Tasks import Task, TaskCompletionSource, TaskStatus
+
 import thread_util
 import time_util
 
+PROCESS_EXIT_DRAIN_TIMEOUT_IN_SECONDS = 2
+READ_CHUNK_SIZE_IN_CHARS = 64 * 1024
 
 def IsProcessResponding(process):
   isResponding = False
@@ -36,6 +44,43 @@ def IsProcessResponding(process):
     pass
   return isResponding
 
+class ProcessResponsivenessTracker(object):
+  def __init__(self, unresponsiveThreshholdInSeconds, onBeginUnresponsive, onEndUnresponsive):
+    self.unresponsiveThreshholdInSeconds = unresponsiveThreshholdInSeconds
+    self.onBeginUnresponsive = onBeginUnresponsive
+    self.onEndUnresponsive = onEndUnresponsive
+    self.isResponding = True
+    self.unresponsiveStartTime = None
+    self.haveNotifiedBeginUnresponsive = False
+    return
+
+  def Update(self, process):
+    wasResponding = self.isResponding
+    self.isResponding = IsProcessResponding(process)
+
+    if wasResponding and not self.isResponding: # responsive -> unresponsive
+      self.unresponsiveStartTime = time_util.GetDateTimeNow()
+      self.haveNotifiedBeginUnresponsive = False
+
+    elif self.isResponding and not wasResponding: # unresponsive -> responsive
+      if self.haveNotifiedBeginUnresponsive: # notify end of unresponsiveness
+        self.onEndUnresponsive(time_util.GetSecondsElapsedSince(self.unresponsiveStartTime))
+        self.haveNotifiedBeginUnresponsive = False
+
+    elif not self.isResponding and not wasResponding: # continuing unresponsiveness
+      if not self.haveNotifiedBeginUnresponsive: # notify unresponsiveness beyond threshold
+        if time_util.GetSecondsElapsedSince(self.unresponsiveStartTime) >= self.unresponsiveThreshholdInSeconds:
+          self.onBeginUnresponsive()
+          self.haveNotifiedBeginUnresponsive = True
+    return
+
+  def Finish(self):
+    # Was notified of beginning of unresponsiveness, therefore need to notify end of unresponsiveness.
+    if self.haveNotifiedBeginUnresponsive:
+      self.onEndUnresponsive(time_util.GetSecondsElapsedSince(self.unresponsiveStartTime))
+      self.haveNotifiedBeginUnresponsive = False
+    return
+
 def MonitorProcess(
     process,
     monitoringAction,
@@ -45,32 +90,17 @@ def MonitorProcess(
     onEndUnresponsive
   ):
 
-  wasResponding = True
-  isResponding = True
-  unresponsiveStartTime = None
-  haveNotifiedBeginUnresponsive = False
+  responsivenessTracker = ProcessResponsivenessTracker(
+      unresponsiveThreshholdInSeconds,
+      onBeginUnresponsive,
+      onEndUnresponsive
+    )
 
   process.Refresh()
 
   while not process.HasExited:
 
-    wasResponding = isResponding
-    isResponding = IsProcessResponding(process)
-
-    if wasResponding and not isResponding: # responsive -> unresponsive
-      unresponsiveStartTime = time_util.GetDateTimeNow()
-      haveNotifiedBeginUnresponsive = False
-
-    elif isResponding and not wasResponding: # unresponsive -> responsive
-      if haveNotifiedBeginUnresponsive: # notify end of unresponsiveness
-        onEndUnresponsive(time_util.GetSecondsElapsedSince(unresponsiveStartTime))
-        haveNotifiedBeginUnresponsive = False
-
-    elif not isResponding and not wasResponding: # continuing unresponsiveness
-      if not haveNotifiedBeginUnresponsive: # notify unresponsiveness beyond threshold
-        if time_util.GetSecondsElapsedSince(unresponsiveStartTime) >= unresponsiveThreshholdInSeconds:
-          onBeginUnresponsive()
-          haveNotifiedBeginUnresponsive = True
+    responsivenessTracker.Update(process)
 
     thread_util.SleepForSeconds(monitorIntervalInSeconds)
     
@@ -80,10 +110,178 @@ def MonitorProcess(
 
     process.Refresh()
 
-  # Was notified of beginning of unresponsiveness, therefore need to notify end of unresponsiveness.
-  if haveNotifiedBeginUnresponsive:
-    onEndUnresponsive(time_util.GetSecondsElapsedSince(unresponsiveStartTime))
-    haveNotifiedBeginUnresponsive = False
+  responsivenessTracker.Finish()
+
+  return
+
+class PeriodicTimerQueue(object):
+  # Timers are kept in a heap ordered by due time, so the monitor can block until the earliest one is due.
+  # An action may return the number of seconds until it is next due (otherwise its interval is used).
+  def __init__(self):
+    self.stopwatch = Stopwatch.StartNew()
+    self.dueTimers = []
+    self.timersCount = 0
+    return
+
+  def GetElapsedSeconds(self):
+    return self.stopwatch.Elapsed.TotalSeconds
+
+  def AddTimer(self, intervalInSeconds, action):
+    self.timersCount += 1
+    heapq.heappush(
+        self.dueTimers,
+        (self.GetElapsedSeconds() + intervalInSeconds, self.timersCount, intervalInSeconds, action)
+      )
+    return
+
+  def GetMillisecondsUntilNextDue(self):
+    if not self.dueTimers:
+      return Timeout.Infinite
+    dueTime = self.dueTimers[0][0]
+    return max(int((dueTime - self.GetElapsedSeconds()) * 1000), 0)
+
+  def RunDueTimers(self):
+    while self.dueTimers and self.dueTimers[0][0] <= self.GetElapsedSeconds():
+      dueTime, timerNumber, intervalInSeconds, action = heapq.heappop(self.dueTimers)
+      nextDueInSeconds = None
+      try:
+        nextDueInSeconds = action()
+      finally:
+        # Rescheduled relative to now so that a slow action does not cause a burst of catch-up runs.
+        heapq.heappush(
+            self.dueTimers,
+            (
+              self.GetElapsedSeconds() + (nextDueInSeconds if nextDueInSeconds is not None else intervalInSeconds),
+              timerNumber,
+              intervalInSeconds,
+              action
+            )
+          )
+    return
+
+class ChunkedLineReader(object):
+  # Reads a stream in large chunks and splits them into lines in bulk, passing each batch of lines to onLines.
+  # Readers passed to MonitorProcessEvents() provide GetPendingReadTask(), IsFinished() and DeliverCompleted()
+  # (see also ipc_protocol.MessageReader).
+  def __init__(self, streamReader, onLines):
+    self.streamReader = streamReader
+    self.onLines = onLines
+    self.readBuffer = Array.CreateInstance(Char, READ_CHUNK_SIZE_IN_CHARS)
+    self.partialLine = ""
+    self.reachedEndOfStream = False
+    self.pendingReadTask = self.BeginRead()
+    return
+
+  def BeginRead(self):
+    return self.streamReader.ReadAsync(self.readBuffer, 0, self.readBuffer.Length)
+
+  def GetPendingReadTask(self):
+    return self.pendingReadTask
+
+  def IsFinished(self):
+    return self.reachedEndOfStream
+
+  def DeliverCompleted(self):
+    # Delivers every line that is already buffered, leaving a new read pending on the stream.
+    while not self.reachedEndOfStream and self.pendingReadTask.IsCompleted:
+      if self.pendingReadTask.Status != TaskStatus.RanToCompletion or self.pendingReadTask.Result == 0:
+        self.reachedEndOfStream = True
+        if self.partialLine != "":
+          self.onLines([self.partialLine])
+          self.partialLine = ""
+      else:
+        text = self.partialLine + String(self.readBuffer, 0, self.pendingReadTask.Result)
+        self.pendingReadTask = self.BeginRead()
+        lines = text.split("\n")
+        self.partialLine = lines.pop() # The text after the last line break (if any) is carried over to the next chunk.
+        if lines:
+          self.onLines([line[:-1] if line.endswith("\r") else line for line in lines])
+    return
 
+def WaitForProcessEvent(exitedTask, streamReaders, timeoutInMilliseconds):
+  tasks = [exitedTask] + [
+      streamReader.GetPendingReadTask()
+      for streamReader in streamReaders
+      if not streamReader.IsFinished()
+    ]
+  Task.WaitAny(Array[Task](tasks), timeoutInMilliseconds)
   return
 
+def DrainStreamReaders(streamReaders, timeoutInSeconds):
+  stopwatch = Stopwatch.StartNew()
+  for streamReader in streamReaders:
+    streamReader.DeliverCompleted()
+  while True:
+    pendingTasks = [
+        streamReader.GetPendingReadTask()
+        for streamReader in streamReaders
+        if not streamReader.IsFinished()
+      ]
+    remainingMilliseconds = int((timeoutInSeconds - stopwatch.Elapsed.TotalSeconds) * 1000)
+    if not pendingTasks or remainingMilliseconds <= 0:
+      break
+    if Task.WaitAny(Array[Task](pendingTasks), remainingMilliseconds) == -1:
+      break
+    for streamReader in streamReaders:
+      streamReader.DeliverCompleted()
+  return
+
+def MonitorProcessEvents(
+    process,
+    streamReaders,
+    periodicActions,
+    responsivenessCheckIntervalInSeconds,
+    unresponsiveThreshholdInSeconds,
+    onBeginUnresponsive,
+    onEndUnresponsive
+  ):
+  # Event-driven counterpart of MonitorProcess(). Blocks until the process exits, a line is read from one of the
+  # streams or a periodic action is due, rather than waking up at a fixed interval.
+  # streamReaders is a list of readers (e.g. ChunkedLineReader); periodicActions is a list of (intervalInSeconds, action) pairs.
+  # All handlers and actions are invoked on the calling thread.
+  responsivenessTracker = ProcessResponsivenessTracker(
+      unresponsiveThreshholdInSeconds,
+      onBeginUnresponsive,
+      onEndUnresponsive
+    )
+
+  def checkResponsiveness():
+    WinForms.Application.DoEvents()
+    process.Refresh()
+    responsivenessTracker.Update(process)
+    return
+
+  timerQueue = PeriodicTimerQueue()
+  timerQueue.AddTimer(responsivenessCheckIntervalInSeconds, checkResponsiveness)
+  for intervalInSeconds, action in periodicActions:
+    timerQueue.AddTimer(intervalInSeconds, action)
+
+  processExited = TaskCompletionSource[bool]()
+
+  def onProcessExited(sender, args):
+    processExited.TrySetResult(True)
+    return
+
+  process.EnableRaisingEvents = True
+  process.Exited += onProcessExited
+
+  try:
+    # The process may have exited before the Exited event handler was attached.
+    process.Refresh()
+    if process.HasExited:
+      processExited.TrySetResult(True)
+
+    while not processExited.Task.IsCompleted:
+      WaitForProcessEvent(processExited.Task, streamReaders, timerQueue.GetMillisecondsUntilNextDue())
+      for streamReader in streamReaders:
+        streamReader.DeliverCompleted()
+      timerQueue.RunDueTimers()
+
+    # Deliver any output written just before the process exited.
+    DrainStreamReaders(streamReaders, PROCESS_EXIT_DRAIN_TIMEOUT_IN_SECONDS)
+  finally:
+    process.Exited -= onProcessExited
+
+  responsivenessTracker.Finish()
+
+  return
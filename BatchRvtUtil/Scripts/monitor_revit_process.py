@@ -24,7 +24,7 @@ import System
 import monitor_process
 import global_test_mode
 
-MONITOR_INTERVAL_IN_SECONDS = 0.25
+RESPONSIVENESS_CHECK_INTERVAL_IN_SECONDS = 1
 UNRESPONSIVE_THRESHHOLD_IN_SECONDS = 10
 
 REVIT_BUSY_HANDLER_PREFIX = "[ REVIT BUSY MONITOR ]"
@@ -45,17 +45,18 @@ def OnEndUnresponsive(unresponsiveTimeInSeconds, output):
   output()
   return
 
-def MonitorHostRevitProcess(hostRevitProcess, monitoringAction, output):
+def MonitorHostRevitProcess(hostRevitProcess, streamReaders, periodicActions, output):
   output()
   output("Monitoring host Revit process (PID: " + str(hostRevitProcess.Id) + ")")
   output()
 
   busyOutput = global_test_mode.PrefixedOutputForGlobalTestMode(output, REVIT_BUSY_HANDLER_PREFIX)
 
-  monitor_process.MonitorProcess(
+  monitor_process.MonitorProcessEvents(
       hostRevitProcess,
-      monitoringAction,
-      MONITOR_INTERVAL_IN_SECONDS,
+      streamReaders,
+      periodicActions,
+      RESPONSIVENESS_CHECK_INTERVAL_IN_SECONDS,
       UNRESPONSIVE_THRESHHOLD_IN_SECONDS,
       lambda: OnBeginUnresponsive(busyOutput),
       lambda unresponsiveTimeInSeconds: OnEndUnresponsive(unresponsiveTimeInSeconds, busyOutput)
@@ -64,7 +65,5 @@ def MonitorHostRevitProcess(hostRevitProcess, monitoringAction, output):
   output()
   output("Revit process (PID: " + str(hostRevitProcess.Id) + ") has exited!")
 
-  # TODO: do something with last pending read line task if it exists?
-
   return
 
@@ -28,9 +28,23 @@ import win32_mpr
 
 import sys
 
+def NormalizeSearchPath(searchPath):
+  normalizedSearchPath = None
+  if isinstance(searchPath, str) and not str.IsNullOrWhiteSpace(searchPath):
+    try:
+      normalizedSearchPath = Path.GetFullPath(searchPath).TrimEnd(Path.DirectorySeparatorChar).ToLower()
+    except Exception, e:
+      normalizedSearchPath = None
+  return normalizedSearchPath
+
 def AddSearchPath(searchPath):
-  # TODO: only add the path if it's not already added.
-  sys.path.append(searchPath)
+  normalizedSearchPath = NormalizeSearchPath(searchPath)
+  isAlreadyAdded = normalizedSearchPath is not None and any(
+      NormalizeSearchPath(existingSearchPath) == normalizedSearchPath
+      for existingSearchPath in sys.path
+    )
+  if not isAlreadyAdded:
+    sys.path.append(searchPath)
   return
 
 def GetUserDesktopFolderPath():
@@ -58,6 +72,10 @@ def CreateDirectory(folderPath):
   directoryInfo = Directory.CreateDirectory(folderPath)
   return directoryInfo
 
+def GetSafeFileName(name):
+  invalidFileNameChars = Path.GetInvalidFileNameChars()
+  return str.Join("", [("_" if c in invalidFileNameChars else c) for c in name])
+
 def CreateDirectoryForFilePath(filePath):
   directoryInfo = CreateDirectory(Path.GetDirectoryName(filePath))
   return directoryInfo
@@ -0,0 +1,146 @@
+#
+# Revit Batch Processor
+#
+# Copyright (c) 2017  Dan Rumery, BVN
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+
+
+import clr
+import System
+from System.IO import File, Path
+
+import threading
+
+import time_util
+import json_util
+import text_file_util
+import batch_rvt_util
+from batch_rvt_util import BatchRvt
+
+PROCESSING_HISTORY_FILENAME = "BatchRvt.ProcessingHistory.json"
+
+# Weight given to the most recent duration when updating a file's (exponentially smoothed) duration.
+DURATION_SMOOTHING_FACTOR = 0.5
+
+# Used when there is no history at all to estimate from.
+DEFAULT_FILE_PROCESSING_SECONDS = 60.0
+
+BYTES_PER_MEGABYTE = 1024 * 1024
+
+ESTIMATE_SOURCE_FILE_HISTORY = "fileHistory"
+ESTIMATE_SOURCE_SIZE_RATE = "sizeRate"
+ESTIMATE_SOURCE_DEFAULT = "default"
+
+HISTORY__FILES = "files"
+HISTORY__REVIT_FILE_PATH = "revitFilePath"
+HISTORY__DURATION_SECONDS = "durationSeconds"
+HISTORY__FILE_SIZE = "fileSize"
+HISTORY__RUN_COUNT = "runCount"
+HISTORY__LAST_PROCESSED = "lastProcessed"
+
+def GetProcessingHistoryFilePath():
+  return Path.Combine(BatchRvt.GetDataFolderPath(), PROCESSING_HISTORY_FILENAME)
+
+def GetHistoryKey(revitFilePath):
+  return revitFilePath.ToLowerInvariant()
+
+class ProcessingHistory:
+  def __init__(self, historyFilePath):
+    self.historyFilePath = historyFilePath
+    self.lock = threading.Lock()
+    self.entries = {}
+    self.secondsPerByte = None
+    return
+
+  def Load(self):
+    entries = {}
+    if File.Exists(self.historyFilePath):
+      try:
+        history = json_util.DeserializeToJObject(text_file_util.ReadFromTextFile(self.historyFilePath))
+        for fileEntry in history[HISTORY__FILES]:
+          revitFilePath = json_util.GetValueFromJValue(fileEntry[HISTORY__REVIT_FILE_PATH])
+          entries[GetHistoryKey(revitFilePath)] = {
+              HISTORY__REVIT_FILE_PATH : revitFilePath,
+              HISTORY__DURATION_SECONDS : float(json_util.GetValueFromJValue(fileEntry[HISTORY__DURATION_SECONDS])),
+              HISTORY__FILE_SIZE : json_util.GetValueFromJValue(fileEntry[HISTORY__FILE_SIZE]),
+              HISTORY__RUN_COUNT : int(json_util.GetValueFromJValue(fileEntry[HISTORY__RUN_COUNT])),
+              HISTORY__LAST_PROCESSED : json_util.GetValueFromJValue(fileEntry[HISTORY__LAST_PROCESSED])
+            }
+      except Exception, e:
+        entries = {} # A corrupt history file is simply discarded.
+    with self.lock:
+      self.entries = entries
+      self.secondsPerByte = None
+    return
+
+  def Save(self):
+    with self.lock:
+      history = { HISTORY__FILES : list(self.entries.values()) }
+    text_file_util.WriteToTextFile(self.historyFilePath, json_util.SerializeObject(history))
+    return
+
+  def RecordFileDuration(self, revitFilePath, fileSize, durationSeconds):
+    key = GetHistoryKey(revitFilePath)
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is None:
+        entry = {
+            HISTORY__REVIT_FILE_PATH : revitFilePath,
+            HISTORY__DURATION_SECONDS : durationSeconds,
+            HISTORY__RUN_COUNT : 0
+          }
+        self.entries[key] = entry
+      else:
+        entry[HISTORY__DURATION_SECONDS] = (
+            DURATION_SMOOTHING_FACTOR * durationSeconds +
+            (1.0 - DURATION_SMOOTHING_FACTOR) * entry[HISTORY__DURATION_SECONDS]
+          )
+      entry[HISTORY__FILE_SIZE] = fileSize
+      entry[HISTORY__RUN_COUNT] += 1
+      entry[HISTORY__LAST_PROCESSED] = time_util.GetISO8601FormattedUtcDate(time_util.GetDateTimeUtcNow())
+      self.secondsPerByte = None
+    return
+
+  def TryGetFileDuration(self, revitFilePath):
+    with self.lock:
+      entry = self.entries.get(GetHistoryKey(revitFilePath))
+    return entry[HISTORY__DURATION_SECONDS] if entry is not None else None
+
+  def GetSecondsPerByte(self):
+    # Overall processing rate across all files in the history, used for files that have never been processed.
+    with self.lock:
+      if self.secondsPerByte is None:
+        sizedEntries = [entry for entry in self.entries.values() if entry.get(HISTORY__FILE_SIZE)]
+        totalBytes = sum(entry[HISTORY__FILE_SIZE] for entry in sizedEntries)
+        if totalBytes > 0:
+          self.secondsPerByte = sum(entry[HISTORY__DURATION_SECONDS] for entry in sizedEntries) / float(totalBytes)
+      secondsPerByte = self.secondsPerByte
+    return secondsPerByte
+
+  def EstimateFileDuration(self, revitFilePath, fileSize):
+    durationSeconds = self.TryGetFileDuration(revitFilePath)
+    if durationSeconds is not None:
+      return durationSeconds, ESTIMATE_SOURCE_FILE_HISTORY
+    secondsPerByte = self.GetSecondsPerByte()
+    if secondsPerByte is not None and fileSize is not None:
+      return secondsPerByte * fileSize, ESTIMATE_SOURCE_SIZE_RATE
+    return DEFAULT_FILE_PROCESSING_SECONDS, ESTIMATE_SOURCE_DEFAULT
+
+def LoadProcessingHistory():
+  processingHistory = ProcessingHistory(GetProcessingHistoryFilePath())
+  processingHistory.Load()
+  return processingHistory
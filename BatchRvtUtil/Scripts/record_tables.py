@@ -0,0 +1,196 @@
+#
+# Revit Batch Processor
+#
+# Copyright (c) 2017  Dan Rumery, BVN
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+
+
+import clr
+import System
+from System.IO import File, Directory, Path
+from System.Text import StringBuilder
+
+import threading
+
+import path_util
+import json_util
+import text_file_util
+
+# Run-level record tables. Task scripts emit records (revit_script_util.EmitRecord()), which are streamed to the
+# monitor over the script output pipe and appended to one JSON Lines file per table in the run's records folder.
+# Records are buffered and written in batches rather than one file write per record. Post-processing scripts read the
+# tables back with script_util.GetRecordTableNames() / script_util.ReadRecords().
+#
+# Table file names are sanitized table names, so the records folder also holds an index from each table name to its
+# file. A table name that sanitizes to the file of another table is rejected rather than merged into that table.
+
+RECORDS_FOLDER_SUFFIX = ".records"
+RECORD_TABLE_FILE_EXTENSION = ".jsonl"
+RECORD_TABLES_INDEX_FILENAME = "tables.json"
+RECORDS_BUFFER_MAX_SIZE_IN_CHARS = 1024 * 1024
+
+RECORDS_FOLDER_PATH = [None] # Needs to be a list so it can be captured by reference in closures.
+RECORDS_BUFFERS = {} # Table name -> StringBuilder of JSON lines not yet written.
+RECORDS_BUFFERED_SIZE_IN_CHARS = [0] # As above.
+RECORD_TABLE_FILE_NAMES = {} # Table name -> table file name.
+REJECTED_TABLE_NAMES = set()
+RECORDS_LOCK = threading.Lock()
+RECORDS_WRITE_LOCK = threading.Lock() # Held while writing, so that concurrent flushes append to a table in order.
+
+def GetRecordsFolderPathForLogFilePath(logFilePath):
+  return Path.ChangeExtension(logFilePath, None) + RECORDS_FOLDER_SUFFIX
+
+def InitializeRecordTables(recordsFolderPath):
+  RECORDS_FOLDER_PATH[0] = recordsFolderPath
+  return
+
+def GetRecordsFolderPath():
+  return RECORDS_FOLDER_PATH[0]
+
+def GetRecordTableFileName(tableName):
+  return path_util.GetSafeFileName(tableName) + RECORD_TABLE_FILE_EXTENSION
+
+def GetRecordTablesIndexFilePath(recordsFolderPath):
+  return Path.Combine(recordsFolderPath, RECORD_TABLES_INDEX_FILENAME)
+
+def ReadRecordTablesIndex(recordsFolderPath):
+  # Returns the table file name of each table name.
+  recordTablesIndex = {}
+  indexFilePath = GetRecordTablesIndexFilePath(recordsFolderPath)
+  if File.Exists(indexFilePath):
+    recordTablesIndex = json_util.ToPythonObject(
+        json_util.DeserializeToJObject(text_file_util.ReadFromTextFile(indexFilePath))
+      )
+  return recordTablesIndex
+
+def GetRecordTableFilePath(recordsFolderPath, tableName):
+  tableFileName = ReadRecordTablesIndex(recordsFolderPath).get(tableName)
+  if tableFileName is None:
+    tableFileName = GetRecordTableFileName(tableName)
+  return Path.Combine(recordsFolderPath, tableFileName)
+
+def RegisterRecordTable(tableName, output):
+  # Returns False if the table name sanitizes to the file of a different table name (file names are compared ignoring
+  # case, as on Windows).
+  # NOTE: the caller must hold RECORDS_LOCK.
+  if tableName in RECORD_TABLE_FILE_NAMES:
+    return True
+  tableFileName = GetRecordTableFileName(tableName)
+  if tableFileName.lower() in [usedTableFileName.lower() for usedTableFileName in RECORD_TABLE_FILE_NAMES.values()]:
+    if tableName not in REJECTED_TABLE_NAMES:
+      REJECTED_TABLE_NAMES.add(tableName)
+      if output is not None:
+        output()
+        output(
+            "WARNING: records for table '" + tableName + "' are dropped because its name maps to the same file " +
+            "(" + tableFileName + ") as another table's name. Use a different table name."
+          )
+    return False
+  RECORD_TABLE_FILE_NAMES[tableName] = tableFileName
+  return True
+
+def AppendRecord(tableName, recordText, output=None):
+  # recordText is the record as compact JSON (as sent by the script host), so it is written without re-serializing.
+  shouldFlush = False
+  with RECORDS_LOCK:
+    if not RegisterRecordTable(tableName, output):
+      return
+    recordsBuffer = RECORDS_BUFFERS.get(tableName)
+    if recordsBuffer is None:
+      recordsBuffer = StringBuilder()
+      RECORDS_BUFFERS[tableName] = recordsBuffer
+    recordsBuffer.Append(recordText).Append("\n")
+    RECORDS_BUFFERED_SIZE_IN_CHARS[0] += len(recordText) + 1
+    shouldFlush = RECORDS_BUFFERED_SIZE_IN_CHARS[0] >= RECORDS_BUFFER_MAX_SIZE_IN_CHARS
+  if shouldFlush:
+    FlushRecordTables()
+  return
+
+def RestoreRecords(tableName, recordsText):
+  # Puts records that could not be written back in front of the table's buffer, so they are written by the next flush.
+  # NOTE: the caller must hold RECORDS_LOCK.
+  recordsBuffer = StringBuilder(recordsText)
+  newerRecordsBuffer = RECORDS_BUFFERS.get(tableName)
+  if newerRecordsBuffer is not None:
+    recordsBuffer.Append(newerRecordsBuffer.ToString())
+  RECORDS_BUFFERS[tableName] = recordsBuffer
+  RECORDS_BUFFERED_SIZE_IN_CHARS[0] += len(recordsText)
+  return
+
+def FlushRecordTables(output=None):
+  recordsFolderPath = GetRecordsFolderPath()
+  if str.IsNullOrWhiteSpace(recordsFolderPath):
+    return
+  with RECORDS_WRITE_LOCK:
+    with RECORDS_LOCK:
+      recordsBuffers = [(tableName, recordsBuffer) for tableName, recordsBuffer in RECORDS_BUFFERS.items()]
+      RECORDS_BUFFERS.clear()
+      RECORDS_BUFFERED_SIZE_IN_CHARS[0] = 0
+      recordTableFileNames = dict(RECORD_TABLE_FILE_NAMES)
+    if len(recordsBuffers) > 0:
+      try:
+        path_util.CreateDirectory(recordsFolderPath)
+        text_file_util.WriteToTextFile(
+            GetRecordTablesIndexFilePath(recordsFolderPath),
+            json_util.SerializeObject(recordTableFileNames, True)
+          )
+      except Exception, e:
+        if output is not None:
+          output()
+          output("WARNING: failed to write the record tables index! It will be retried on the next flush.")
+    for tableName, recordsBuffer in recordsBuffers:
+      recordsText = recordsBuffer.ToString()
+      try:
+        path_util.CreateDirectory(recordsFolderPath)
+        File.AppendAllText(Path.Combine(recordsFolderPath, recordTableFileNames[tableName]), recordsText)
+      except Exception, e:
+        with RECORDS_LOCK:
+          RestoreRecords(tableName, recordsText)
+        if output is not None:
+          output()
+          output("WARNING: failed to write records to table '" + tableName + "'! They will be retried on the next flush.")
+  return
+
+def GetRecordTableNames(recordsFolderPath):
+  # Returns the table names that were passed to EmitRecord(), as recorded in the index. Table files that are not in the
+  # index are listed by their file name.
+  tableNames = []
+  if not str.IsNullOrWhiteSpace(recordsFolderPath) and Directory.Exists(recordsFolderPath):
+    recordTablesIndex = ReadRecordTablesIndex(recordsFolderPath)
+    tableFileNames = [
+        Path.GetFileName(tableFilePath)
+        for tableFilePath in Directory.GetFiles(recordsFolderPath, "*" + RECORD_TABLE_FILE_EXTENSION)
+      ]
+    tableNames = sorted(
+        [tableName for tableName, tableFileName in recordTablesIndex.items() if tableFileName in tableFileNames] +
+        [
+          Path.GetFileNameWithoutExtension(tableFileName)
+          for tableFileName in tableFileNames
+          if tableFileName not in recordTablesIndex.values()
+        ]
+      )
+  return tableNames
+
+def ReadRecords(recordsFolderPath, tableName):
+  # Yields each record of the table as a dict. Records are read one line at a time, so large tables are not loaded
+  # into memory at once.
+  tableFilePath = GetRecordTableFilePath(recordsFolderPath, tableName)
+  if File.Exists(tableFilePath):
+    for line in File.ReadLines(tableFilePath):
+      if not str.IsNullOrWhiteSpace(line):
+        yield json_util.ToPythonObject(json_util.DeserializeToJObject(line))
+  return
@@ -0,0 +1,147 @@
+#
+# Revit Batch Processor
+#
+# Copyright (c) 2017  Dan Rumery, BVN
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+
+
+import clr
+import System
+
+# Sampling reads a handful of counters for a single process (one Process.Refresh() per sample), which is cheap enough
+# at this interval to leave on for every run.
+DEFAULT_SAMPLE_INTERVAL_IN_SECONDS = 5
+
+FILE_RESOURCE_USAGE_METRIC = "revitFileResourceUsage"
+SESSION_RESOURCE_USAGE_METRIC = "revitSessionResourceUsage"
+
+def GetSampleIntervalInSeconds(sampleIntervalInSecondsSetting):
+  # 0 (i.e. not set) means the default interval; a negative value turns sampling off.
+  if sampleIntervalInSecondsSetting < 0:
+    return None
+  elif sampleIntervalInSecondsSetting == 0:
+    return DEFAULT_SAMPLE_INTERVAL_IN_SECONDS
+  return sampleIntervalInSecondsSetting
+
+class ResourceSample:
+  def __init__(self, workingSet, privateBytes, processorTimeInSeconds, handleCount):
+    self.WorkingSet = workingSet
+    self.PrivateBytes = privateBytes
+    self.ProcessorTimeInSeconds = processorTimeInSeconds
+    self.HandleCount = handleCount
+    return
+
+def TakeResourceSample(process):
+  sample = None
+  try:
+    process.Refresh()
+    sample = ResourceSample(
+        process.WorkingSet64,
+        process.PrivateMemorySize64,
+        process.TotalProcessorTime.TotalSeconds,
+        process.HandleCount
+      )
+  except Exception, e:
+    pass # The process has exited.
+  return sample
+
+class ResourceUsage:
+  # Peaks and deltas over a run of samples. The first sample is the baseline (i.e. the last sample of whatever came before).
+  def __init__(self, firstSample, phase):
+    self.firstSample = firstSample
+    self.lastSample = firstSample
+    self.samplesCount = 0
+    self.peakWorkingSet = firstSample.WorkingSet
+    self.peakWorkingSetPhase = phase
+    self.peakPrivateBytes = firstSample.PrivateBytes
+    self.peakHandleCount = firstSample.HandleCount
+    return
+
+  def AddSample(self, sample, phase):
+    self.lastSample = sample
+    self.samplesCount += 1
+    if sample.WorkingSet > self.peakWorkingSet:
+      self.peakWorkingSet = sample.WorkingSet
+      self.peakWorkingSetPhase = phase
+    self.peakPrivateBytes = max(self.peakPrivateBytes, sample.PrivateBytes)
+    self.peakHandleCount = max(self.peakHandleCount, sample.HandleCount)
+    return
+
+  def GetPeakWorkingSet(self):
+    return self.peakWorkingSet
+
+  def ToData(self):
+    return {
+        "samplesCount" : self.samplesCount,
+        "peakWorkingSetBytes" : self.peakWorkingSet,
+        "peakWorkingSetPhase" : self.peakWorkingSetPhase,
+        "peakPrivateBytes" : self.peakPrivateBytes,
+        "peakHandleCount" : self.peakHandleCount,
+        "workingSetDeltaBytes" : self.lastSample.WorkingSet - self.firstSample.WorkingSet,
+        "privateBytesDelta" : self.lastSample.PrivateBytes - self.firstSample.PrivateBytes,
+        "handleCountDelta" : self.lastSample.HandleCount - self.firstSample.HandleCount,
+        "processorTimeSeconds" : self.lastSample.ProcessorTimeInSeconds - self.firstSample.ProcessorTimeInSeconds
+      }
+
+class ResourceSampler:
+  # Samples the host Revit process and attributes each sample to the session and to the file being processed (as
+  # reported by the script host's progress messages). A file's usage runs from its progress message to the next one
+  # (or the end of the session), so it includes opening, closing and exporting as well as the task itself.
+  def __init__(self, process):
+    self.process = process
+    self.phase = None
+    self.lastSample = None
+    self.sessionUsage = None
+    self.currentProgressNumber = None
+    self.fileUsages = {}
+    return
+
+  def Sample(self):
+    sample = TakeResourceSample(self.process)
+    if sample is not None:
+      self.lastSample = sample
+      if self.sessionUsage is None:
+        self.sessionUsage = ResourceUsage(sample, self.phase)
+      self.sessionUsage.AddSample(sample, self.phase)
+      fileUsage = self.fileUsages.get(self.currentProgressNumber)
+      if fileUsage is not None:
+        fileUsage.AddSample(sample, self.phase)
+    return
+
+  def OnPhase(self, phase):
+    self.phase = phase
+    return
+
+  def OnFileStarted(self, progressNumber):
+    # The sample taken here ends the previous file and is the baseline of this one.
+    self.Sample()
+    self.currentProgressNumber = progressNumber
+    if self.lastSample is not None:
+      self.fileUsages[progressNumber] = ResourceUsage(self.lastSample, self.phase)
+    return
+
+  def Finish(self):
+    self.Sample()
+    self.currentProgressNumber = None
+    return
+
+  def GetSessionUsage(self):
+    return self.sessionUsage
+
+  def GetFileUsages(self):
+    # Returns (progressNumber, ResourceUsage) pairs.
+    return sorted(self.fileUsages.items())
@@ -27,6 +27,8 @@ import text_file_util
 import console_util
 import path_util
 import revit_file_version
+import revit_file_metadata_cache
+import revit_file_priority
 import batch_rvt_util
 from batch_rvt_util import RevitVersion
 
@@ -44,6 +46,14 @@ def FirstOrDefault(items, default=None):
 def GetCentralFileListFromRows(rows):
   return GetNonEmptyTrimmedTextValues(FirstOrDefault(row) for row in rows)
 
+def GetCentralFileListWithPrioritiesFromRows(rows):
+  # The optional second column of a Revit file list row is the file's priority.
+  return list(
+      (FirstOrDefault(row).Trim(), revit_file_priority.TryParsePriority(FirstOrDefault(list(row)[1:])))
+      for row in rows
+      if not str.IsNullOrWhiteSpace(FirstOrDefault(row))
+    )
+
 def FromTextFile(textFilePath):
   rows = text_file_util.GetRowsFromTextFile(textFilePath)
   return GetCentralFileListFromRows(rows)
@@ -99,7 +109,10 @@ class RevitFileInfo():
   def TryGetRevitVersionText(self):
     revitVersionText = None
     try:
-      revitVersionText = revit_file_version.GetRevitVersionText(self.revitFilePath)
+      revitVersionText = revit_file_metadata_cache.GetRevitVersionText(
+          self.revitFilePath,
+          lambda: revit_file_version.GetRevitVersionText(self.revitFilePath)
+        )
     except Exception, e:
       pass
     return revitVersionText
@@ -115,6 +128,17 @@ def GetRevitFileList(settingsFilePath):
     revitFileList = FromExcelFile(settingsFilePath)
   return revitFileList
 
+def GetRevitFileListWithPriorities(settingsFilePath):
+  revitFileListWithPriorities = None
+  if text_file_util.HasTextFileExtension(settingsFilePath):
+    rows = text_file_util.GetRowsFromTextFile(settingsFilePath)
+    revitFileListWithPriorities = GetCentralFileListWithPrioritiesFromRows(rows)
+  elif HasExcelFileExtension(settingsFilePath):
+    import excel_util
+    rows = excel_util.ReadRowsTextFromWorkbook(settingsFilePath)
+    revitFileListWithPriorities = GetCentralFileListWithPrioritiesFromRows(rows)
+  return revitFileListWithPriorities
+
 def GenerateRevitVersionTextPrefixes(revitVersionNumberText, includeDisciplineVersions=False):
   REVIT_VERSION_TEXT_PREFIXES = ["Autodesk Revit"]
   if includeDisciplineVersions:
@@ -133,8 +157,9 @@ REVIT_VERSION_TEXT_PREFIXES_2018 = GenerateRevitVersionTextPrefixes("2018")
 REVIT_VERSION_TEXT_PREFIXES_2019 = GenerateRevitVersionTextPrefixes("2019")
 
 class SupportedRevitFileInfo():
-  def __init__(self, revitFilePath):
+  def __init__(self, revitFilePath, priority=revit_file_priority.DEFAULT_PRIORITY):
     self.revitFileInfo = RevitFileInfo(revitFilePath)
+    self.priority = priority
     revitVersionText = self.revitFileInfo.TryGetRevitVersionText()
     revitVersionNumber = None
     if not str.IsNullOrWhiteSpace(revitVersionText):
@@ -157,3 +182,6 @@ class SupportedRevitFileInfo():
   def GetRevitFileInfo(self):
     return self.revitFileInfo
 
+  def GetPriority(self):
+    return self.priority
+
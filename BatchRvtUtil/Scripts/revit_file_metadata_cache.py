@@ -0,0 +1,146 @@
+#
+# Revit Batch Processor
+#
+# Copyright (c) 2017  Dan Rumery, BVN
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+
+
+import clr
+import System
+from System.IO import File, FileInfo, Path
+
+import threading
+
+import json_util
+import text_file_util
+import batch_rvt_util
+from batch_rvt_util import BatchRvt
+
+# Caches the Revit version text read from each Revit file's embedded file info, which is by far the most
+# expensive part of Revit file list ingestion. An entry is only used while the file's size and last write
+# time are unchanged.
+
+METADATA_CACHE_FILENAME = "BatchRvt.FileMetadataCache.json"
+
+CACHE__FILES = "files"
+CACHE__REVIT_FILE_PATH = "revitFilePath"
+CACHE__FILE_SIZE = "fileSize"
+CACHE__LAST_WRITE_TIME_TICKS = "lastWriteTimeTicks"
+CACHE__REVIT_VERSION_TEXT = "revitVersionText"
+
+METADATA_CACHE = [None] # Needs to be a list so it can be captured by reference in closures.
+
+def GetMetadataCacheFilePath():
+  return Path.Combine(BatchRvt.GetDataFolderPath(), METADATA_CACHE_FILENAME)
+
+def GetCacheKey(revitFilePath):
+  return revitFilePath.ToLowerInvariant()
+
+class RevitFileMetadataCache:
+  def __init__(self, cacheFilePath):
+    self.cacheFilePath = cacheFilePath
+    self.lock = threading.Lock()
+    self.entries = {}
+    self.hasChanges = False
+    return
+
+  def Load(self):
+    entries = {}
+    if File.Exists(self.cacheFilePath):
+      try:
+        cache = json_util.DeserializeToJObject(text_file_util.ReadFromTextFile(self.cacheFilePath))
+        for fileEntry in cache[CACHE__FILES]:
+          revitFilePath = json_util.GetValueFromJValue(fileEntry[CACHE__REVIT_FILE_PATH])
+          entries[GetCacheKey(revitFilePath)] = {
+              CACHE__REVIT_FILE_PATH : revitFilePath,
+              CACHE__FILE_SIZE : json_util.GetValueFromJValue(fileEntry[CACHE__FILE_SIZE]),
+              CACHE__LAST_WRITE_TIME_TICKS : json_util.GetValueFromJValue(fileEntry[CACHE__LAST_WRITE_TIME_TICKS]),
+              CACHE__REVIT_VERSION_TEXT : json_util.GetValueFromJValue(fileEntry[CACHE__REVIT_VERSION_TEXT])
+            }
+      except Exception, e:
+        entries = {} # A corrupt cache file is simply discarded.
+    with self.lock:
+      self.entries = entries
+      self.hasChanges = False
+    return
+
+  def Save(self):
+    with self.lock:
+      if not self.hasChanges:
+        return
+      cache = { CACHE__FILES : list(self.entries.values()) }
+      self.hasChanges = False
+    text_file_util.WriteToTextFile(self.cacheFilePath, json_util.SerializeObject(cache))
+    return
+
+  def GetRevitVersionText(self, revitFilePath, readRevitVersionText):
+    fileInfo = None
+    try:
+      fileInfo = FileInfo(revitFilePath)
+      if not fileInfo.Exists:
+        fileInfo = None
+    except Exception, e:
+      fileInfo = None
+
+    if fileInfo is None:
+      return readRevitVersionText()
+
+    key = GetCacheKey(revitFilePath)
+    fileSize = fileInfo.Length
+    lastWriteTimeTicks = fileInfo.LastWriteTimeUtc.Ticks
+
+    with self.lock:
+      entry = self.entries.get(key)
+    if (
+        entry is not None and
+        entry[CACHE__FILE_SIZE] == fileSize and
+        entry[CACHE__LAST_WRITE_TIME_TICKS] == lastWriteTimeTicks
+      ):
+      return entry[CACHE__REVIT_VERSION_TEXT]
+
+    revitVersionText = readRevitVersionText()
+    if revitVersionText is not None:
+      with self.lock:
+        self.entries[key] = {
+            CACHE__REVIT_FILE_PATH : revitFilePath,
+            CACHE__FILE_SIZE : fileSize,
+            CACHE__LAST_WRITE_TIME_TICKS : lastWriteTimeTicks,
+            CACHE__REVIT_VERSION_TEXT : revitVersionText
+          }
+        self.hasChanges = True
+    return revitVersionText
+
+def InitializeMetadataCache():
+  metadataCache = RevitFileMetadataCache(GetMetadataCacheFilePath())
+  metadataCache.Load()
+  METADATA_CACHE[0] = metadataCache
+  return metadataCache
+
+def GetMetadataCache():
+  return METADATA_CACHE[0]
+
+def SaveMetadataCache():
+  metadataCache = GetMetadataCache()
+  if metadataCache is not None:
+    metadataCache.Save()
+  return
+
+def GetRevitVersionText(revitFilePath, readRevitVersionText):
+  metadataCache = GetMetadataCache()
+  if metadataCache is None:
+    return readRevitVersionText()
+  return metadataCache.GetRevitVersionText(revitFilePath, readRevitVersionText)
@@ -0,0 +1,102 @@
+#
+# Revit Batch Processor
+#
+# Copyright (c) 2017  Dan Rumery, BVN
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+
+
+import clr
+import System
+
+import heapq
+import fnmatch
+
+# Revit file priorities are integers from MIN_PRIORITY to MAX_PRIORITY. Higher values are processed first.
+
+DEFAULT_PRIORITY = 0
+MIN_PRIORITY = -999
+MAX_PRIORITY = 999
+
+PRIORITY_RULES_SEPARATOR = ";"
+PRIORITY_RULE_DELIMITER = "="
+
+# Aging: each dispatch from a queue raises the effective priority of every file still waiting in it by this
+# amount, relative to files enqueued later. Files enqueued together are ordered strictly by priority, but a file
+# that keeps being requeued (e.g. a deferred file) cannot hold back older, lower priority files indefinitely.
+PRIORITY_AGING_PER_DISPATCH = 0.1
+
+def ClampPriority(priority):
+  return max(MIN_PRIORITY, min(MAX_PRIORITY, priority))
+
+def TryParsePriority(priorityText):
+  priority = None
+  if not str.IsNullOrWhiteSpace(priorityText):
+    try:
+      priority = ClampPriority(int(float(priorityText.Trim())))
+    except ValueError, e:
+      pass
+  return priority
+
+def ParsePriorityRules(priorityRulesText):
+  # Rules are of the form "<path wildcard pattern>=<priority>;..." and are matched case-insensitively, in order.
+  priorityRules = []
+  if not str.IsNullOrWhiteSpace(priorityRulesText):
+    for rule in priorityRulesText.Split(PRIORITY_RULES_SEPARATOR):
+      if str.IsNullOrWhiteSpace(rule):
+        continue
+      delimiterIndex = rule.LastIndexOf(PRIORITY_RULE_DELIMITER)
+      priority = TryParsePriority(rule.Substring(delimiterIndex + 1)) if delimiterIndex > 0 else None
+      if priority is None:
+        raise Exception("Invalid Revit file priority rule: " + rule.Trim())
+      priorityRules.append((rule.Substring(0, delimiterIndex).Trim().ToLowerInvariant(), priority))
+  return priorityRules
+
+def GetRevitFilePriority(revitFilePath, revitFileListPriority, priorityRules):
+  # A priority given in the Revit file list takes precedence over the priority rules.
+  if revitFileListPriority is not None:
+    return revitFileListPriority
+  lowerRevitFilePath = revitFilePath.ToLowerInvariant()
+  for pattern, priority in priorityRules:
+    if fnmatch.fnmatchcase(lowerRevitFilePath, pattern):
+      return priority
+  return DEFAULT_PRIORITY
+
+def GetSortablePriorityText(priority):
+  # Text that sorts (ordinally) with the highest priority first.
+  return (MAX_PRIORITY - ClampPriority(priority)).ToString("D4")
+
+class PriorityQueue:
+  # Not thread-safe; callers must provide their own locking.
+  def __init__(self):
+    self.heap = []
+    self.enqueueCount = 0
+    self.dispatchCount = 0
+    return
+
+  def Push(self, item, priority):
+    key = -priority + PRIORITY_AGING_PER_DISPATCH * self.dispatchCount
+    heapq.heappush(self.heap, (key, self.enqueueCount, item))
+    self.enqueueCount += 1
+    return
+
+  def Pop(self):
+    key, enqueueNumber, item = heapq.heappop(self.heap)
+    self.dispatchCount += 1
+    return item
+
+  def __len__(self):
+    return len(self.heap)
@@ -59,8 +59,8 @@ def CreateSynchronizeWithCentralOptions(
   syncOptions.SetRelinquishOptions(relinquishOptions)
   return syncOptions
 
-def SynchronizeWithCentral(doc, comment=str.Empty):
-  transactOptions = CreateTransactWithCentralOptions()
+def SynchronizeWithCentral(doc, comment=str.Empty, shouldWaitForLockAvailabilityCallback=None):
+  transactOptions = CreateTransactWithCentralOptions(shouldWaitForLockAvailabilityCallback)
   syncOptions = CreateSynchronizeWithCentralOptions(comment=comment)
   doc.SynchronizeWithCentral(transactOptions, syncOptions)
   return
@@ -273,6 +273,14 @@ def GetRevitFileVersion(revitFilePath):
   savedInVersion = basicFileInfo.SavedInVersion if basicFileInfo is not None else None
   return savedInVersion
 
+def IsSavedInEarlierVersion(revitFilePath):
+  # True if opening the file will upgrade it to the current Revit version.
+  isSavedInEarlierVersion = False
+  basicFileInfo = TryGetBasicFileInfo(revitFilePath)
+  if basicFileInfo is not None:
+    isSavedInEarlierVersion = not basicFileInfo.IsSavedInCurrentVersion
+  return isSavedInEarlierVersion
+
 def IsLocalModel(revitFilePath):
   isLocalModel = False
   basicFileInfo = TryGetBasicFileInfo(revitFilePath)
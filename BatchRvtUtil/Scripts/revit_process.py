@@ -20,18 +20,60 @@
 
 import clr
 import System
+from System import Enum, Environment
 from System.Diagnostics import Process, ProcessStartInfo
+from System.IO import Path
 
 import batch_rvt_util
-from batch_rvt_util import RevitVersion
+from batch_rvt_util import RevitVersion, BatchRvt
+
+# When set (in BatchRvt's own environment), Revit is replaced by simulated_revit_host.py, run with IronPython. The
+# variable holds the path of the simulation settings file (see simulated_revit_host.py).
+SIMULATED_REVIT_HOST_SETTINGS_FILE_PATH__ENVIRONMENT_VARIABLE_NAME = r"BATCHRVT__SIMULATED_REVIT_HOST_SETTINGS_FILE_PATH"
+SIMULATED_REVIT_HOST_IRONPYTHON_PATH__ENVIRONMENT_VARIABLE_NAME = r"BATCHRVT__SIMULATED_REVIT_HOST_IRONPYTHON_PATH"
+SIMULATED_REVIT_HOST_SCRIPT_FILENAME = "simulated_revit_host.py"
+DEFAULT_IRONPYTHON_EXECUTABLE_FILENAME = "ipy64.exe"
+
+def GetSimulatedRevitHostSettingsFilePath():
+  settingsFilePath = Environment.GetEnvironmentVariable(SIMULATED_REVIT_HOST_SETTINGS_FILE_PATH__ENVIRONMENT_VARIABLE_NAME)
+  return settingsFilePath if not str.IsNullOrWhiteSpace(settingsFilePath) else None
+
+def IsSimulatedRevitHost():
+  return GetSimulatedRevitHostSettingsFilePath() is not None
+
+def GetInstalledRevitVersions():
+  # NOTE: with the simulated Revit host every supported Revit version counts as installed.
+  if IsSimulatedRevitHost():
+    return list(Enum.GetValues(RevitVersion.SupportedRevitVersion))
+  return list(RevitVersion.GetInstalledRevitVersions())
+
+def GetMinimumInstalledRevitVersion():
+  if IsSimulatedRevitHost():
+    return min(GetInstalledRevitVersions())
+  return RevitVersion.GetMinimumInstalledRevitVersion()
+
+def GetSimulatedRevitHostStartInfo():
+  ironPythonExecutableFilePath = Environment.GetEnvironmentVariable(SIMULATED_REVIT_HOST_IRONPYTHON_PATH__ENVIRONMENT_VARIABLE_NAME)
+  if str.IsNullOrWhiteSpace(ironPythonExecutableFilePath):
+    ironPythonExecutableFilePath = DEFAULT_IRONPYTHON_EXECUTABLE_FILENAME
+  batchRvtScriptsFolderPath = BatchRvt.GetBatchRvtScriptsFolderPath()
+  psi = ProcessStartInfo(
+      ironPythonExecutableFilePath,
+      "\"" + Path.Combine(batchRvtScriptsFolderPath, SIMULATED_REVIT_HOST_SCRIPT_FILENAME) + "\""
+    )
+  psi.WorkingDirectory = batchRvtScriptsFolderPath
+  return psi
 
 def StartRevitProcess(revitVersion, initEnvironmentVariables):
-  revitExecutableFilePath = RevitVersion.GetRevitExecutableFilePath(revitVersion)
-  psi = ProcessStartInfo(revitExecutableFilePath)
+  if IsSimulatedRevitHost():
+    psi = GetSimulatedRevitHostStartInfo()
+  else:
+    revitExecutableFilePath = RevitVersion.GetRevitExecutableFilePath(revitVersion)
+    psi = ProcessStartInfo(revitExecutableFilePath)
+    psi.WorkingDirectory = RevitVersion.GetRevitExecutableFolderPath(revitVersion)
   psi.UseShellExecute = False
   psi.RedirectStandardError = True
   psi.RedirectStandardOutput = True
-  psi.WorkingDirectory = RevitVersion.GetRevitExecutableFolderPath(revitVersion)
   initEnvironmentVariables(psi.EnvironmentVariables)
   revitProcess = Process.Start(psi)
   return revitProcess
@@ -39,16 +39,30 @@ def GetUniqueIdForProcess(process):
       time_util.GetISO8601FormattedUtcDate(process.StartTime)
     )
 
+def GetProcessIdFromUniqueId(processUniqueId):
+  return int(processUniqueId.Split(PROCESS_UNIQUE_ID_DELIMITER)[0])
+
+def TryGetProcessById(processId):
+  process = None
+  try:
+    process = Process.GetProcessById(processId)
+  except Exception, e: # ArgumentException if the process is not running.
+    process = None
+  return process
+
 def IsBatchRvtProcessRunning(batchRvtProcessUniqueId):
-  def IsBatchRvtProcess(process):
-    isTargetProcess = False
+  # NOTE: the start time is compared as well as the process id because process ids are reused.
+  isRunning = False
+  batchRvtProcess = TryGetProcessById(GetProcessIdFromUniqueId(batchRvtProcessUniqueId))
+  if batchRvtProcess is not None:
     try:
-      isTargetProcess = (GetUniqueIdForProcess(process) == batchRvtProcessUniqueId)
+      isRunning = (
+          not batchRvtProcess.HasExited and
+          GetUniqueIdForProcess(batchRvtProcess) == batchRvtProcessUniqueId
+        )
     except Exception, e:
-      isTargetProcess = False
-    return isTargetProcess
-  batchRvtProcess = Process.GetProcesses().FirstOrDefault(IsBatchRvtProcess)
-  return (batchRvtProcess is not None)
+      isRunning = False
+  return isRunning
 
 def StartHostRevitProcess(
     revitVersion,
@@ -57,6 +71,8 @@ def StartHostRevitProcess(
     scriptDataFilePath,
     progressNumber,
     scriptOutputPipeHandleString,
+    scriptControlPipeHandleString,
+    scriptOutputOverflowPolicy,
     testModeFolderPath
   ):
   batchRvtProcessUniqueId = GetUniqueIdForProcess(Process.GetCurrentProcess())
@@ -68,6 +84,8 @@ def StartHostRevitProcess(
         scriptDataFilePath,
         progressNumber,
         scriptOutputPipeHandleString,
+        scriptControlPipeHandleString,
+        scriptOutputOverflowPolicy,
         batchRvtProcessUniqueId,
         testModeFolderPath
       )
@@ -20,6 +20,7 @@
 
 import clr
 import System
+import threading
 clr.AddReference("System.Core")
 clr.ImportExtensions(System.Linq)
 
@@ -28,6 +29,12 @@ clr.AddReference("System.Windows.Forms")
 from System.Windows.Forms import Application
 from System.IO import File
 
+import import_profiler
+import_profiler.InstallImportProfiler()
+
+import compiled_script_modules
+compiled_script_modules.LoadOrCompileScriptModules()
+
 import global_test_mode
 import thread_util
 import script_environment
@@ -38,48 +45,69 @@ import path_util
 import time_util
 import revit_script_util
 import revit_file_util
-import snapshot_data_exporter
-import snapshot_data_util
 import exception_util
 import revit_session
 import stream_io_util
 import script_util
-import revit_dynamo
-import revit_dynamo_error
-import revit_process_host
+import deferral_util
+import ipc_protocol
+import session_hooks
 from batch_rvt_util import BatchRvt, RevitVersion
 from revit_script_util import ScriptDataUtil
 
+# NOTE: feature modules that are not needed by every session (Dynamo support, snapshot data export and the batch
+# processing helpers) are imported where they are first used, to keep the script host's startup short.
 
 END_SESSION_DELAY_IN_SECONDS = 5
 CLOSE_MAIN_WINDOW_ATTEMPTS = 10
 
+END_SESSION_REQUESTED = threading.Event()
+MONITOR_DISCONNECTED = threading.Event() # Set when the control pipe is closed, i.e. the BatchRvt process has gone away.
+CONTROL_PIPE_CONNECTED = threading.Event() # Without a control pipe the monitor cannot grant file opens.
+OPEN_GRANTED = threading.Event()
+
 def GetEnvironmentVariables(process):
   return process.StartInfo.EnvironmentVariables
 
 def GetCurrentProcess():
   return Process.GetCurrentProcess()
 
-def RunSingleTaskScript(scriptFilePath):
+def RunSingleTaskScript(scriptFilePaths):
   aborted = False
 
   showMessageBoxOnTaskError = revit_script_util.GetShowMessageBoxOnTaskError()
   output = revit_script_util.Output
 
   try:
-    def executeTaskScript():
+    def executeTaskScript(scriptFilePath):
+      revit_script_util.ReportPhase(ipc_protocol.PHASE_TASK)
       output()
       output("Task script operation started.")
-      script_util.ExecuteScript(scriptFilePath)
+      if len(scriptFilePaths) > 1:
+        output()
+        output("\t" + scriptFilePath)
+      if session_hooks.UsesSessionHooks(scriptFilePath):
+        # There is no document in single task mode.
+        taskScriptSession = session_hooks.TaskScriptSession(scriptFilePath, revit_session.GetSessionUIApplication(), output)
+        try:
+          taskScriptSession.Start()
+          taskScriptSession.ProcessDocument(None)
+        finally:
+          taskScriptSession.End()
+      else:
+        script_util.ExecuteScript(scriptFilePath)
       output()
       output("Task script operation completed.")
       return
-    result = script_host_error.WithErrorHandling(
-        executeTaskScript,
-        "ERROR: An error occurred while executing the task script! Operation aborted.",
-        output,
-        showMessageBoxOnTaskError
-      )
+    # As in batch mode, each task script has its own error handling so that a failing script does not prevent the
+    # following scripts from running.
+    for scriptFilePath in scriptFilePaths:
+      script_host_error.WithErrorHandling(
+          lambda: executeTaskScript(scriptFilePath),
+          "ERROR: An error occurred while executing the task script! Operation aborted.",
+          output,
+          showMessageBoxOnTaskError
+        )
   except Exception, e:
     aborted = True
     raise
@@ -98,8 +126,21 @@ def RunSingleTaskScript(scriptFilePath):
 
   return aborted
 
-def RunBatchTaskScript(scriptFilePath):
+def WithFileDeferralHandling(action, deferralReason):
+  result = None
+  try:
+    result = action()
+  except Exception, e:
+    reason = deferral_util.GetDeferralReason(e)
+    if reason is None:
+      raise
+    deferralReason[0] = reason
+  return result
+
+def RunBatchTaskScript(scriptFilePaths, taskScriptSessions):
   aborted = False
+  deferralReason = [None] # Needs to be a list so it can be captured by reference in closures.
+  failedTaskScriptsCount = [0] # As above.
 
   uiapp = revit_session.GetSessionUIApplication()
   sessionId = revit_script_util.GetSessionId()
@@ -131,6 +172,7 @@ def RunBatchTaskScript(scriptFilePath):
     aborted = True
   else:
     if enableDataExport:
+      import snapshot_data_exporter
       snapshotStartTime = time_util.GetDateTimeNow()
       snapshotError = None
       snapshotEndTime = None
@@ -177,12 +219,19 @@ def RunBatchTaskScript(scriptFilePath):
 
       def processDocument(doc):
         revit_script_util.SetScriptDocument(doc)
+        revit_script_util.ReportPhase(ipc_protocol.PHASE_TASK)
         
-        def executeTaskScript():
+        def executeTaskScript(scriptFilePath):
           success = False
+          taskScriptSession = taskScriptSessions.get(scriptFilePath)
           output()
           output("Task script operation started.")
+          if len(scriptFilePaths) > 1:
+            output()
+            output("\t" + scriptFilePath)
           if path_util.HasFileExtension(scriptFilePath, script_util.DYNAMO_SCRIPT_FILE_EXTENSION):
+            import revit_dynamo
+            import revit_dynamo_error
             if revit_dynamo.IsDynamoRevitModuleLoaded():
               revit_dynamo.ExecuteDynamoScript(uiapp, scriptFilePath, showUI=False)
               success = True
@@ -190,6 +239,9 @@ def RunBatchTaskScript(scriptFilePath):
               success = False
               output()
               output(revit_dynamo_error.DYNAMO_REVIT_MODULE_NOT_FOUND_ERROR_MESSAGE)
+          elif taskScriptSession is not None:
+            taskScriptSession.ProcessDocument(doc)
+            success = True
           else:
             script_util.ExecuteScript(scriptFilePath)
             success = True
@@ -199,16 +251,32 @@ def RunBatchTaskScript(scriptFilePath):
           else:
             output()
             output("ERROR: An error occurred while executing the task script! Operation aborted.")
-          return
-
-        result = script_host_error.WithErrorHandling(
-            executeTaskScript,
-            "ERROR: An error occurred while executing the task script! Operation aborted.",
-            output,
-            showMessageBoxOnTaskError
-          )
-        return result
-
+          return success
+
+        # Each task script is run against the same opened document, in order, with its own error handling so that a
+        # failing script does not prevent the following scripts from running. A deferral applies to the whole file.
+        for scriptFilePath in scriptFilePaths:
+          if deferralReason[0] is not None:
+            break
+          success = script_host_error.WithErrorHandling(
+              lambda: WithFileDeferralHandling(lambda: executeTaskScript(scriptFilePath), deferralReason),
+              "ERROR: An error occurred while executing the task script! Operation aborted.",
+              output,
+              showMessageBoxOnTaskError
+            )
+          # NOTE: success is None if the script raised (or the file was deferred, which is reported as such instead).
+          if success is not True and deferralReason[0] is None:
+            failedTaskScriptsCount[0] += 1
+        revit_script_util.ReportPhase(ipc_protocol.PHASE_CLOSING)
+        return
+
+      if CONTROL_PIPE_CONNECTED.is_set():
+        revit_script_util.WaitForFileOpenGrant(OPEN_GRANTED, MONITOR_DISCONNECTED)
+      revit_script_util.ReportPhase(
+          ipc_protocol.PHASE_UPGRADING
+          if revit_file_util.IsSavedInEarlierVersion(centralFilePath) else
+          ipc_protocol.PHASE_OPENING
+        )
       result = None
       activeDoc = None #revit_script_util.GetActiveDocument(uiapp)
       if activeDoc is not None:
@@ -228,11 +296,20 @@ def RunBatchTaskScript(scriptFilePath):
             output()
             output("WARNING: failed to delete the local file!")
           path_util.CreateDirectoryForFilePath(localFilePath)
-          result = revit_script_util.RunNewLocalDocumentAction(uiapp, openInUI, centralFilePath, localFilePath, processDocument, output)
+          result = WithFileDeferralHandling(
+              lambda: revit_script_util.RunNewLocalDocumentAction(uiapp, openInUI, centralFilePath, localFilePath, processDocument, output),
+              deferralReason
+            )
         elif isCentralModel or isLocalModel:
-          result = revit_script_util.RunDetachedDocumentAction(uiapp, openInUI, centralFilePath, discardWorksetsOnDetach, processDocument, output)
+          result = WithFileDeferralHandling(
+              lambda: revit_script_util.RunDetachedDocumentAction(uiapp, openInUI, centralFilePath, discardWorksetsOnDetach, processDocument, output),
+              deferralReason
+            )
         else:
-          result = revit_script_util.RunDocumentAction(uiapp, openInUI, centralFilePath, processDocument, output)
+          result = WithFileDeferralHandling(
+              lambda: revit_script_util.RunDocumentAction(uiapp, openInUI, centralFilePath, processDocument, output),
+              deferralReason
+            )
     except Exception, e:
       aborted = True
       snapshotError = exception_util.GetExceptionDetails(e)
@@ -251,6 +328,11 @@ def RunBatchTaskScript(scriptFilePath):
           output("WARNING: failed to delete the local file!")
 
       if enableDataExport:
+        import snapshot_data_exporter
+        import snapshot_data_util
+        revit_script_util.ReportPhase(ipc_protocol.PHASE_EXPORTING)
+        if deferralReason[0] is not None:
+          snapshotError = "File processing was deferred: " + deferralReason[0]
         snapshotEndTime = time_util.GetDateTimeNow()
         snapshotData = snapshot_data_exporter.ExportSnapshotData(
             sessionId,
@@ -261,6 +343,7 @@ def RunBatchTaskScript(scriptFilePath):
             revitJournalFilePath,
             snapshotError
           )
+        revit_script_util.ReportSnapshotExported()
         snapshot_data_util.ConsolidateSnapshotData(dataExportFolderPath, output)
 
       # Ensure aborted message is shown in the event of an exception.
@@ -268,12 +351,34 @@ def RunBatchTaskScript(scriptFilePath):
         output()
         output("Operation aborted.")
 
+    if deferralReason[0] is not None:
+      output()
+      output("WARNING: File processing was deferred: " + deferralReason[0])
+
   if aborted:
     output()
     output("Operation aborted.")
+    revit_script_util.ReportFileResult(ipc_protocol.RESULT_STATUS_ABORTED)
+  elif deferralReason[0] is not None:
+    output()
+    output("Operation deferred.")
+    revit_script_util.ReportFileResult(ipc_protocol.RESULT_STATUS_DEFERRED, deferralReason[0])
+  elif failedTaskScriptsCount[0] > 0:
+    failureReason = str(failedTaskScriptsCount[0]) + " of " + str(len(scriptFilePaths)) + " task script(s) failed."
+    output()
+    output("WARNING: " + failureReason)
+    if failedTaskScriptsCount[0] < len(scriptFilePaths):
+      output()
+      output("Operation partially completed.")
+      revit_script_util.ReportFileResult(ipc_protocol.RESULT_STATUS_PARTIAL, failureReason)
+    else:
+      output()
+      output("Operation failed.")
+      revit_script_util.ReportFileResult(ipc_protocol.RESULT_STATUS_FAILED, failureReason)
   else:
     output()
     output("Operation completed.")
+    revit_script_util.ReportFileResult(ipc_protocol.RESULT_STATUS_COMPLETED)
 
   return aborted
 
@@ -297,6 +402,37 @@ def GetRevitProcessingOptionForSession(scriptDatas):
   revit_script_util.SetCurrentScriptData(oldScriptData)
   return revitProcessingOption
 
+def StartTaskScriptSession(scriptFilePath, output):
+  # Returns None for Dynamo scripts and for task scripts without session hooks (which are executed for every file).
+  taskScriptSession = None
+  if (
+      not path_util.HasFileExtension(scriptFilePath, script_util.DYNAMO_SCRIPT_FILE_EXTENSION) and
+      session_hooks.UsesSessionHooks(scriptFilePath)
+    ):
+    taskScriptSession = session_hooks.TaskScriptSession(scriptFilePath, revit_session.GetSessionUIApplication(), output)
+    revit_script_util.ReportPhase(ipc_protocol.PHASE_TASK)
+    output()
+    output("Starting the task script session (session hooks mode).")
+    # NOTE: on failure, TaskScriptSession.ProcessDocument() raises for each file, so the script is counted as failed.
+    script_host_error.WithErrorHandling(
+        taskScriptSession.Start,
+        "ERROR: An error occurred while starting the task script session!",
+        output,
+        revit_script_util.GetShowMessageBoxOnTaskError()
+      )
+  return taskScriptSession
+
+def EndTaskScriptSession(taskScriptSession, output):
+  output()
+  output("Ending the task script session.")
+  script_host_error.WithErrorHandling(
+      taskScriptSession.End,
+      "ERROR: An error occurred while ending the task script session!",
+      output,
+      revit_script_util.GetShowMessageBoxOnTaskError()
+    )
+  return
+
 def DoRevitSessionProcessing(
     scriptFilePath,
     scriptDataFilePath,
@@ -308,44 +444,74 @@ def DoRevitSessionProcessing(
   revit_script_util.SetUIApplication(revit_session.GetSessionUIApplication())
   revit_script_util.SetScriptDataFilePath(scriptDataFilePath)
   scriptDatas = (
-      revit_script_util.LoadScriptDatas()
-      .Where(lambda scriptData: scriptData.ProgressNumber.GetValue() >= progressNumber)
+      revit_script_util.LoadScriptDatas(progressNumber)
       .OrderBy(lambda scriptData: scriptData.ProgressNumber.GetValue())
       .ToList()
     )
   if len(scriptDatas) > 0:
     revitProcessingOption = GetRevitProcessingOptionForSession(scriptDatas)
     if revitProcessingOption == BatchRvt.RevitProcessingOption.BatchRevitFileProcessing:
-      for scriptData in scriptDatas:
-        revit_script_util.SetCurrentScriptData(scriptData)
-        if not revit_process_host.IsBatchRvtProcessRunning(batchRvtProcessUniqueId):
-          script_host_error.ShowScriptErrorMessageBox("ERROR: The BatchRvt process appears to have terminated! Operation aborted.")
-          break
-        progressRecordFilePath = ScriptDataUtil.GetProgressRecordFilePath(scriptDataFilePath)
-        progressRecorded = ScriptDataUtil.SetProgressNumber(progressRecordFilePath, scriptData.ProgressNumber.GetValue())
-        if not progressRecorded:
-          output()
-          output("WARNING: Failed to update the session progress record file!")
-        result = script_host_error.WithErrorHandling(
-            lambda: RunBatchTaskScript(scriptFilePath),
-            "ERROR: An error occurred while processing the file!",
-            output,
-            False
-          )
-        results.append(result)
+      import revit_process_host
+      revit_script_util.SetCurrentScriptData(scriptDatas[0])
+      scriptFilePaths = [scriptFilePath] + revit_script_util.GetAdditionalTaskScriptFilePaths()
+      taskScriptSessions = {}
+      for sessionScriptFilePath in scriptFilePaths:
+        taskScriptSession = StartTaskScriptSession(sessionScriptFilePath, output)
+        if taskScriptSession is not None:
+          taskScriptSessions[sessionScriptFilePath] = taskScriptSession
+      try:
+        for scriptData in scriptDatas:
+          revit_script_util.SetCurrentScriptData(scriptData)
+          if MONITOR_DISCONNECTED.is_set() or not revit_process_host.IsBatchRvtProcessRunning(batchRvtProcessUniqueId):
+            script_host_error.ShowScriptErrorMessageBox("ERROR: The BatchRvt process appears to have terminated! Operation aborted.")
+            break
+          if END_SESSION_REQUESTED.is_set():
+            output()
+            output("Ending the Revit session early as requested by the BatchRvt monitor.")
+            break
+          revit_script_util.ReportProgress(scriptData.ProgressNumber.GetValue())
+          result = script_host_error.WithErrorHandling(
+              lambda: RunBatchTaskScript(scriptFilePaths, taskScriptSessions),
+              "ERROR: An error occurred while processing the file!",
+              output,
+              False
+            )
+          if result is None:
+            revit_script_util.ReportFileResult(ipc_protocol.RESULT_STATUS_ABORTED)
+          results.append(result)
+      finally:
+        # Sessions are ended in the reverse order they were started.
+        for sessionScriptFilePath in reversed(scriptFilePaths):
+          if sessionScriptFilePath in taskScriptSessions:
+            EndTaskScriptSession(taskScriptSessions.pop(sessionScriptFilePath), output)
     else:
       scriptData = scriptDatas[0]
       revit_script_util.SetCurrentScriptData(scriptData)
-      result = RunSingleTaskScript(scriptFilePath)
+      result = RunSingleTaskScript(
+          [scriptFilePath] + revit_script_util.GetAdditionalTaskScriptFilePaths()
+        )
       results.append(result)
   else:
     raise Exception("ERROR: received no script data!")
   return results
 
+def OnMonitorMessage(message):
+  # NOTE: called on the message listener thread.
+  if message[ipc_protocol.MESSAGE__TYPE] == ipc_protocol.MESSAGE_TYPE_COMMAND:
+    if message[ipc_protocol.MESSAGE__COMMAND] == ipc_protocol.COMMAND_END_SESSION:
+      END_SESSION_REQUESTED.set()
+    elif message[ipc_protocol.MESSAGE__COMMAND] == ipc_protocol.COMMAND_OPEN_GRANTED:
+      OPEN_GRANTED.set()
+  return
+
 def Main():
   currentProcess = GetCurrentProcess()
   environmentVariables = GetEnvironmentVariables(currentProcess)
   outputPipeHandleString = script_environment.GetScriptOutputPipeHandleString(environmentVariables)
+  controlPipeHandleString = script_environment.GetScriptControlPipeHandleString(environmentVariables)
+  outputOverflowPolicy = ipc_protocol.ParseOutputOverflowPolicy(
+      script_environment.GetScriptOutputOverflowPolicy(environmentVariables)
+    )
   scriptFilePath = script_environment.GetScriptFilePath(environmentVariables)
   scriptDataFilePath = script_environment.GetScriptDataFilePath(environmentVariables)
   progressNumber = script_environment.GetProgressNumber(environmentVariables)
@@ -358,10 +524,24 @@ def Main():
     outputStream = client_util.CreateAnonymousPipeClient(client_util.OUT, outputPipeHandleString)
 
     def outputStreamAction():
-      outputStreamWriter = stream_io_util.GetStreamWriter(outputStream)
+      # Output is queued and written on a background thread so that Revit's main thread is not held up by the pipe.
+      messageWriter = ipc_protocol.QueuedMessageWriter(
+          outputStream,
+          outputOverflowPolicy,
+          ScriptDataUtil.GetScriptOutputSpillFilePath(scriptDataFilePath) if scriptDataFilePath is not None else None
+        )
+      revit_script_util.SetMessageWriter(messageWriter)
+      revit_script_util.SetOutputFunction(messageWriter.SendLog)
+
+      if controlPipeHandleString is not None:
+        controlStream = client_util.CreateAnonymousPipeClient(client_util.IN, controlPipeHandleString)
+        ipc_protocol.StartMessageListener(controlStream, OnMonitorMessage, MONITOR_DISCONNECTED.set)
+        CONTROL_PIPE_CONNECTED.set()
+
+      revit_script_util.ReportPhase(ipc_protocol.PHASE_STARTUP)
+      stopHeartbeat = ipc_protocol.StartHeartbeat(messageWriter)
 
-      def outputStreamWriterAction():
-        revit_script_util.SetOutputFunction(stream_io_util.GetSafeWriteLine(outputStreamWriter))
+      try:
         result = script_host_error.WithErrorHandling(
             lambda: DoRevitSessionProcessing(
                 scriptFilePath,
@@ -374,10 +554,11 @@ def Main():
             output=revit_script_util.Output,
             showErrorMessageBox=False
           )
-        return result
-
-      stream_io_util.UsingStream(outputStreamWriter, outputStreamWriterAction)
-      return
+      finally:
+        import_profiler.ShowImportProfile(revit_script_util.Output)
+        stopHeartbeat.set()
+        messageWriter.Close()
+      return result
 
     stream_io_util.UsingStream(outputStream, outputStreamAction)
 
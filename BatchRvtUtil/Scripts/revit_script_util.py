@@ -29,10 +29,14 @@ import path_util
 import revit_file_util
 import revit_dialog_util
 import revit_failure_handling
+import deferral_util
+import json_util
+import script_util
 import batch_rvt_util
 from batch_rvt_util import ScriptDataUtil
 
 OUTPUT_FUNCTION_CONTAINER = [None]
+MESSAGE_WRITER_CONTAINER = [None]
 
 SCRIPT_DATA_FILE_PATH_CONTAINER = [None]
 SCRIPT_DATA_CONTAINER = [None]
@@ -40,10 +44,17 @@ SCRIPT_DATA_CONTAINER = [None]
 SCRIPT_DOCUMENT_CONTAINER = [None]
 SCRIPT_UIAPPLICATION_CONTAINER = [None]
 
+DEFAULT_SESSION_CACHE_NAME = "default"
+SESSION_CACHES = {} # Cache name -> session_cache.SessionCache. Lives for the whole script host session.
+
 def SetOutputFunction(output):
   OUTPUT_FUNCTION_CONTAINER[0] = output
   return
 
+def SetMessageWriter(messageWriter):
+  MESSAGE_WRITER_CONTAINER[0] = messageWriter
+  return
+
 def SetScriptDataFilePath(scriptDataFilePath):
   SCRIPT_DATA_FILE_PATH_CONTAINER[0] = scriptDataFilePath
   return
@@ -61,15 +72,56 @@ def Output(m="", msgId=""):
   OUTPUT_FUNCTION_CONTAINER[0](message)
   return
 
+def ReportProgress(progressNumber):
+  messageWriter = MESSAGE_WRITER_CONTAINER[0]
+  if messageWriter is not None:
+    messageWriter.SendProgress(progressNumber)
+  return
+
+def ReportPhase(phase):
+  messageWriter = MESSAGE_WRITER_CONTAINER[0]
+  if messageWriter is not None:
+    messageWriter.SendPhase(phase)
+  return
+
+def WaitForFileOpenGrant(openGranted, monitorDisconnected):
+  # Lets the BatchRvt monitor throttle opening the current file (see file_server_throttle.FileOpenGate).
+  messageWriter = MESSAGE_WRITER_CONTAINER[0]
+  if messageWriter is not None:
+    messageWriter.WaitForOpenGrant(GetProgressNumber(), openGranted, monitorDisconnected)
+  return
+
+def ReportFileResult(status, reason=None):
+  messageWriter = MESSAGE_WRITER_CONTAINER[0]
+  if messageWriter is not None:
+    messageWriter.SendResult(GetProgressNumber(), GetRevitFilePath(), status, reason)
+  return
+
+def EmitRecord(tableName, record):
+  # Sends a record (a dict of JSON-serializable values) to the BatchRvt monitor, which appends it to the run-level
+  # table of the given name (see record_tables.py).
+  if str.IsNullOrWhiteSpace(tableName):
+    raise Exception("ERROR: a record table name must be specified.")
+  messageWriter = MESSAGE_WRITER_CONTAINER[0]
+  if messageWriter is not None:
+    messageWriter.SendRecord(tableName, json_util.SerializeObject(record))
+  return
+
+def ReportSnapshotExported():
+  messageWriter = MESSAGE_WRITER_CONTAINER[0]
+  if messageWriter is not None:
+    messageWriter.SendSnapshotExported(GetProgressNumber())
+  return
+
 def GetScriptDataFilePath():
   scriptDataFilePath = SCRIPT_DATA_FILE_PATH_CONTAINER[0]
   return scriptDataFilePath
 
-def LoadScriptDatas():
+def LoadScriptDatas(minimumProgressNumber=0):
   scriptDataFilePath = GetScriptDataFilePath()
   if scriptDataFilePath is None:
     raise Exception("ERROR: could not retrieve script data file path from host.")
-  scriptDatas = ScriptDataUtil.LoadManyFromFile(scriptDataFilePath)
+  scriptDatas = ScriptDataUtil.LoadManyFromFile(scriptDataFilePath, minimumProgressNumber)
   if scriptDatas is None:
     raise Exception("ERROR: could not load script data file.")
   return scriptDatas
@@ -103,6 +155,10 @@ def GetSessionId():
 def GetTaskScriptFilePath():
   return SCRIPT_DATA_CONTAINER[0].TaskScriptFilePath.GetValue()
 
+def GetAdditionalTaskScriptFilePaths():
+  # The task scripts run, in order, after the main task script against the same opened document.
+  return script_util.ParseTaskScriptFilePaths(SCRIPT_DATA_CONTAINER[0].AdditionalTaskScriptFilePaths.GetValue())
+
 def GetTaskData():
   return SCRIPT_DATA_CONTAINER[0].TaskData.GetValue()
 
@@ -137,6 +193,25 @@ def GetScriptDocument():
   doc = SCRIPT_DOCUMENT_CONTAINER[0]
   return doc
 
+def GetSessionCache(name=DEFAULT_SESSION_CACHE_NAME, maxItemsCount=None, persistToDisk=False):
+  # Returns the named cache, which persists between the files processed in this Revit session. If persistToDisk is
+  # True, picklable values are also written to disk and are available to later Revit sessions of the same BatchRvt run.
+  # maxItemsCount limits the number of values held in memory (least recently used values are evicted first).
+  # NOTE: asking for an existing in-memory cache with persistToDisk=True makes it persistent (a cache is never made
+  #       in-memory only again, since other callers may rely on its values being on disk).
+  import session_cache
+  sessionCache = SESSION_CACHES.get(name)
+  diskFolderPath = session_cache.GetSessionCacheDiskFolderPath(GetSessionId(), name) if persistToDisk else None
+  if sessionCache is None:
+    sessionCache = session_cache.SessionCache(maxItemsCount, diskFolderPath)
+    SESSION_CACHES[name] = sessionCache
+  else:
+    if maxItemsCount is not None:
+      sessionCache.SetMaxItemsCount(maxItemsCount)
+    if diskFolderPath is not None:
+      sessionCache.EnableDiskTier(diskFolderPath)
+  return sessionCache
+
 def GetUIApplication():
   uiapp = SCRIPT_UIAPPLICATION_CONTAINER[0]
   return uiapp
@@ -150,6 +225,22 @@ def WithExceptionLogging(action, output):
     raise
   return result
 
+def ShouldWaitForCentralLock():
+  # NOTE: not waiting causes Revit to raise a CentralModelContentionException when the central model is locked
+  # (e.g. by a user's sync). The script host then defers the file instead of leaving the Revit session idle.
+  return False
+
+def SynchronizeWithCentral(doc, comment=str.Empty):
+  revit_file_util.SynchronizeWithCentral(doc, comment, ShouldWaitForCentralLock)
+  return
+
+def RelinquishAll(doc):
+  return revit_file_util.RelinquishAll(doc, ShouldWaitForCentralLock)
+
+def DeferCurrentFile(reason):
+  # Releases the current file and requeues it for a later Revit session (subject to the retry limit).
+  raise deferral_util.FileDeferredException(reason)
+
 def GetWorksharingCentralModelPath(doc):
   centralModelPath = None
   try:
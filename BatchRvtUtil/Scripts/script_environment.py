@@ -26,6 +26,8 @@ SCRIPT_FILE_PATH__ENVIRONMENT_VARIABLE_NAME = r"BATCHRVT__SCRIPT_FILE_PATH"
 SCRIPT_DATA_FILE_PATH__ENVIRONMENT_VARIABLE_NAME = r"BATCHRVT__SCRIPT_DATA_FILE_PATH"
 PROGRESS_NUMBER__ENVIRONMENT_VARIABLE_NAME = r"BATCHRVT__PROGRESS_NUMBER"
 SCRIPT_OUTPUT_PIPE_HANDLE_STRING__ENVIRONMENT_VARIABLE_NAME = r"BATCHRVT__SCRIPT_OUTPUT_PIPE_HANDLE_STRING"
+SCRIPT_CONTROL_PIPE_HANDLE_STRING__ENVIRONMENT_VARIABLE_NAME = r"BATCHRVT__SCRIPT_CONTROL_PIPE_HANDLE_STRING"
+SCRIPT_OUTPUT_OVERFLOW_POLICY__ENVIRONMENT_VARIABLE_NAME = r"BATCHRVT__SCRIPT_OUTPUT_OVERFLOW_POLICY"
 BATCHRVT_PROCESS_UNIQUE_ID__ENVIRONMENT_VARIABLE_NAME = r"BATCHRVT__PROCESS_UNIQUE_ID"
 BATCHRVT_TEST_MODE_FOLDER_PATH__ENVIRONMENT_VARIABLE_NAME = r"BATCHRVT__TEST_MODE_FOLDER_PATH"
 
@@ -75,6 +77,22 @@ def SetScriptOutputPipeHandleString(environmentVariables, scriptOutputPipeHandle
     )
   return
 
+def SetScriptControlPipeHandleString(environmentVariables, scriptControlPipeHandleString):
+  SetEnvironmentVariable(
+      environmentVariables,
+      SCRIPT_CONTROL_PIPE_HANDLE_STRING__ENVIRONMENT_VARIABLE_NAME,
+      scriptControlPipeHandleString
+    )
+  return
+
+def SetScriptOutputOverflowPolicy(environmentVariables, scriptOutputOverflowPolicy):
+  SetEnvironmentVariable(
+      environmentVariables,
+      SCRIPT_OUTPUT_OVERFLOW_POLICY__ENVIRONMENT_VARIABLE_NAME,
+      scriptOutputOverflowPolicy
+    )
+  return
+
 def SetBatchRvtProcessUniqueId(environmentVariables, batchRvtProcessUniqueId):
   SetEnvironmentVariable(
       environmentVariables,
@@ -122,6 +140,18 @@ def GetScriptOutputPipeHandleString(environmentVariables):
         SCRIPT_OUTPUT_PIPE_HANDLE_STRING__ENVIRONMENT_VARIABLE_NAME
       )
 
+def GetScriptControlPipeHandleString(environmentVariables):
+  return GetEnvironmentVariable(
+        environmentVariables,
+        SCRIPT_CONTROL_PIPE_HANDLE_STRING__ENVIRONMENT_VARIABLE_NAME
+      )
+
+def GetScriptOutputOverflowPolicy(environmentVariables):
+  return GetEnvironmentVariable(
+        environmentVariables,
+        SCRIPT_OUTPUT_OVERFLOW_POLICY__ENVIRONMENT_VARIABLE_NAME
+      )
+
 def GetBatchRvtProcessUniqueId(environmentVariables):
   return GetEnvironmentVariable(
         environmentVariables,
@@ -141,6 +171,8 @@ def InitEnvironmentVariables(
     scriptDataFilePath,
     progressNumber,
     scriptOutputPipeHandleString,
+    scriptControlPipeHandleString,
+    scriptOutputOverflowPolicy,
     batchRvtProcessUniqueId,
     testModeFolderPath
   ):
@@ -149,6 +181,8 @@ def InitEnvironmentVariables(
   SetScriptDataFilePath(environmentVariables, scriptDataFilePath)
   SetProgressNumber(environmentVariables, progressNumber)
   SetScriptOutputPipeHandleString(environmentVariables, scriptOutputPipeHandleString)
+  SetScriptControlPipeHandleString(environmentVariables, scriptControlPipeHandleString)
+  SetScriptOutputOverflowPolicy(environmentVariables, scriptOutputOverflowPolicy)
   SetBatchRvtProcessUniqueId(environmentVariables, batchRvtProcessUniqueId)
   SetTestModeFolderPath(environmentVariables, testModeFolderPath)
   return
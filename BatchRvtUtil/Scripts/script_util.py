@@ -20,21 +20,24 @@
 
 import clr
 import System
-from System.IO import Path
+from System.IO import Path, File, FileInfo
 
 import std_io_util
 from std_io_util import Output
 import path_util
+import record_tables
 from path_util import GetProjectFolderNameFromRevitProjectFilePath # Might come in handy for pre/post-processing scripts.
 
 PYTHON_SCRIPT_FILE_EXTENSION = ".py"
 DYNAMO_SCRIPT_FILE_EXTENSION = ".dyn"
+TASK_SCRIPT_FILE_PATHS_SEPARATOR = ";"
 
 SESSION_ID_CONTAINER = [None]
 TASK_DATA_CONTAINER = [None]
 EXPORT_FOLDER_PATH_CONTAINER = [None]
 SESSION_DATA_FOLDER_PATH_CONTAINER = [None]
 REVIT_FILE_LIST_FILE_PATH_CONTAINER = [None]
+RECORDS_FOLDER_PATH_CONTAINER = [None]
 
 def SetSessionId(batchRvtConfig):
   SESSION_ID_CONTAINER[0] = batchRvtConfig.SessionId
@@ -56,6 +59,10 @@ def SetRevitFileListFilePath(batchRvtConfig):
   REVIT_FILE_LIST_FILE_PATH_CONTAINER[0] = batchRvtConfig.RevitFileListFilePath
   return
 
+def SetRecordsFolderPath(batchRvtConfig):
+  RECORDS_FOLDER_PATH_CONTAINER[0] = batchRvtConfig.RecordsFolderPath
+  return
+
 def GetSessionId():
   sessionId = SESSION_ID_CONTAINER[0]
   return sessionId
@@ -76,8 +83,51 @@ def GetRevitFileListFilePath():
   revitFileListFilePath = REVIT_FILE_LIST_FILE_PATH_CONTAINER[0]
   return revitFileListFilePath
 
+# Compiled scripts keyed by full path, so that in a shared session the task script is read and compiled once rather
+# than once per file. An entry is recompiled if the script file's last write time or length changes.
+COMPILED_SCRIPTS = {}
+
+def GetScriptFileStamp(fullScriptFilePath):
+  fileInfo = FileInfo(fullScriptFilePath)
+  return (fileInfo.LastWriteTimeUtc.Ticks, fileInfo.Length)
+
+def CompileScript(scriptFilePath):
+  fullScriptFilePath = Path.GetFullPath(scriptFilePath)
+  cacheKey = fullScriptFilePath.ToLower()
+  fileStamp = GetScriptFileStamp(fullScriptFilePath)
+  cachedScript = COMPILED_SCRIPTS.get(cacheKey)
+  if cachedScript is not None and cachedScript[0] == fileStamp:
+    return cachedScript[1]
+  # The file name is passed to compile() so that tracebacks refer to the script file as they did with execfile().
+  scriptCode = compile(File.ReadAllText(fullScriptFilePath), fullScriptFilePath, "exec")
+  COMPILED_SCRIPTS[cacheKey] = (fileStamp, scriptCode)
+  return scriptCode
+
+def GetRecordsFolderPath():
+  recordsFolderPath = RECORDS_FOLDER_PATH_CONTAINER[0]
+  return recordsFolderPath
+
+def GetRecordTableNames():
+  # The names of the record tables emitted by the task script (revit_script_util.EmitRecord()) during this run.
+  return record_tables.GetRecordTableNames(GetRecordsFolderPath())
+
+def ReadRecords(tableName):
+  # Iterates over the records (dicts) of the given record table.
+  return record_tables.ReadRecords(GetRecordsFolderPath(), tableName)
+
+def ParseTaskScriptFilePaths(taskScriptFilePathsText):
+  # Task script file paths are separated by semicolons (or new lines).
+  taskScriptFilePaths = []
+  if not str.IsNullOrWhiteSpace(taskScriptFilePathsText):
+    taskScriptFilePathsText = taskScriptFilePathsText.Replace("\r", "").Replace("\n", TASK_SCRIPT_FILE_PATHS_SEPARATOR)
+    for taskScriptFilePath in taskScriptFilePathsText.Split(TASK_SCRIPT_FILE_PATHS_SEPARATOR):
+      if not str.IsNullOrWhiteSpace(taskScriptFilePath):
+        taskScriptFilePaths.append(taskScriptFilePath.Trim())
+  return taskScriptFilePaths
+
 def ExecuteScript(scriptFilePath):
   path_util.AddSearchPath(Path.GetDirectoryName(scriptFilePath))
-  scriptGlobals = {}
-  execfile(scriptFilePath, scriptGlobals)
-  return
+  scriptCode = CompileScript(scriptFilePath)
+  scriptGlobals = {} # A fresh globals dict per execution, as with execfile().
+  exec scriptCode in scriptGlobals
+  return scriptGlobals
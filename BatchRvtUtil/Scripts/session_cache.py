@@ -0,0 +1,190 @@
+#
+# Revit Batch Processor
+#
+# Copyright (c) 2017  Dan Rumery, BVN
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+
+
+import clr
+import System
+from System.IO import Path, File, Directory
+
+import collections
+import threading
+
+import path_util
+import batch_rvt_util
+from batch_rvt_util import BatchRvt
+
+# A cache for task scripts that lives for the whole script host session (see revit_script_util.GetSessionCache()),
+# so that expensive per-file setup (parsing task data, loading lookup tables, building indexes) is paid once per
+# Revit session rather than once per file.
+#
+# The in-memory tier optionally holds at most maxItemsCount items, evicting the least recently used. The optional disk
+# tier pickles each value to a per-run folder, so values also survive across the Revit sessions of the same BatchRvt
+# run (and items evicted from memory can be reloaded). Values that cannot be pickled (e.g. Revit API objects) are only
+# held in memory. The BatchRvt monitor deletes the run's disk tier when the run ends.
+
+SESSION_CACHE_FOLDER_NAME = "SessionCache"
+CACHE_ITEM_FILE_EXTENSION = ".pickle"
+
+def GetSessionCacheFolderPath(sessionId):
+  return Path.Combine(BatchRvt.GetDataFolderPath(), SESSION_CACHE_FOLDER_NAME, path_util.GetSafeFileName(sessionId))
+
+def GetSessionCacheDiskFolderPath(sessionId, cacheName):
+  return Path.Combine(GetSessionCacheFolderPath(sessionId), path_util.GetSafeFileName(cacheName))
+
+def DeleteSessionCacheFolder(sessionId):
+  sessionCacheFolderPath = GetSessionCacheFolderPath(sessionId)
+  try:
+    if Directory.Exists(sessionCacheFolderPath):
+      Directory.Delete(sessionCacheFolderPath, True)
+  except Exception, e:
+    pass # Still in use by a Revit process that has not yet exited. Nothing else depends on the deletion.
+  return
+
+class SessionCache:
+  def __init__(self, maxItemsCount=None, diskFolderPath=None):
+    self.maxItemsCount = maxItemsCount
+    self.diskFolderPath = diskFolderPath
+    self.lock = threading.RLock()
+    self.items = collections.OrderedDict() # Least recently used first.
+    return
+
+  def SetMaxItemsCount(self, maxItemsCount):
+    with self.lock:
+      self.maxItemsCount = maxItemsCount
+      self.EvictItems()
+    return
+
+  def EnableDiskTier(self, diskFolderPath):
+    # Makes an in-memory cache persistent. The values it already holds are written to disk too.
+    with self.lock:
+      if self.diskFolderPath is None:
+        self.diskFolderPath = diskFolderPath
+        for key, value in self.items.items():
+          self.WriteItemToDisk(key, value)
+    return
+
+  def GetItemFilePath(self, key):
+    import hashlib
+    keyHash = hashlib.sha1(repr(key)).hexdigest()
+    return Path.Combine(self.diskFolderPath, keyHash + CACHE_ITEM_FILE_EXTENSION)
+
+  def ReadItemFromDisk(self, key):
+    import cPickle
+    found, value = False, None
+    if self.diskFolderPath is not None:
+      itemFilePath = self.GetItemFilePath(key)
+      if File.Exists(itemFilePath):
+        try:
+          with open(itemFilePath, "rb") as itemFile:
+            storedKey, value = cPickle.load(itemFile)
+          found = (storedKey == key)
+          if not found:
+            value = None
+        except Exception, e:
+          found, value = False, None # A partially written or unreadable item is treated as missing.
+    return found, value
+
+  def WriteItemToDisk(self, key, value):
+    import cPickle
+    if self.diskFolderPath is not None:
+      itemFilePath = self.GetItemFilePath(key)
+      tempItemFilePath = itemFilePath + "." + System.Guid.NewGuid().ToString("N")
+      try:
+        data = cPickle.dumps((key, value), cPickle.HIGHEST_PROTOCOL)
+        Directory.CreateDirectory(self.diskFolderPath)
+        with open(tempItemFilePath, "wb") as itemFile:
+          itemFile.write(data)
+        if File.Exists(itemFilePath):
+          File.Delete(itemFilePath)
+        File.Move(tempItemFilePath, itemFilePath)
+      except Exception, e:
+        # The value cannot be pickled, or another session wrote the same item concurrently. Either way the value is
+        # still held in memory.
+        if File.Exists(tempItemFilePath):
+          File.Delete(tempItemFilePath)
+    return
+
+  def DeleteItemFromDisk(self, key):
+    if self.diskFolderPath is not None:
+      itemFilePath = self.GetItemFilePath(key)
+      if File.Exists(itemFilePath):
+        File.Delete(itemFilePath)
+    return
+
+  def EvictItems(self):
+    if self.maxItemsCount is not None:
+      while len(self.items) > max(self.maxItemsCount, 0):
+        self.items.popitem(last=False)
+    return
+
+  def Contains(self, key):
+    return self.TryGet(key)[0]
+
+  def TryGet(self, key):
+    with self.lock:
+      if key in self.items:
+        value = self.items.pop(key)
+        self.items[key] = value # Most recently used.
+        return True, value
+      found, value = self.ReadItemFromDisk(key)
+      if found:
+        self.items[key] = value
+        self.EvictItems()
+      return found, value
+
+  def Get(self, key, default=None):
+    found, value = self.TryGet(key)
+    return value if found else default
+
+  def Set(self, key, value):
+    with self.lock:
+      if key in self.items:
+        del self.items[key]
+      self.items[key] = value
+      self.EvictItems()
+      self.WriteItemToDisk(key, value)
+    return
+
+  def GetOrCreate(self, key, createValue):
+    # createValue() is called with the lock held, so that concurrent callers do not duplicate the expensive work.
+    with self.lock:
+      found, value = self.TryGet(key)
+      if not found:
+        value = createValue()
+        self.Set(key, value)
+      return value
+
+  def Remove(self, key):
+    with self.lock:
+      if key in self.items:
+        del self.items[key]
+      self.DeleteItemFromDisk(key)
+    return
+
+  def Clear(self):
+    with self.lock:
+      self.items.clear()
+      if self.diskFolderPath is not None and Directory.Exists(self.diskFolderPath):
+        Directory.Delete(self.diskFolderPath, True)
+    return
+
+  def GetCount(self):
+    with self.lock:
+      return len(self.items)
@@ -0,0 +1,140 @@
+#
+# Revit Batch Processor
+#
+# Copyright (c) 2017  Dan Rumery, BVN
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+
+
+import clr
+import System
+from System.IO import File
+
+import ast
+
+import script_util
+import revit_script_util
+
+# Session hooks let a task script do its expensive initialisation once per Revit session rather than once per file.
+# A task script that contains the marker line "# batchrvt: session-hooks" is run in session hooks mode:
+#
+#   - the script is executed once, at the start of the Revit session, and on_session_start(ctx) is called if defined.
+#   - process_document(doc, ctx) is called for each file, with the opened document.
+#   - on_session_end(ctx) is called if defined, after the last file of the session (even if processing failed).
+#
+# Task scripts without the marker are executed from the top for every file, as before. So are marked scripts that do not
+# define process_document() at the top level (with a warning). This is checked by parsing the script, so that such a
+# script is not also executed once at the start of the session.
+
+ON_SESSION_START_HOOK_NAME = "on_session_start"
+PROCESS_DOCUMENT_HOOK_NAME = "process_document"
+ON_SESSION_END_HOOK_NAME = "on_session_end"
+
+SESSION_HOOKS_MARKER = "# batchrvt: session-hooks"
+
+def UsesSessionHooks(scriptFilePath):
+  return (
+      not str.IsNullOrWhiteSpace(scriptFilePath) and
+      File.Exists(scriptFilePath) and
+      any(line.strip().lower() == SESSION_HOOKS_MARKER for line in File.ReadLines(scriptFilePath))
+    )
+
+def GetTopLevelDefinedNames(statement):
+  if isinstance(statement, (ast.FunctionDef, ast.ClassDef)):
+    return [statement.name]
+  elif isinstance(statement, ast.Assign):
+    return [target.id for target in statement.targets if isinstance(target, ast.Name)]
+  elif isinstance(statement, (ast.Import, ast.ImportFrom)):
+    return [alias.asname if alias.asname is not None else alias.name for alias in statement.names]
+  return []
+
+def DefinesTopLevelName(scriptFilePath, name):
+  scriptModule = ast.parse(File.ReadAllText(scriptFilePath), scriptFilePath)
+  return any(name in GetTopLevelDefinedNames(statement) for statement in scriptModule.body)
+
+class SessionContext:
+  # The ctx object passed to each hook. Values that depend on the current file are read when called.
+  def __init__(self, uiapp, output):
+    self.UIApplication = uiapp
+    self.Output = output
+    self.Cache = revit_script_util.GetSessionCache()
+    return
+
+  def GetTaskData(self):
+    return revit_script_util.GetTaskData()
+
+  def GetSessionId(self):
+    return revit_script_util.GetSessionId()
+
+  def GetRevitFilePath(self):
+    return revit_script_util.GetRevitFilePath()
+
+  def GetProgressNumber(self):
+    return revit_script_util.GetProgressNumber()
+
+  def GetProgressMax(self):
+    return revit_script_util.GetProgressMax()
+
+  def EmitRecord(self, tableName, record):
+    revit_script_util.EmitRecord(tableName, record)
+    return
+
+class TaskScriptSession:
+  def __init__(self, scriptFilePath, uiapp, output):
+    self.scriptFilePath = scriptFilePath
+    self.context = SessionContext(uiapp, output)
+    self.scriptGlobals = None
+    self.isStarted = False
+    self.isLegacyMode = False
+    return
+
+  def GetHook(self, hookName):
+    hook = self.scriptGlobals.get(hookName) if self.scriptGlobals is not None else None
+    return hook if callable(hook) else None
+
+  def Start(self):
+    if not DefinesTopLevelName(self.scriptFilePath, PROCESS_DOCUMENT_HOOK_NAME):
+      self.isLegacyMode = True
+      self.context.Output()
+      self.context.Output(
+          "WARNING: the task script is marked for session hooks but does not define a " + PROCESS_DOCUMENT_HOOK_NAME +
+          "(doc, ctx) function. It will be executed for each file instead."
+        )
+    else:
+      self.scriptGlobals = script_util.ExecuteScript(self.scriptFilePath)
+      if self.GetHook(PROCESS_DOCUMENT_HOOK_NAME) is None:
+        raise Exception("ERROR: the task script's " + PROCESS_DOCUMENT_HOOK_NAME + " is not a function.")
+      onSessionStart = self.GetHook(ON_SESSION_START_HOOK_NAME)
+      if onSessionStart is not None:
+        onSessionStart(self.context)
+    self.isStarted = True
+    return
+
+  def ProcessDocument(self, doc):
+    if not self.isStarted:
+      raise Exception("ERROR: the task script session was not started (see the error reported at the start of the session).")
+    if self.isLegacyMode:
+      script_util.ExecuteScript(self.scriptFilePath)
+    else:
+      self.GetHook(PROCESS_DOCUMENT_HOOK_NAME)(doc, self.context)
+    return
+
+  def End(self):
+    # Called even if Start() failed part way, so that on_session_end() can release whatever was acquired.
+    onSessionEnd = self.GetHook(ON_SESSION_END_HOOK_NAME)
+    if onSessionEnd is not None:
+      onSessionEnd(self.context)
+    return
@@ -0,0 +1,205 @@
+#
+# Revit Batch Processor
+#
+# Copyright (c) 2017  Dan Rumery, BVN
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+
+
+import clr
+import System
+
+import threading
+
+import exception_util
+import revit_file_priority
+from batch_rvt_util import RevitVersion
+
+REVIT_VERSION_SESSION_LIMITS_SEPARATOR = ";"
+REVIT_VERSION_SESSION_LIMIT_DELIMITER = "="
+DEFAULT_REVIT_VERSION_SESSION_LIMIT = 1
+
+def GetSessionFilesCounts(queuedFilesCount, workersCount, useSameSession):
+  # Returns the sizes of the sessions the queued files are split into, e.g. 10 files and 3 workers -> [4, 3, 3].
+  if useSameSession:
+    # Shares the queued files evenly between the version's workers.
+    sessionsCount = max(min(workersCount, queuedFilesCount), 1)
+    return [
+        (queuedFilesCount // sessionsCount) + (1 if sessionIndex < (queuedFilesCount % sessionsCount) else 0)
+        for sessionIndex in range(sessionsCount)
+      ]
+  return [1] * queuedFilesCount
+
+class ProgressAllocator:
+  def __init__(self, totalFilesCount):
+    self.lock = threading.Lock()
+    self.nextProgressNumber = 1
+    self.totalFilesCount = totalFilesCount
+    return
+
+  def Allocate(self, filesCount):
+    with self.lock:
+      progressNumber = self.nextProgressNumber
+      self.nextProgressNumber += filesCount
+    return progressNumber
+
+  def AddToTotal(self, filesCount):
+    with self.lock:
+      self.totalFilesCount += filesCount
+    return
+
+  def GetTotal(self):
+    with self.lock:
+      totalFilesCount = self.totalFilesCount
+    return totalFilesCount
+
+class RevitVersionQueue:
+  def __init__(self, revitVersion, supportedRevitFiles, workersCount):
+    self.RevitVersion = revitVersion
+    self.condition = threading.Condition()
+    self.queuedRevitFiles = revit_file_priority.PriorityQueue()
+    for supportedRevitFileInfo in supportedRevitFiles:
+      self.queuedRevitFiles.Push(supportedRevitFileInfo, supportedRevitFileInfo.GetPriority())
+    self.activeSessionsCount = 0
+    self.workersCount = workersCount
+    self.sessionFilesCounts = [] # Sizes of the sessions still to be taken, planned when the queue is first shared out.
+    return
+
+  def TakeSessionFiles(self, useSameSession):
+    # Returns None when the queue is empty and no session of this version can requeue files.
+    with self.condition:
+      while len(self.queuedRevitFiles) == 0 and self.activeSessionsCount > 0:
+        self.condition.wait()
+      if len(self.queuedRevitFiles) == 0:
+        return None
+      if not self.sessionFilesCounts:
+        # Planned once for the initial queue (and again for files requeued after the plan has been used up), since
+        # re-splitting at every take would give ever smaller sessions (e.g. 4, 2, 2, 1, 1 rather than 4, 3, 3).
+        self.sessionFilesCounts = GetSessionFilesCounts(len(self.queuedRevitFiles), self.workersCount, useSameSession)
+      sessionFilesCount = min(self.sessionFilesCounts.pop(0), len(self.queuedRevitFiles))
+      sessionRevitFiles = [self.queuedRevitFiles.Pop() for index in range(sessionFilesCount)]
+      self.activeSessionsCount += 1
+    return sessionRevitFiles
+
+  def CompleteSession(self, requeuedRevitFiles):
+    with self.condition:
+      for supportedRevitFileInfo in requeuedRevitFiles:
+        self.queuedRevitFiles.Push(supportedRevitFileInfo, supportedRevitFileInfo.GetPriority())
+      self.activeSessionsCount -= 1
+      self.condition.notify_all()
+    return
+
+class RevitVersionSessionSlots:
+  # Bounds the number of concurrent sessions per Revit version when workers are not dedicated to a version.
+  def __init__(self, revitVersionSessionLimits, maxConcurrentSessions):
+    self.lock = threading.Lock()
+    self.revitVersionSessionLimits = revitVersionSessionLimits
+    self.maxConcurrentSessions = maxConcurrentSessions
+    self.semaphores = {}
+    return
+
+  def GetSemaphore(self, revitVersion):
+    with self.lock:
+      semaphore = self.semaphores.get(revitVersion)
+      if semaphore is None:
+        semaphore = threading.BoundedSemaphore(
+            GetRevitVersionSessionLimit(self.revitVersionSessionLimits, revitVersion, self.maxConcurrentSessions)
+          )
+        self.semaphores[revitVersion] = semaphore
+    return semaphore
+
+  def Acquire(self, revitVersion):
+    self.GetSemaphore(revitVersion).acquire()
+    return
+
+  def TryAcquire(self, revitVersion):
+    return self.GetSemaphore(revitVersion).acquire(False)
+
+  def Release(self, revitVersion):
+    self.GetSemaphore(revitVersion).release()
+    return
+
+def OrderRevitVersionGroupsByPriority(revitVersionGroups):
+  # Groups containing higher priority files go first (otherwise in Revit version order) so that, when the groups
+  # do not all run at once, urgent files do not wait behind entire groups of lower priority files.
+  return sorted(
+      revitVersionGroups,
+      key=lambda revitVersionGroup: -max(
+          supportedRevitFileInfo.GetPriority() for supportedRevitFileInfo in revitVersionGroup[1]
+        )
+    )
+
+def ParseRevitVersionSessionLimits(revitVersionSessionLimitsText):
+  revitVersionSessionLimits = {}
+  if not str.IsNullOrWhiteSpace(revitVersionSessionLimitsText):
+    for entry in revitVersionSessionLimitsText.Split(REVIT_VERSION_SESSION_LIMITS_SEPARATOR):
+      if str.IsNullOrWhiteSpace(entry):
+        continue
+      parts = entry.Split(REVIT_VERSION_SESSION_LIMIT_DELIMITER)
+      if len(parts) != 2:
+        raise Exception("Invalid Revit version session limit: " + entry.Trim())
+      revitVersionSessionLimits[parts[0].Trim()] = int(parts[1].Trim())
+  return revitVersionSessionLimits
+
+def GetRevitVersionSessionLimit(revitVersionSessionLimits, revitVersion, maxConcurrentSessions):
+  sessionLimit = revitVersionSessionLimits.get(
+      RevitVersion.GetRevitVersionText(revitVersion),
+      DEFAULT_REVIT_VERSION_SESSION_LIMIT
+    )
+  return max(min(sessionLimit, maxConcurrentSessions), 1)
+
+def GetWorkerOutput(output, workerName):
+  def workerOutput(m=""):
+    output(("[" + workerName + "] " + m) if m != "" else m)
+    return
+  return workerOutput
+
+def RunWorkers(workers, maxConcurrentSessions, output):
+  # Each worker is a (name, action) pair. An action receives its prefixed output function and a
+  # session slot object whose acquire() / release() methods bound the total number of Revit sessions.
+  # Returns True if any worker failed.
+  failed = [False] # Needs to be a list so it can be captured by reference in closures.
+  sessionSlots = threading.BoundedSemaphore(maxConcurrentSessions)
+
+  if maxConcurrentSessions <= 1:
+    # Sequential processing: run each worker to completion in turn, on this thread.
+    for workerName, workerAction in workers:
+      workerAction(output, sessionSlots)
+    return failed[0]
+
+  def createThreadAction(workerName, workerAction):
+    workerOutput = GetWorkerOutput(output, workerName)
+    def threadAction():
+      try:
+        workerAction(workerOutput, sessionSlots)
+      except Exception, e:
+        workerOutput()
+        workerOutput("ERROR: An error occurred while processing Revit files! Worker stopped.")
+        exception_util.LogOutputErrorDetails(e, workerOutput)
+        failed[0] = True
+      return
+    return threadAction
+
+  threads = [
+      threading.Thread(target=createThreadAction(workerName, workerAction), name=workerName)
+      for workerName, workerAction in workers
+    ]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+
+  return failed[0]
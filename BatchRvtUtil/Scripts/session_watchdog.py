@@ -0,0 +1,170 @@
+#
+# Revit Batch Processor
+#
+# Copyright (c) 2017  Dan Rumery, BVN
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+
+
+import clr
+import System
+
+import ipc_protocol
+import path_util
+import time_util
+
+SECONDS_PER_MINUTE = 60
+BYTES_PER_MEGABYTE = 1024 * 1024
+
+# The script host sends a heartbeat every few seconds from a background thread, so a long silence means the
+# Revit process is wedged (or the pipe is broken) rather than just busy. NOTE: heartbeats keep arriving while Revit's
+# main thread is hung, so such hangs are caught by the phase timeouts (see DEFAULT_PHASE_TIMEOUTS_IN_MINUTES).
+HEARTBEAT_TIMEOUT_IN_SECONDS = 5 * SECONDS_PER_MINUTE
+
+PHASE_TIMEOUTS_SEPARATOR = ";"
+PHASE_TIMEOUT_DELIMITER = "="
+
+KNOWN_PHASES = [
+    ipc_protocol.PHASE_STARTUP,
+    ipc_protocol.PHASE_WAITING_FOR_OPEN,
+    ipc_protocol.PHASE_OPENING,
+    ipc_protocol.PHASE_UPGRADING,
+    ipc_protocol.PHASE_TASK,
+    ipc_protocol.PHASE_CLOSING,
+    ipc_protocol.PHASE_EXPORTING
+  ]
+
+PHASE_TIMEOUT_SCALING_NONE = "none"
+PHASE_TIMEOUT_SCALING_FILE_SIZE = "fileSize"
+PHASE_TIMEOUT_SCALING_HISTORY = "history"
+PHASE_TIMEOUT_SCALING_OPTIONS = [
+    PHASE_TIMEOUT_SCALING_NONE,
+    PHASE_TIMEOUT_SCALING_FILE_SIZE,
+    PHASE_TIMEOUT_SCALING_HISTORY
+  ]
+
+# With file size scaling, a phase timeout applies as-is to files up to this size and grows in proportion beyond it.
+FILE_SIZE_SCALING_REFERENCE_IN_MEGABYTES = 500
+FILE_SIZE_SCALED_PHASES = [ipc_protocol.PHASE_OPENING, ipc_protocol.PHASE_UPGRADING, ipc_protocol.PHASE_CLOSING]
+
+# With history scaling, a phase timeout is raised to this multiple of the file's recorded processing time.
+HISTORY_SCALING_FACTOR = 3
+HISTORY_SCALED_PHASES = [ipc_protocol.PHASE_OPENING, ipc_protocol.PHASE_UPGRADING, ipc_protocol.PHASE_TASK]
+
+# Applied to the phases that run inside Revit (where a hung main thread produces no other signal) unless configured
+# otherwise. The task phase has no default since task scripts vary too widely (see the processing timeout instead).
+# Nor has the waiting-for-open phase: how long a file waits for the file server throttle depends on the load on the
+# file servers, and the script host keeps sending heartbeats while it waits.
+DEFAULT_PHASE_TIMEOUTS_IN_MINUTES = {
+    ipc_protocol.PHASE_STARTUP : 30,
+    ipc_protocol.PHASE_OPENING : 60,
+    ipc_protocol.PHASE_UPGRADING : 120,
+    ipc_protocol.PHASE_CLOSING : 30,
+    ipc_protocol.PHASE_EXPORTING : 30
+  }
+
+def ParsePhaseTimeOuts(phaseTimeOutsText):
+  # e.g. "opening=30;upgrading=90;task=20". Timeouts are in minutes; 0 means no timeout for the phase, and phases
+  # with no entry get their default timeout (if any).
+  phaseTimeOutsInMinutes = dict(DEFAULT_PHASE_TIMEOUTS_IN_MINUTES)
+  if not str.IsNullOrWhiteSpace(phaseTimeOutsText):
+    for entry in phaseTimeOutsText.Split(PHASE_TIMEOUTS_SEPARATOR):
+      if str.IsNullOrWhiteSpace(entry):
+        continue
+      parts = entry.Split(PHASE_TIMEOUT_DELIMITER)
+      if len(parts) != 2:
+        raise Exception("Invalid phase timeout: " + entry.Trim())
+      phase = parts[0].Trim()
+      if phase not in KNOWN_PHASES:
+        raise Exception("Unknown phase: " + phase)
+      phaseTimeOutsInMinutes[phase] = int(parts[1].Trim())
+  return phaseTimeOutsInMinutes
+
+def ParsePhaseTimeOutScaling(phaseTimeOutScalingText):
+  if str.IsNullOrWhiteSpace(phaseTimeOutScalingText):
+    return PHASE_TIMEOUT_SCALING_NONE
+  phaseTimeOutScaling = phaseTimeOutScalingText.Trim()
+  if phaseTimeOutScaling not in PHASE_TIMEOUT_SCALING_OPTIONS:
+    raise Exception("Unknown phase timeout scaling: " + phaseTimeOutScaling)
+  return phaseTimeOutScaling
+
+class PhaseTimeOutPolicy:
+  def __init__(self, phaseTimeOutsInMinutes, phaseTimeOutScaling, processingHistory=None):
+    self.phaseTimeOutsInMinutes = phaseTimeOutsInMinutes
+    self.phaseTimeOutScaling = phaseTimeOutScaling
+    self.processingHistory = processingHistory
+    return
+
+  def GetPhaseTimeOutInSeconds(self, phase, revitFilePath):
+    phaseTimeOutInMinutes = self.phaseTimeOutsInMinutes.get(phase, 0)
+    if phaseTimeOutInMinutes <= 0:
+      return None
+    phaseTimeOutInSeconds = float(phaseTimeOutInMinutes * SECONDS_PER_MINUTE)
+    if not str.IsNullOrWhiteSpace(revitFilePath):
+      if self.phaseTimeOutScaling == PHASE_TIMEOUT_SCALING_FILE_SIZE and phase in FILE_SIZE_SCALED_PHASES:
+        fileSize = path_util.GetFileSize(revitFilePath)
+        if fileSize is not None:
+          fileSizeInMegabytes = fileSize / float(BYTES_PER_MEGABYTE)
+          phaseTimeOutInSeconds *= max(fileSizeInMegabytes / FILE_SIZE_SCALING_REFERENCE_IN_MEGABYTES, 1.0)
+      elif (
+          self.phaseTimeOutScaling == PHASE_TIMEOUT_SCALING_HISTORY and
+          phase in HISTORY_SCALED_PHASES and
+          self.processingHistory is not None
+        ):
+        durationSeconds = self.processingHistory.TryGetFileDuration(revitFilePath)
+        if durationSeconds is not None:
+          phaseTimeOutInSeconds = max(phaseTimeOutInSeconds, HISTORY_SCALING_FACTOR * durationSeconds)
+    return phaseTimeOutInSeconds
+
+class SessionWatchdog:
+  def __init__(self, phaseTimeOutPolicy=None):
+    self.phaseTimeOutPolicy = phaseTimeOutPolicy
+    self.phase = None
+    self.phaseStartTimeUtc = None
+    self.phaseTimeOutInSeconds = None
+    self.lastHeartbeatTimeUtc = None
+    return
+
+  def OnPhase(self, phase, revitFilePath):
+    self.phase = phase
+    self.phaseStartTimeUtc = time_util.GetDateTimeUtcNow()
+    self.phaseTimeOutInSeconds = (
+        self.phaseTimeOutPolicy.GetPhaseTimeOutInSeconds(phase, revitFilePath)
+        if self.phaseTimeOutPolicy is not None else
+        None
+      )
+    return
+
+  def OnHeartbeat(self):
+    self.lastHeartbeatTimeUtc = time_util.GetDateTimeUtcNow()
+    return
+
+  def GetTimeOutMessage(self):
+    # Returns a description of the expired timeout, or None if the session looks healthy.
+    timeOutMessage = None
+    if self.phaseTimeOutInSeconds is not None:
+      if time_util.GetSecondsElapsedSinceUtc(self.phaseStartTimeUtc) > self.phaseTimeOutInSeconds:
+        timeOutMessage = (
+            "Timed-out in the '" + self.phase + "' phase (after " +
+            str(int(self.phaseTimeOutInSeconds / SECONDS_PER_MINUTE)) + " minutes)."
+          )
+    if timeOutMessage is None and self.lastHeartbeatTimeUtc is not None:
+      if time_util.GetSecondsElapsedSinceUtc(self.lastHeartbeatTimeUtc) > HEARTBEAT_TIMEOUT_IN_SECONDS:
+        timeOutMessage = (
+            "No heartbeat from the Revit script host for " +
+            str(int(HEARTBEAT_TIMEOUT_IN_SECONDS / SECONDS_PER_MINUTE)) + " minutes (last phase: '" + str(self.phase) + "')."
+          )
+    return timeOutMessage
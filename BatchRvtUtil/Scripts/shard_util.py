@@ -0,0 +1,94 @@
+#
+# Revit Batch Processor
+#
+# Copyright (c) 2017  Dan Rumery, BVN
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+
+
+import clr
+import System
+
+import processing_history
+
+# Splits a Revit file list between N nodes without any coordination between them. Every node computes the same
+# split, provided that it sees the same files (and the same shard history file, if one is used).
+
+SHARD_OPTION_DELIMITER = "/"
+
+SHARD_COST_SOURCE_FILE_SIZE = "fileSize"
+SHARD_COST_SOURCE_SHARD_HISTORY = "shardHistory"
+
+class RevitFileShard:
+  def __init__(self, shardNumber):
+    self.ShardNumber = shardNumber
+    self.SupportedRevitFiles = []
+    self.Cost = 0
+    return
+
+def ParseShardOption(shardOptionText):
+  # Returns a (shardNumber, shardsCount) pair, where shardNumber is 1-based, or None if the text is not valid.
+  shard = None
+  parts = shardOptionText.Split(SHARD_OPTION_DELIMITER) if shardOptionText is not None else []
+  if len(parts) == 2:
+    try:
+      shardNumber, shardsCount = int(parts[0].Trim()), int(parts[1].Trim())
+      if shardsCount >= 1 and 1 <= shardNumber <= shardsCount:
+        shard = (shardNumber, shardsCount)
+    except ValueError, e:
+      pass
+  return shard
+
+def GetShardCostSource(shardHistoryFilePath):
+  return SHARD_COST_SOURCE_SHARD_HISTORY if shardHistoryFilePath is not None else SHARD_COST_SOURCE_FILE_SIZE
+
+def GetShardCostFunction(shardHistoryFilePath):
+  # NOTE: the local processing history is deliberately not used here because it differs between nodes.
+  if shardHistoryFilePath is not None:
+    shardHistory = processing_history.ProcessingHistory(shardHistoryFilePath)
+    shardHistory.Load()
+    def getCost(revitFileInfo):
+      estimatedSeconds, estimateSource = shardHistory.EstimateFileDuration(
+          revitFileInfo.GetFullPath(),
+          revitFileInfo.GetFileSize()
+        )
+      return estimatedSeconds
+    return getCost
+  def getFileSizeCost(revitFileInfo):
+    return revitFileInfo.GetFileSize() or 0
+  return getFileSizeCost
+
+def PartitionRevitFiles(supportedRevitFiles, shardsCount, getCost):
+  # Longest-processing-time-first assignment: files are taken in order of decreasing priority then decreasing
+  # cost (ties broken by path) and each is assigned to the shard with the least total cost so far (ties broken by
+  # shard number). Taking the higher priority files first spreads them across the shards.
+  costedRevitFiles = [
+      (getCost(supportedRevitFileInfo.GetRevitFileInfo()), supportedRevitFileInfo)
+      for supportedRevitFileInfo in supportedRevitFiles
+    ]
+  costedRevitFiles.sort(
+      key=lambda costedRevitFile: (
+          -costedRevitFile[1].GetPriority(),
+          -costedRevitFile[0],
+          costedRevitFile[1].GetRevitFileInfo().GetFullPath().ToLowerInvariant()
+        )
+    )
+  shards = [RevitFileShard(shardIndex + 1) for shardIndex in range(shardsCount)]
+  for cost, supportedRevitFileInfo in costedRevitFiles:
+    shard = min(shards, key=lambda shard: (shard.Cost, shard.ShardNumber))
+    shard.SupportedRevitFiles.append(supportedRevitFileInfo)
+    shard.Cost += cost
+  return shards
@@ -0,0 +1,378 @@
+#
+# Revit Batch Processor
+#
+# Copyright (c) 2017  Dan Rumery, BVN
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+
+
+import clr
+import System
+from System import Guid
+from System.IO import File, Directory, Path, FileStream, FileMode, FileAccess, FileShare, IOException
+
+import threading
+
+import path_util
+import time_util
+import json_util
+import text_file_util
+import environment
+import thread_util
+import revit_file_priority
+
+# A work queue stored in a (shared) folder, allowing several BatchRvt nodes to pull Revit files from one list.
+#
+# Each work item is a small json file that moves between the following sub-folders. Every transition is a
+# single File.Move() within the queue folder, which is atomic, so exactly one node wins any given transition.
+#
+#   pending   -> leased      (claim)
+#   leased    -> completed   (complete)
+#   leased    -> failed      (fail)
+#   leased    -> pending     (release, or lease expiry)
+#
+# A node keeps its leases alive by periodically touching the leased item files (heartbeat). Any node may return
+# an item to the pending folder once its lease has not been renewed for the lease expiry period, e.g. because
+# the node that claimed it has died.
+#
+# Pending items are claimed in item name order, i.e. highest priority first and then in seeding order. Released and
+# expired items keep their names, and so their place in the queue.
+#
+# NOTE: lease expiry compares file timestamps written by different machines, so the expiry period must
+#       comfortably exceed any clock skew between the nodes.
+
+PENDING_FOLDER_NAME = "pending"
+LEASED_FOLDER_NAME = "leased"
+COMPLETED_FOLDER_NAME = "completed"
+FAILED_FOLDER_NAME = "failed"
+
+QUEUE_MANIFEST_FILENAME = "queue.json"
+QUEUE_SEED_LOCK_FILENAME = "queue.seed.lock"
+
+WORK_ITEM_FILE_EXTENSION = ".json"
+WORK_ITEM_NAME_DELIMITER = "."
+UNKNOWN_REVIT_VERSION_TEXT = "unknown"
+# Requeued items are renamed with this prefix and the time they were requeued in place of their seed sequence number.
+# It sorts after the (digit) sequence numbers, so a requeued item goes behind the other items of the same priority.
+REQUEUED_SEQUENCE_PREFIX = "R"
+REQUEUED_SEQUENCE_TIME_FORMAT = "yyyyMMddHHmmssfff"
+
+LEASE_HEARTBEAT_INTERVAL_IN_SECONDS = 30
+LEASE_EXPIRY_IN_SECONDS = 10 * 60
+QUEUE_SEED_WAIT_TIMEOUT_IN_SECONDS = 10 * 60
+QUEUE_POLL_INTERVAL_IN_SECONDS = 5
+
+WORK_ITEM__REVIT_FILE_PATH = "revitFilePath"
+WORK_ITEM__FILE_REVIT_VERSION = "fileRevitVersion"
+WORK_ITEM__PRIORITY = "priority"
+WORK_ITEM__ATTEMPTS = "attempts"
+WORK_ITEM__OWNER = "owner"
+WORK_ITEM__REASON = "reason"
+
+def GetCurrentNodeName():
+  return environment.GetMachineName() + ":" + str(System.Diagnostics.Process.GetCurrentProcess().Id)
+
+def GetWorkItemName(priority, sequenceText, fileRevitVersionText):
+  # Item names sort in dispatch order: highest priority first, then in the order the items were seeded (or requeued).
+  return str.Join(
+      WORK_ITEM_NAME_DELIMITER,
+      revit_file_priority.GetSortablePriorityText(priority),
+      sequenceText,
+      fileRevitVersionText if fileRevitVersionText is not None else UNKNOWN_REVIT_VERSION_TEXT,
+      Guid.NewGuid().ToString("N")
+    ) + WORK_ITEM_FILE_EXTENSION
+
+def GetSeededSequenceText(sequenceNumber):
+  return sequenceNumber.ToString("D8")
+
+def GetRequeuedSequenceText():
+  return REQUEUED_SEQUENCE_PREFIX + time_util.GetDateTimeUtcNow().ToString(REQUEUED_SEQUENCE_TIME_FORMAT)
+
+def GetRequeuedWorkItemName(workItemName):
+  nameParts = workItemName.Split(WORK_ITEM_NAME_DELIMITER)
+  nameParts[1] = GetRequeuedSequenceText()
+  return str.Join(WORK_ITEM_NAME_DELIMITER, nameParts)
+
+def GetWorkItemFileRevitVersionText(workItemName):
+  fileRevitVersionText = workItemName.Split(WORK_ITEM_NAME_DELIMITER)[2]
+  return fileRevitVersionText if fileRevitVersionText != UNKNOWN_REVIT_VERSION_TEXT else None
+
+def TryMoveFile(sourceFilePath, destinationFilePath):
+  moved = False
+  try:
+    File.Move(sourceFilePath, destinationFilePath)
+    moved = True
+  except IOException, e:
+    pass # Another node won the transition.
+  return moved
+
+class WorkItem:
+  def __init__(self, name, data):
+    self.Name = name
+    self.Data = data
+    return
+
+  def GetRevitFilePath(self):
+    return self.Data[WORK_ITEM__REVIT_FILE_PATH]
+
+  def GetPriority(self):
+    return self.Data.get(WORK_ITEM__PRIORITY, revit_file_priority.DEFAULT_PRIORITY)
+
+  def GetAttempts(self):
+    return self.Data.get(WORK_ITEM__ATTEMPTS, 0)
+
+class SharedWorkQueue:
+  def __init__(self, queueFolderPath):
+    self.queueFolderPath = queueFolderPath
+    self.nodeName = GetCurrentNodeName()
+    self.lock = threading.Lock()
+    self.leasedItemNames = set()
+    # Items this node could not process (e.g. file not reachable or Revit version not installed on this node). They
+    # are returned to the queue for other nodes rather than failed for good, and this node does not claim them again.
+    self.skippedItemNames = set()
+    self.heartbeatStopEvent = threading.Event()
+    self.heartbeatThread = None
+    return
+
+  def GetFolderPath(self, folderName):
+    return Path.Combine(self.queueFolderPath, folderName)
+
+  def GetItemFilePath(self, folderName, itemName):
+    return Path.Combine(self.GetFolderPath(folderName), itemName)
+
+  def GetManifestFilePath(self):
+    return Path.Combine(self.queueFolderPath, QUEUE_MANIFEST_FILENAME)
+
+  def ReadItemData(self, itemFilePath):
+    data = {}
+    jobject = json_util.DeserializeToJObject(text_file_util.ReadFromTextFile(itemFilePath))
+    for jproperty in jobject.Properties():
+      data[jproperty.Name] = json_util.GetValueFromJValue(jproperty.Value)
+    return data
+
+  def WriteItemData(self, itemFilePath, data):
+    text_file_util.WriteToTextFile(itemFilePath, json_util.SerializeObject(data))
+    return
+
+  def CreateFolders(self):
+    for folderName in [PENDING_FOLDER_NAME, LEASED_FOLDER_NAME, COMPLETED_FOLDER_NAME, FAILED_FOLDER_NAME]:
+      path_util.CreateDirectory(self.GetFolderPath(folderName))
+    return
+
+  def IsSeeded(self):
+    return File.Exists(self.GetManifestFilePath())
+
+  def TrySeed(self, workItemsData):
+    # Only the first node to create the seed lock file populates the queue. The manifest is written last
+    # so that other nodes never see a partially populated queue.
+    self.CreateFolders()
+    try:
+      seedLockStream = FileStream(
+          Path.Combine(self.queueFolderPath, QUEUE_SEED_LOCK_FILENAME),
+          FileMode.CreateNew,
+          FileAccess.Write,
+          FileShare.None
+        )
+      seedLockStream.Dispose()
+    except IOException, e:
+      return False
+    for sequenceNumber, data in enumerate(workItemsData):
+      itemName = GetWorkItemName(
+          data[WORK_ITEM__PRIORITY],
+          GetSeededSequenceText(sequenceNumber + 1),
+          data.get(WORK_ITEM__FILE_REVIT_VERSION)
+        )
+      self.WriteItemData(self.GetItemFilePath(PENDING_FOLDER_NAME, itemName), data)
+    manifest = {
+        "itemsCount" : len(workItemsData),
+        "seededBy" : self.nodeName,
+        "seeded" : time_util.GetTimestampObject(time_util.GetDateTimeNow())
+      }
+    text_file_util.WriteToTextFile(self.GetManifestFilePath(), json_util.SerializeObject(manifest, True))
+    return True
+
+  def WaitUntilSeeded(self):
+    waitStartTimeUtc = time_util.GetDateTimeUtcNow()
+    while not self.IsSeeded():
+      if time_util.GetSecondsElapsedSinceUtc(waitStartTimeUtc) > QUEUE_SEED_WAIT_TIMEOUT_IN_SECONDS:
+        return False
+      thread_util.SleepForSeconds(QUEUE_POLL_INTERVAL_IN_SECONDS)
+    return True
+
+  def GetItemsCount(self):
+    manifest = json_util.DeserializeToJObject(text_file_util.ReadFromTextFile(self.GetManifestFilePath()))
+    return int(json_util.GetValueFromJValue(manifest["itemsCount"]))
+
+  def GetItemNames(self, folderName):
+    return sorted(Path.GetFileName(itemFilePath) for itemFilePath in Directory.GetFiles(self.GetFolderPath(folderName)))
+
+  def IsClaimableItem(self, itemName, isClaimableFileRevitVersionText=None):
+    with self.lock:
+      if itemName in self.skippedItemNames:
+        return False
+    return (
+        isClaimableFileRevitVersionText is None or
+        isClaimableFileRevitVersionText(GetWorkItemFileRevitVersionText(itemName))
+      )
+
+  def GetClaimableItemNames(self, isClaimableFileRevitVersionText=None):
+    return [
+        itemName for itemName in self.GetItemNames(PENDING_FOLDER_NAME)
+        if self.IsClaimableItem(itemName, isClaimableFileRevitVersionText)
+      ]
+
+  def GetPendingFileRevitVersionTexts(self):
+    # Distinct Revit file versions of the items this node may claim, in claim (priority) order.
+    fileRevitVersionTexts = []
+    for itemName in self.GetClaimableItemNames():
+      fileRevitVersionText = GetWorkItemFileRevitVersionText(itemName)
+      if fileRevitVersionText not in fileRevitVersionTexts:
+        fileRevitVersionTexts.append(fileRevitVersionText)
+    return fileRevitVersionTexts
+
+  def HasPendingOrLeasedItems(self, isClaimableFileRevitVersionText=None):
+    # Only counts items this node could still claim (leased items may yet expire and return to the queue).
+    return any(
+        self.IsClaimableItem(itemName, isClaimableFileRevitVersionText)
+        for folderName in [PENDING_FOLDER_NAME, LEASED_FOLDER_NAME]
+        for itemName in self.GetItemNames(folderName)
+      )
+
+  def ReclaimExpiredLeases(self, output):
+    for itemName in self.GetItemNames(LEASED_FOLDER_NAME):
+      with self.lock:
+        if itemName in self.leasedItemNames:
+          continue
+      leasedFilePath = self.GetItemFilePath(LEASED_FOLDER_NAME, itemName)
+      lastHeartbeatUtc = path_util.GetLastWriteTimeUtc(leasedFilePath)
+      if lastHeartbeatUtc is None:
+        continue
+      if time_util.GetSecondsElapsedSinceUtc(lastHeartbeatUtc) > LEASE_EXPIRY_IN_SECONDS:
+        if TryMoveFile(leasedFilePath, self.GetItemFilePath(PENDING_FOLDER_NAME, itemName)):
+          output()
+          output("WARNING: Work queue lease expired. The item has been returned to the queue: " + itemName)
+    return
+
+  def TryClaimItem(self, itemName):
+    pendingFilePath = self.GetItemFilePath(PENDING_FOLDER_NAME, itemName)
+    leasedFilePath = self.GetItemFilePath(LEASED_FOLDER_NAME, itemName)
+    try:
+      # Touch the item before claiming it so that it does not arrive in the leased folder with a stale
+      # timestamp (which other nodes would immediately treat as an expired lease).
+      File.SetLastWriteTimeUtc(pendingFilePath, time_util.GetDateTimeUtcNow())
+    except Exception, e:
+      return None
+    if not TryMoveFile(pendingFilePath, leasedFilePath):
+      return None
+    with self.lock:
+      self.leasedItemNames.add(itemName)
+    data = self.ReadItemData(leasedFilePath)
+    data[WORK_ITEM__ATTEMPTS] = data.get(WORK_ITEM__ATTEMPTS, 0) + 1
+    data[WORK_ITEM__OWNER] = self.nodeName
+    self.WriteItemData(leasedFilePath, data)
+    return WorkItem(itemName, data)
+
+  def ClaimItems(self, maxItemsCount, output, isClaimableFileRevitVersionText=None):
+    # Claims up to maxItemsCount pending items, all of the same Revit file version as the first item claimed.
+    self.ReclaimExpiredLeases(output)
+    workItems = []
+    fileRevitVersionText = None
+    for itemName in self.GetClaimableItemNames(isClaimableFileRevitVersionText):
+      if len(workItems) >= maxItemsCount:
+        break
+      if workItems and GetWorkItemFileRevitVersionText(itemName) != fileRevitVersionText:
+        continue
+      workItem = self.TryClaimItem(itemName)
+      if workItem is not None:
+        if not workItems:
+          fileRevitVersionText = GetWorkItemFileRevitVersionText(itemName)
+        workItems.append(workItem)
+    return workItems
+
+  def FinishItem(self, workItem, folderName, output, reason=None, finishedItemName=None):
+    leasedFilePath = self.GetItemFilePath(LEASED_FOLDER_NAME, workItem.Name)
+    with self.lock:
+      self.leasedItemNames.discard(workItem.Name)
+    if reason is not None:
+      workItem.Data[WORK_ITEM__REASON] = reason
+      try:
+        self.WriteItemData(leasedFilePath, workItem.Data)
+      except Exception, e:
+        pass # The lease may have been lost; detected below.
+    if finishedItemName is None:
+      finishedItemName = workItem.Name
+    if not TryMoveFile(leasedFilePath, self.GetItemFilePath(folderName, finishedItemName)):
+      output()
+      output("WARNING: Work queue lease was lost before the item could be finished: " + workItem.Name)
+    return
+
+  def CompleteItem(self, workItem, output):
+    self.FinishItem(workItem, COMPLETED_FOLDER_NAME, output)
+    return
+
+  def FailItem(self, workItem, reason, output):
+    self.FinishItem(workItem, FAILED_FOLDER_NAME, output, reason)
+    return
+
+  def RequeueItem(self, workItem, output, reason=None):
+    # Returns the item to the back of the queue (behind the other items of the same priority), e.g. when the file was
+    # deferred, so that this node does not claim it again straight away. Only expired leases are returned to the queue
+    # under their original name (see ReclaimExpiredLeases).
+    self.FinishItem(workItem, PENDING_FOLDER_NAME, output, reason, GetRequeuedWorkItemName(workItem.Name))
+    return
+
+  def SkipItem(self, workItem, reason, output):
+    # Returns the item to the queue for other nodes; this node will not claim it again.
+    with self.lock:
+      self.skippedItemNames.add(workItem.Name)
+    self.FinishItem(workItem, PENDING_FOLDER_NAME, output, reason)
+    return
+
+  def RenewLeases(self):
+    with self.lock:
+      itemNames = list(self.leasedItemNames)
+    nowUtc = time_util.GetDateTimeUtcNow()
+    for itemName in itemNames:
+      try:
+        File.SetLastWriteTimeUtc(self.GetItemFilePath(LEASED_FOLDER_NAME, itemName), nowUtc)
+      except Exception, e:
+        pass # The lease may have expired and been reclaimed by another node.
+    return
+
+  def StartHeartbeat(self):
+    def heartbeatAction():
+      while not self.heartbeatStopEvent.wait(LEASE_HEARTBEAT_INTERVAL_IN_SECONDS):
+        self.RenewLeases()
+      return
+    self.heartbeatStopEvent.clear()
+    self.heartbeatThread = threading.Thread(target=heartbeatAction, name="WorkQueueHeartbeat")
+    self.heartbeatThread.daemon = True
+    self.heartbeatThread.start()
+    return
+
+  def StopHeartbeat(self):
+    self.heartbeatStopEvent.set()
+    if self.heartbeatThread is not None:
+      self.heartbeatThread.join()
+      self.heartbeatThread = None
+    return
+
+def CreateWorkItemData(revitFilePath, fileRevitVersionText, priority):
+  return {
+      WORK_ITEM__REVIT_FILE_PATH : revitFilePath,
+      WORK_ITEM__FILE_REVIT_VERSION : fileRevitVersionText,
+      WORK_ITEM__PRIORITY : priority
+    }
@@ -0,0 +1,280 @@
+#
+# Revit Batch Processor
+#
+# Copyright (c) 2017  Dan Rumery, BVN
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+
+# A stand-in for Revit and the script host (revit_script_host.py), for exercising and benchmarking the BatchRvt monitor
+# without Revit. revit_process.StartRevitProcess() runs it with IronPython instead of starting Revit when the
+# BATCHRVT__SIMULATED_REVIT_HOST_SETTINGS_FILE_PATH environment variable is set (see revit_process.py).
+#
+# It reads the same environment variables and script data as the real script host and talks the same protocol
+# (see ipc_protocol.py). The settings file describes what to simulate; every setting is optional, e.g.
+#
+#   {
+#     "startupDelayInSeconds" : 5,
+#     "openDelayInSeconds" : 1,
+#     "processingDelayInSeconds" : 2,
+#     "closeDelayInSeconds" : 0.5,
+#     "exitDelayInSeconds" : 2,
+#     "outputLinesPerFile" : 20,
+#     "crashProbability" : 0.01,
+#     "hangProbability" : 0.01,
+#     "dialogProbability" : 0.05,
+#     "dialogDurationInSeconds" : 10,
+#     "deferProbability" : 0.02,
+#     "randomSeed" : 1
+#   }
+#
+# What happens to each file is drawn from randomSeed and the file's progress number, so a run can be repeated exactly.
+# NOTE: a simulated dialog box holds up the "main thread" for dialogDurationInSeconds (as if it had been dismissed);
+#       no window is shown, so it also runs headless.
+
+import clr
+import System
+clr.AddReference("System.Core")
+clr.ImportExtensions(System.Linq)
+import sys
+import random
+import threading
+
+from System.Diagnostics import Process
+from System.IO import Path
+from System.Threading import Thread, Timeout
+
+# BatchRvtUtil.dll and its dependencies are in the folder above the scripts folder.
+sys.path.append(Path.GetDirectoryName(Path.GetDirectoryName(Path.GetFullPath(__file__))))
+
+import import_profiler
+import_profiler.InstallImportProfiler()
+
+import compiled_script_modules
+compiled_script_modules.LoadOrCompileScriptModules()
+
+import script_environment
+import client_util
+import stream_io_util
+import json_util
+import text_file_util
+import time_util
+import ipc_protocol
+import snapshot_data_util
+import revit_process
+import revit_process_host
+from batch_rvt_util import ScriptDataUtil
+
+SIMULATED_HOST_DEFAULT_SETTINGS = {
+    "startupDelayInSeconds" : 0,
+    "openDelayInSeconds" : 0,
+    "processingDelayInSeconds" : 0,
+    "closeDelayInSeconds" : 0,
+    "exitDelayInSeconds" : 0,
+    "outputLinesPerFile" : 1,
+    "crashProbability" : 0,
+    "hangProbability" : 0,
+    "dialogProbability" : 0,
+    "dialogDurationInSeconds" : 5,
+    "deferProbability" : 0,
+    "randomSeed" : 0
+  }
+
+SIMULATED_OUTCOME_CRASH = "crash"
+SIMULATED_OUTCOME_HANG = "hang"
+SIMULATED_OUTCOME_DIALOG = "dialog"
+SIMULATED_OUTCOME_DEFER = "defer"
+SIMULATED_OUTCOME_NORMAL = "normal"
+
+END_SESSION_REQUESTED = threading.Event()
+MONITOR_DISCONNECTED = threading.Event()
+CONTROL_PIPE_CONNECTED = threading.Event()
+OPEN_GRANTED = threading.Event()
+
+def LoadSimulatedHostSettings(settingsFilePath):
+  settings = dict(SIMULATED_HOST_DEFAULT_SETTINGS)
+  jobject = json_util.DeserializeToJObject(text_file_util.ReadFromTextFile(settingsFilePath))
+  for jproperty in jobject.Properties():
+    settings[jproperty.Name] = json_util.GetValueFromJValue(jproperty.Value)
+  return settings
+
+def SimulateDelay(delayInSeconds):
+  if delayInSeconds > 0:
+    Thread.Sleep(int(delayInSeconds * 1000))
+  return
+
+def GetSimulatedOutcome(settings, progressNumber):
+  roll = random.Random(settings["randomSeed"] * 1000003 + progressNumber).random()
+  for outcome, probabilitySetting in [
+      (SIMULATED_OUTCOME_CRASH, "crashProbability"),
+      (SIMULATED_OUTCOME_HANG, "hangProbability"),
+      (SIMULATED_OUTCOME_DIALOG, "dialogProbability"),
+      (SIMULATED_OUTCOME_DEFER, "deferProbability")
+    ]:
+    if roll < settings[probabilitySetting]:
+      return outcome
+    roll -= settings[probabilitySetting]
+  return SIMULATED_OUTCOME_NORMAL
+
+def ExportSimulatedSnapshotData(scriptData, snapshotStartTime, snapshotError):
+  dataExportFolderPath = scriptData.DataExportFolderPath.GetValue()
+  snapshotData = {
+      "modelName" : snapshot_data_util.GetRevitModelName(scriptData.RevitFilePath.GetValue()),
+      "snapshotStartTime" : time_util.GetTimestampObject(snapshotStartTime),
+      "snapshotEndTime" : time_util.GetTimestampObject(time_util.GetDateTimeNow()),
+      "sessionId" : scriptData.SessionId.GetValue(),
+      "snapshotFolder" : dataExportFolderPath,
+      "snapshotError" : snapshotError,
+      "simulated" : True,
+      snapshot_data_util.SNAPSHOT_DATA__REVIT_JOURNAL_FILE : None
+    }
+  text_file_util.WriteToTextFile(
+      snapshot_data_util.GetSnapshotDataFilePath(dataExportFolderPath),
+      json_util.SerializeObject(snapshotData, True)
+    )
+  return
+
+def SimulateFileProcessing(scriptData, settings, messageWriter, output):
+  progressNumber = scriptData.ProgressNumber.GetValue()
+  revitFilePath = scriptData.RevitFilePath.GetValue()
+  snapshotStartTime = time_util.GetDateTimeNow()
+  outcome = GetSimulatedOutcome(settings, progressNumber)
+
+  messageWriter.SendProgress(progressNumber)
+  output()
+  output("Processing file (" + str(progressNumber) + " of " + str(scriptData.ProgressMax.GetValue()) + "): " + revitFilePath)
+
+  if CONTROL_PIPE_CONNECTED.is_set():
+    messageWriter.WaitForOpenGrant(progressNumber, OPEN_GRANTED, MONITOR_DISCONNECTED)
+  messageWriter.SendPhase(ipc_protocol.PHASE_OPENING)
+  SimulateDelay(settings["openDelayInSeconds"])
+
+  if outcome == SIMULATED_OUTCOME_CRASH:
+    output()
+    output("Simulating a Revit crash.")
+    # NOTE: the output queue is deliberately not flushed, as in a real crash.
+    Process.GetCurrentProcess().Kill()
+  elif outcome == SIMULATED_OUTCOME_HANG:
+    output()
+    output("Simulating a Revit hang.")
+    # NOTE: the heartbeat keeps running, as it does when Revit's main thread hangs.
+    Thread.Sleep(Timeout.Infinite)
+  elif outcome == SIMULATED_OUTCOME_DIALOG:
+    output()
+    output("Simulating a dialog box for " + str(settings["dialogDurationInSeconds"]) + " second(s).")
+    SimulateDelay(settings["dialogDurationInSeconds"])
+
+  snapshotError = None
+  if outcome == SIMULATED_OUTCOME_DEFER:
+    snapshotError = "File processing was deferred: simulated deferral."
+    output()
+    output("WARNING: " + snapshotError)
+    messageWriter.SendResult(progressNumber, revitFilePath, ipc_protocol.RESULT_STATUS_DEFERRED, "simulated deferral.")
+  else:
+    messageWriter.SendPhase(ipc_protocol.PHASE_TASK)
+    outputLinesCount = settings["outputLinesPerFile"]
+    for lineNumber in range(outputLinesCount):
+      output("Simulated task output (" + str(lineNumber + 1) + " of " + str(outputLinesCount) + ").")
+    SimulateDelay(settings["processingDelayInSeconds"])
+    messageWriter.SendPhase(ipc_protocol.PHASE_CLOSING)
+    SimulateDelay(settings["closeDelayInSeconds"])
+    messageWriter.SendResult(progressNumber, revitFilePath, ipc_protocol.RESULT_STATUS_COMPLETED)
+
+  if scriptData.EnableDataExport.GetValue():
+    messageWriter.SendPhase(ipc_protocol.PHASE_EXPORTING)
+    ExportSimulatedSnapshotData(scriptData, snapshotStartTime, snapshotError)
+    messageWriter.SendSnapshotExported(progressNumber)
+  return
+
+def SimulateRevitSession(scriptDataFilePath, progressNumber, batchRvtProcessUniqueId, settings, messageWriter, output):
+  scriptDatas = (
+      ScriptDataUtil.LoadManyFromFile(scriptDataFilePath, progressNumber)
+      .OrderBy(lambda scriptData: scriptData.ProgressNumber.GetValue())
+      .ToList()
+    )
+  for scriptData in scriptDatas:
+    if MONITOR_DISCONNECTED.is_set() or not revit_process_host.IsBatchRvtProcessRunning(batchRvtProcessUniqueId):
+      output()
+      output("ERROR: The BatchRvt process appears to have terminated! Operation aborted.")
+      break
+    if END_SESSION_REQUESTED.is_set():
+      output()
+      output("Ending the Revit session early as requested by the BatchRvt monitor.")
+      break
+    SimulateFileProcessing(scriptData, settings, messageWriter, output)
+  return
+
+def OnMonitorMessage(message):
+  # NOTE: called on the message listener thread.
+  if message[ipc_protocol.MESSAGE__TYPE] == ipc_protocol.MESSAGE_TYPE_COMMAND:
+    if message[ipc_protocol.MESSAGE__COMMAND] == ipc_protocol.COMMAND_END_SESSION:
+      END_SESSION_REQUESTED.set()
+    elif message[ipc_protocol.MESSAGE__COMMAND] == ipc_protocol.COMMAND_OPEN_GRANTED:
+      OPEN_GRANTED.set()
+  return
+
+def Main():
+  environmentVariables = Process.GetCurrentProcess().StartInfo.EnvironmentVariables
+  settings = LoadSimulatedHostSettings(
+      System.Environment.GetEnvironmentVariable(revit_process.SIMULATED_REVIT_HOST_SETTINGS_FILE_PATH__ENVIRONMENT_VARIABLE_NAME)
+    )
+  outputPipeHandleString = script_environment.GetScriptOutputPipeHandleString(environmentVariables)
+  controlPipeHandleString = script_environment.GetScriptControlPipeHandleString(environmentVariables)
+  outputOverflowPolicy = ipc_protocol.ParseOutputOverflowPolicy(
+      script_environment.GetScriptOutputOverflowPolicy(environmentVariables)
+    )
+  scriptDataFilePath = script_environment.GetScriptDataFilePath(environmentVariables)
+  progressNumber = script_environment.GetProgressNumber(environmentVariables)
+  batchRvtProcessUniqueId = script_environment.GetBatchRvtProcessUniqueId(environmentVariables)
+
+  SimulateDelay(settings["startupDelayInSeconds"])
+
+  outputStream = client_util.CreateAnonymousPipeClient(client_util.OUT, outputPipeHandleString)
+
+  def outputStreamAction():
+    messageWriter = ipc_protocol.QueuedMessageWriter(
+        outputStream,
+        outputOverflowPolicy,
+        ScriptDataUtil.GetScriptOutputSpillFilePath(scriptDataFilePath)
+      )
+
+    if controlPipeHandleString is not None:
+      controlStream = client_util.CreateAnonymousPipeClient(client_util.IN, controlPipeHandleString)
+      ipc_protocol.StartMessageListener(controlStream, OnMonitorMessage, MONITOR_DISCONNECTED.set)
+      CONTROL_PIPE_CONNECTED.set()
+
+    messageWriter.SendPhase(ipc_protocol.PHASE_STARTUP)
+    stopHeartbeat = ipc_protocol.StartHeartbeat(messageWriter)
+    try:
+      SimulateRevitSession(
+          scriptDataFilePath,
+          progressNumber,
+          batchRvtProcessUniqueId,
+          settings,
+          messageWriter,
+          lambda message="": messageWriter.SendLog(message)
+        )
+    finally:
+      import_profiler.ShowImportProfile(lambda message="": messageWriter.SendLog(message))
+      stopHeartbeat.set()
+      messageWriter.Close()
+    return
+
+  stream_io_util.UsingStream(outputStream, outputStreamAction)
+
+  SimulateDelay(settings["exitDelayInSeconds"])
+  return
+
+Main()
@@ -36,6 +36,7 @@ PROJECT_FILES_FOLDER_NAME = "1.0 Project Files"
 SNAPSHOT_DATA_FILENAME = "snapshot.json"
 TEMP_SNAPSHOT_DATA_FILENAME = "temp_snapshot.json"
 SNAPSHOT_DATA__REVIT_JOURNAL_FILE = "revitJournalFile"
+SNAPSHOT_DATA__RESOURCE_USAGE = "resourceUsage"
 
 def GetUnknownProjectUniqueFolderName():
   return Path.GetRandomFileName().Replace(".", str.Empty).ToUpper()
@@ -90,6 +91,25 @@ def CopySnapshotRevitJournalFile(snapshotDataFolderPath, output):
   File.Copy(revitJournalFilePath, snapshotRevitJournalFilePath)
   return
 
+def AddSnapshotDataResourceUsage(snapshotDataFolderPath, resourceUsageData, output):
+  # NOTE: written by the monitor once the Revit session has ended. The temporary snapshot data file is used if the
+  #       script host did not get as far as writing the snapshot data file.
+  try:
+    snapshotDataFilePath = GetSnapshotDataFilePath(snapshotDataFolderPath)
+    if not File.Exists(snapshotDataFilePath):
+      snapshotDataFilePath = GetTemporarySnapshotDataFilePath(snapshotDataFolderPath)
+    if File.Exists(snapshotDataFilePath):
+      jobjectSnapshotData = json_util.DeserializeToJObject(text_file_util.ReadFromTextFile(snapshotDataFilePath))
+      jobjectSnapshotData[SNAPSHOT_DATA__RESOURCE_USAGE] = json_util.ToJObject(resourceUsageData)
+      text_file_util.WriteToTextFile(snapshotDataFilePath, json_util.ToString(jobjectSnapshotData, True))
+  except Exception, e:
+    output()
+    output("WARNING: failed to add resource usage to the snapshot data in folder:")
+    output()
+    output("\t" + snapshotDataFolderPath)
+    exception_util.LogOutputErrorDetails(e, output)
+  return
+
 def ConsolidateSnapshotData(dataExportFolderPath, output):
   try:
     snapshotDataFilePath = GetSnapshotDataFilePath(dataExportFolderPath)
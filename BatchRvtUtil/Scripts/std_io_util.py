@@ -22,6 +22,7 @@ import clr
 import System
 
 import sys
+import threading
 
 import logging_util
 import time_util
@@ -31,6 +32,9 @@ SHOW_OUTPUT = True
 ORIGINAL_STDOUT = sys.stdout
 ORIGINAL_STDERR = sys.stderr
 
+# Serializes output from concurrently running Revit sessions so that lines are not interleaved.
+OUTPUT_LOCK = threading.Lock()
+
 def RedirectScriptOutput(output):
   sys.stdout.flush()
   sys.stderr.flush()
@@ -48,9 +52,10 @@ def RestoreScriptOutput():
 def Output(m="", msgId=""):
   timestamp = time_util.GetDateTimeNow().ToString("HH:mm:ss")
   message = timestamp + " : " + (("[" + str(msgId) + "]" + " ") if msgId != "" else "") + m + "\n"
-  if SHOW_OUTPUT:
-    ORIGINAL_STDOUT.write(message)
-  if logging_util.LOG_FILE[0] is not None:
-    logging_util.LOG_FILE[0].WriteMessage({ "msgId" : msgId, "message" : m })
+  with OUTPUT_LOCK:
+    if SHOW_OUTPUT:
+      ORIGINAL_STDOUT.write(message)
+    if logging_util.LOG_FILE[0] is not None:
+      logging_util.LOG_FILE[0].WriteMessage({ "msgId" : msgId, "message" : m })
   return
 
@@ -74,3 +74,6 @@ def WithMeasuredTimeElapsed(action):
   end = DateTime.Now
   return result, (end - start)
 
+def GetTotalSecondsElapsedSinceUtc(utcDateTime):
+  return (GetDateTimeUtcNow() - utcDateTime).TotalSeconds
+
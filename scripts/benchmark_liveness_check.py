@@ -0,0 +1,87 @@
+
+# Compares the per-file cost of the BatchRvt liveness check made by the script host before each file:
+# the previous implementation (IsBatchRvtProcessRunning_OldMethod below, which enumerates every process on the
+# machine) versus revit_process_host.IsBatchRvtProcessRunning (opens the BatchRvt process by id and compares start times).
+#
+# The benchmark process itself stands in for the BatchRvt process. Requires a build of BatchRvtUtil.
+#
+# Usage: ipy64.bat benchmark_liveness_check.py [iterationsCount] [Debug|Release]
+
+import clr
+import System
+clr.AddReference("System.Core")
+clr.ImportExtensions(System.Linq)
+
+from System.Diagnostics import Process, Stopwatch
+
+import os
+import sys
+
+REPOSITORY_FOLDER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SCRIPTS_FOLDER_PATH = os.path.join(REPOSITORY_FOLDER_PATH, "BatchRvtUtil", "Scripts")
+
+DEFAULT_ITERATIONS_COUNT = 100
+DEFAULT_BUILD_CONFIG = "Release"
+
+def GetBuildOutputFolderPath(buildConfig):
+  return os.path.join(REPOSITORY_FOLDER_PATH, "BatchRvtUtil", "bin", "x64", buildConfig)
+
+def IsBatchRvtProcessRunning_OldMethod(batchRvtProcessUniqueId):
+  # The script host's liveness check before revit_process_host.IsBatchRvtProcessRunning opened the process by id.
+  import revit_process_host
+  def IsBatchRvtProcess(process):
+    isTargetProcess = False
+    try:
+      isTargetProcess = (revit_process_host.GetUniqueIdForProcess(process) == batchRvtProcessUniqueId)
+    except Exception, e:
+      isTargetProcess = False
+    return isTargetProcess
+  batchRvtProcess = Process.GetProcesses().FirstOrDefault(IsBatchRvtProcess)
+  return (batchRvtProcess is not None)
+
+def TimeLivenessCheck(isBatchRvtProcessRunning, batchRvtProcessUniqueId, iterationsCount):
+  firstResult = isBatchRvtProcessRunning(batchRvtProcessUniqueId) # warm-up
+  stopwatch = Stopwatch.StartNew()
+  for i in xrange(iterationsCount):
+    result = isBatchRvtProcessRunning(batchRvtProcessUniqueId)
+    if result != firstResult:
+      raise Exception("Inconsistent liveness check result!")
+  return stopwatch.Elapsed.TotalMilliseconds / iterationsCount, firstResult
+
+def ShowResult(name, millisecondsPerCheck, isRunning):
+  print
+  print name
+  print "\t" + "Detected BatchRvt process: " + ("YES" if isRunning else "NO")
+  print "\t" + "Per-file overhead: " + str.Format("{0:0.000}ms", millisecondsPerCheck)
+  return
+
+def Main(args):
+  iterationsCount = int(args[0]) if len(args) > 0 else DEFAULT_ITERATIONS_COUNT
+  buildConfig = args[1] if len(args) > 1 else DEFAULT_BUILD_CONFIG
+
+  sys.path.append(GetBuildOutputFolderPath(buildConfig))
+  sys.path.append(SCRIPTS_FOLDER_PATH)
+
+  import revit_process_host
+
+  batchRvtProcessUniqueId = revit_process_host.GetUniqueIdForProcess(Process.GetCurrentProcess())
+  exitedProcessUniqueId = revit_process_host.PROCESS_UNIQUE_ID_DELIMITER.join(
+      [batchRvtProcessUniqueId.split(revit_process_host.PROCESS_UNIQUE_ID_DELIMITER)[0], "2000-01-01T00:00:00.000Z"]
+    )
+
+  print
+  print "Processes running: " + str(len(Process.GetProcesses()))
+  print "Iterations: " + str(iterationsCount)
+
+  for name, isBatchRvtProcessRunning in [
+      ("Process enumeration (old)", IsBatchRvtProcessRunning_OldMethod),
+      ("Open by id (new)", revit_process_host.IsBatchRvtProcessRunning)
+    ]:
+    millisecondsPerCheck, isRunning = TimeLivenessCheck(isBatchRvtProcessRunning, batchRvtProcessUniqueId, iterationsCount)
+    ShowResult(name + ", BatchRvt running", millisecondsPerCheck, isRunning)
+    millisecondsPerCheck, isRunning = TimeLivenessCheck(isBatchRvtProcessRunning, exitedProcessUniqueId, iterationsCount)
+    ShowResult(name + ", BatchRvt exited (process id reused)", millisecondsPerCheck, isRunning)
+
+  return
+
+Main(sys.argv[1:])
@@ -0,0 +1,165 @@
+
+# Compares the polling host monitor loop (monitor_process.MonitorProcess) with the event-driven one
+# (monitor_process.MonitorProcessEvents) against a simulated host process.
+#
+# The simulated host is a PowerShell process that idles, writes a burst of timestamped lines and idles again,
+# which roughly mirrors a Revit session (startup, processing with script output, shutdown).
+#
+# Usage: ipy64.bat benchmark_monitor_loop.py [runsCount]
+
+import clr
+import System
+
+from System import DateTime, TimeSpan
+from System.Diagnostics import Process, ProcessStartInfo, Stopwatch
+from System.IO import Path, File
+
+import os
+import sys
+
+SCRIPTS_FOLDER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "BatchRvtUtil", "Scripts")
+sys.path.append(SCRIPTS_FOLDER_PATH)
+
+import monitor_process
+import stream_io_util
+
+SIMULATED_HOST_STARTUP_IDLE_IN_SECONDS = 10
+SIMULATED_HOST_LINES_COUNT = 40
+SIMULATED_HOST_LINE_INTERVAL_IN_MILLISECONDS = 250
+SIMULATED_HOST_SHUTDOWN_IDLE_IN_SECONDS = 5
+
+SIMULATED_SNAPSHOT_DATA_FILES_COUNT = 20
+
+# Same intervals as the real monitor (see monitor_revit_process and batch_rvt_monitor_util).
+POLLING_MONITOR_INTERVAL_IN_SECONDS = 0.25
+RESPONSIVENESS_CHECK_INTERVAL_IN_SECONDS = 1
+PERIODIC_CHECK_INTERVAL_IN_SECONDS = 1
+UNRESPONSIVE_THRESHHOLD_IN_SECONDS = 10
+
+def StartSimulatedHostProcess():
+  script = str.Join("; ", [
+      "Start-Sleep -Seconds " + str(SIMULATED_HOST_STARTUP_IDLE_IN_SECONDS),
+      "for ($i = 0; $i -lt " + str(SIMULATED_HOST_LINES_COUNT) + "; $i++) { " +
+        "[Console]::Out.WriteLine([DateTime]::UtcNow.Ticks); " +
+        "Start-Sleep -Milliseconds " + str(SIMULATED_HOST_LINE_INTERVAL_IN_MILLISECONDS) + " }",
+      "Start-Sleep -Seconds " + str(SIMULATED_HOST_SHUTDOWN_IDLE_IN_SECONDS)
+    ])
+  psi = ProcessStartInfo("powershell.exe", "-NoProfile -NonInteractive -Command \"" + script + "\"")
+  psi.UseShellExecute = False
+  psi.CreateNoWindow = True
+  psi.RedirectStandardOutput = True
+  psi.RedirectStandardError = True
+  return Process.Start(psi)
+
+class MonitorStatistics(object):
+  def __init__(self):
+    self.lineLatenciesInMilliseconds = []
+    self.periodicChecksCount = 0
+    return
+
+  def RecordLine(self, line):
+    ticks = System.Int64.Parse(line.Trim())
+    latency = TimeSpan.FromTicks(DateTime.UtcNow.Ticks - ticks).TotalMilliseconds
+    self.lineLatenciesInMilliseconds.append(latency)
+    return
+
+  def RecordLines(self, lines):
+    for line in lines:
+      self.RecordLine(line)
+    return
+
+def GetSimulatedSnapshotDataFilePaths():
+  tempFolderPath = Path.GetTempPath()
+  return [
+      Path.Combine(tempFolderPath, "benchmark_monitor_loop." + str(index) + ".snapshot.json")
+      for index in range(SIMULATED_SNAPSHOT_DATA_FILES_COUNT)
+    ]
+
+def SimulatePeriodicCheck(snapshotDataFilePaths, statistics):
+  statistics.periodicChecksCount += 1
+  return all(File.Exists(snapshotDataFilePath) for snapshotDataFilePath in snapshotDataFilePaths)
+
+def IgnoreLines(lines):
+  return
+
+def RunPollingMonitor(process, statistics):
+  snapshotDataFilePaths = GetSimulatedSnapshotDataFilePaths()
+  pendingOutputReadLineTask = [None] # Needs to be a list so it can be captured by reference in closures.
+  pendingErrorReadLineTask = [None] # As above.
+
+  def monitoringAction():
+    outputLines, pendingOutputReadLineTask[0] = stream_io_util.ReadAvailableLines(process.StandardOutput, pendingOutputReadLineTask[0])
+    for line in outputLines:
+      statistics.RecordLine(line)
+    errorLines, pendingErrorReadLineTask[0] = stream_io_util.ReadAvailableLines(process.StandardError, pendingErrorReadLineTask[0])
+    SimulatePeriodicCheck(snapshotDataFilePaths, statistics)
+    return
+
+  monitor_process.MonitorProcess(
+      process,
+      monitoringAction,
+      POLLING_MONITOR_INTERVAL_IN_SECONDS,
+      UNRESPONSIVE_THRESHHOLD_IN_SECONDS,
+      lambda: None,
+      lambda unresponsiveTimeInSeconds: None
+    )
+  return
+
+def RunEventMonitor(process, statistics):
+  snapshotDataFilePaths = GetSimulatedSnapshotDataFilePaths()
+  monitor_process.MonitorProcessEvents(
+      process,
+      [
+        monitor_process.ChunkedLineReader(process.StandardOutput, statistics.RecordLines),
+        monitor_process.ChunkedLineReader(process.StandardError, IgnoreLines)
+      ],
+      [
+        (PERIODIC_CHECK_INTERVAL_IN_SECONDS, lambda: SimulatePeriodicCheck(snapshotDataFilePaths, statistics))
+      ],
+      RESPONSIVENESS_CHECK_INTERVAL_IN_SECONDS,
+      UNRESPONSIVE_THRESHHOLD_IN_SECONDS,
+      lambda: None,
+      lambda unresponsiveTimeInSeconds: None
+    )
+  return
+
+def GetPercentile(values, percentile):
+  if not values:
+    return 0.0
+  sortedValues = sorted(values)
+  index = min(int(round((len(sortedValues) - 1) * percentile)), len(sortedValues) - 1)
+  return sortedValues[index]
+
+def RunBenchmark(monitorName, runMonitor):
+  statistics = MonitorStatistics()
+  currentProcess = Process.GetCurrentProcess()
+  process = StartSimulatedHostProcess()
+  currentProcess.Refresh()
+  processorTimeBefore = currentProcess.TotalProcessorTime
+  stopwatch = Stopwatch.StartNew()
+  runMonitor(process, statistics)
+  elapsedSeconds = stopwatch.Elapsed.TotalSeconds
+  currentProcess.Refresh()
+  processorTimeInMilliseconds = (currentProcess.TotalProcessorTime - processorTimeBefore).TotalMilliseconds
+  latencies = statistics.lineLatenciesInMilliseconds
+  print
+  print monitorName
+  print "\t" + "Wall time: " + str.Format("{0:0.00}s", elapsedSeconds)
+  print "\t" + "Monitor CPU time: " + str.Format("{0:0}ms", processorTimeInMilliseconds)
+  print "\t" + "Periodic checks: " + str(statistics.periodicChecksCount)
+  print "\t" + "Lines received: " + str(len(latencies)) + " of " + str(SIMULATED_HOST_LINES_COUNT)
+  print "\t" + "Line latency mean: " + str.Format("{0:0.0}ms", (sum(latencies) / len(latencies)) if latencies else 0.0)
+  print "\t" + "Line latency p95: " + str.Format("{0:0.0}ms", GetPercentile(latencies, 0.95))
+  print "\t" + "Line latency max: " + str.Format("{0:0.0}ms", max(latencies) if latencies else 0.0)
+  return
+
+def Main(args):
+  runsCount = int(args[0]) if args else 1
+  for runNumber in range(runsCount):
+    print
+    print "Run " + str(runNumber + 1) + " of " + str(runsCount)
+    RunBenchmark("Polling monitor (MonitorProcess)", RunPollingMonitor)
+    RunBenchmark("Event-driven monitor (MonitorProcessEvents)", RunEventMonitor)
+  return
+
+Main(sys.argv[1:])
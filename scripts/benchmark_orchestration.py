@@ -0,0 +1,339 @@
+
+# End-to-end benchmark suite for BatchRvt's orchestration layer (configuration, scheduling, the monitor loop, IPC,
+# time-outs and restarts). Revit is replaced by the simulated Revit host (BatchRvtUtil/Scripts/simulated_revit_host.py),
+# so the suite runs on any machine with a build of BatchRvt.
+#
+# Metrics:
+#   - orchestrationOverheadPerFileInMilliseconds: wall time per file, with all simulated delays set to zero.
+#   - timeToFirstFileInSeconds: BatchRvt start to the first file's output, for a large file list.
+#   - monitorProcessorTimePerSessionInMilliseconds: BatchRvt (monitor) processor time per Revit session.
+#   - monitorPrivateBytesGrowthPerFile / monitorPeakPrivateBytes: BatchRvt memory over the large run (sampled every second).
+#   - restartLatencyMeanInSeconds / restartLatencyP95InSeconds: Revit session exit to the next session's start,
+#     in a run where the simulated host crashes on some files.
+#   - chunkedPipeLinesPerSecond / framedPipeLinesPerSecond: pipe reader throughput (see benchmark_pipe_reader.py).
+#
+# The results are written as JSON and compared with the stored baseline (benchmark_orchestration.baseline.json).
+# A metric that is worse than its baseline value by more than its threshold fails the run (exit code 1), and so does a
+# metric without a baseline value (so that a missing baseline is never mistaken for a pass). --update-baseline stores
+# the results as the new baseline values (the thresholds are kept).
+#
+# Usage: ipy64.bat benchmark_orchestration.py [--files N] [--crash-files N] [--config Debug|Release]
+#                                             [--output resultsFilePath] [--update-baseline]
+
+import clr
+import System
+
+from System import DateTime, Environment
+from System.Diagnostics import Process, ProcessStartInfo, Stopwatch
+from System.IO import Path, Directory, File
+
+import argparse
+import os
+import sys
+import threading
+
+REPOSITORY_FOLDER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SCRIPTS_FOLDER_PATH = os.path.join(REPOSITORY_FOLDER_PATH, "BatchRvtUtil", "Scripts")
+BASELINE_FILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_orchestration.baseline.json")
+
+DEFAULT_FILES_COUNT = 1000
+DEFAULT_CRASH_FILES_COUNT = 50
+DEFAULT_BUILD_CONFIG = "Release"
+
+BENCHMARK_REVIT_VERSION = "2019"
+OUTPUT_LINES_PER_FILE = 10
+CRASH_PROBABILITY = 0.2
+PIPE_LINES_COUNT = 200000
+MEMORY_SAMPLE_INTERVAL_IN_MILLISECONDS = 1000
+
+SIMULATED_REVIT_HOST_SETTINGS_FILE_PATH__ENVIRONMENT_VARIABLE_NAME = "BATCHRVT__SIMULATED_REVIT_HOST_SETTINGS_FILE_PATH"
+
+# Lines in BatchRvt's output (see monitor_revit_process and simulated_revit_host).
+SESSION_START_MARKER = "Monitoring host Revit process (PID: "
+SESSION_EXIT_MARKER = ") has exited!"
+FIRST_FILE_MARKER = "Processing file ("
+
+def GetBatchRvtExecutableFilePath(buildConfig):
+  return os.path.join(REPOSITORY_FOLDER_PATH, "BatchRvt", "bin", "x64", buildConfig, "BatchRvt.exe")
+
+def GetBuildOutputFolderPath(buildConfig):
+  return os.path.join(REPOSITORY_FOLDER_PATH, "BatchRvtUtil", "bin", "x64", buildConfig)
+
+def ToPythonObject(jtoken):
+  import json_util
+  from Newtonsoft.Json.Linq import JObject, JArray
+  if isinstance(jtoken, JObject):
+    return dict((jproperty.Name, ToPythonObject(jproperty.Value)) for jproperty in jtoken.Properties())
+  elif isinstance(jtoken, JArray):
+    return [ToPythonObject(item) for item in jtoken]
+  return json_util.GetValueFromJValue(jtoken)
+
+def ReadJsonFile(filePath):
+  import json_util
+  return ToPythonObject(json_util.DeserializeToJObject(File.ReadAllText(filePath)))
+
+def WriteJsonFile(filePath, pythonObject):
+  import json_util
+  File.WriteAllText(filePath, json_util.SerializeObject(pythonObject, True))
+  return
+
+def GetPercentile(values, percentile):
+  if not values:
+    return None
+  sortedValues = sorted(values)
+  index = min(int(round((len(sortedValues) - 1) * percentile)), len(sortedValues) - 1)
+  return sortedValues[index]
+
+def CreateBenchmarkRun(runName, filesCount, simulatedHostSettings):
+  runFolderPath = Path.Combine(
+      Path.GetTempPath(),
+      "batchrvt_benchmark",
+      runName + "_" + DateTime.Now.ToString("yyyyMMdd_HHmmss")
+    )
+  modelsFolderPath = Path.Combine(runFolderPath, "models")
+  Directory.CreateDirectory(modelsFolderPath)
+  revitFilePaths = []
+  for fileNumber in xrange(filesCount):
+    revitFilePath = Path.Combine(modelsFolderPath, "Model " + str(fileNumber + 1).zfill(5) + ".rvt")
+    File.WriteAllText(revitFilePath, "")
+    revitFilePaths.append(revitFilePath)
+  fileListFilePath = Path.Combine(runFolderPath, "files.txt")
+  File.WriteAllText(fileListFilePath, "\r\n".join(revitFilePaths))
+  taskScriptFilePath = Path.Combine(runFolderPath, "task_script.py")
+  File.WriteAllText(taskScriptFilePath, "# Not run by the simulated Revit host.\r\n")
+  settingsFilePath = Path.Combine(runFolderPath, "simulated_revit_host.json")
+  WriteJsonFile(settingsFilePath, simulatedHostSettings)
+  return runFolderPath, fileListFilePath, taskScriptFilePath, settingsFilePath
+
+class RunObservations(object):
+  def __init__(self):
+    self.lines = [] # (elapsedSeconds, line) pairs.
+    self.privateBytesSamples = [] # (elapsedSeconds, privateBytes) pairs.
+    self.elapsedSeconds = None
+    self.processorTimeInMilliseconds = None
+    self.exitCode = None
+    return
+
+  def GetLineTimes(self, predicate):
+    return [elapsedSeconds for elapsedSeconds, line in self.lines if predicate(line)]
+
+def StartLineReader(streamReader, stopwatch, lines):
+  def read():
+    while True:
+      line = streamReader.ReadLine()
+      if line is None:
+        break
+      lines.append((stopwatch.Elapsed.TotalSeconds, line))
+    return
+  readerThread = threading.Thread(target=read)
+  readerThread.daemon = True
+  readerThread.start()
+  return readerThread
+
+def RunBatchRvt(buildConfig, runName, filesCount, simulatedHostSettings):
+  runFolderPath, fileListFilePath, taskScriptFilePath, settingsFilePath = CreateBenchmarkRun(
+      runName, filesCount, simulatedHostSettings
+    )
+  psi = ProcessStartInfo(
+      GetBatchRvtExecutableFilePath(buildConfig),
+      str.Join(" ", [
+          "--task_script", "\"" + taskScriptFilePath + "\"",
+          "--file_list", "\"" + fileListFilePath + "\"",
+          "--revit_version", BENCHMARK_REVIT_VERSION,
+          "--log_folder", "\"" + Path.Combine(runFolderPath, "logs") + "\""
+        ])
+    )
+  psi.UseShellExecute = False
+  psi.CreateNoWindow = True
+  psi.RedirectStandardOutput = True
+  psi.RedirectStandardError = True
+  psi.EnvironmentVariables[SIMULATED_REVIT_HOST_SETTINGS_FILE_PATH__ENVIRONMENT_VARIABLE_NAME] = settingsFilePath
+
+  observations = RunObservations()
+  stopwatch = Stopwatch.StartNew()
+  process = Process.Start(psi)
+  readerThreads = [
+      StartLineReader(process.StandardOutput, stopwatch, observations.lines),
+      StartLineReader(process.StandardError, stopwatch, [])
+    ]
+  while not process.WaitForExit(MEMORY_SAMPLE_INTERVAL_IN_MILLISECONDS):
+    try:
+      process.Refresh()
+      observations.privateBytesSamples.append((stopwatch.Elapsed.TotalSeconds, process.PrivateMemorySize64))
+    except Exception, e:
+      pass # The process has just exited.
+  observations.elapsedSeconds = stopwatch.Elapsed.TotalSeconds
+  for readerThread in readerThreads:
+    readerThread.join()
+  observations.processorTimeInMilliseconds = process.TotalProcessorTime.TotalMilliseconds
+  observations.exitCode = process.ExitCode
+  print "\t" + runName + ": " + str.Format("{0:0.0}s", observations.elapsedSeconds) + " (" + runFolderPath + ")"
+  return observations
+
+def MeasureLargeRun(buildConfig, filesCount):
+  observations = RunBatchRvt(
+      buildConfig,
+      "large_run",
+      filesCount,
+      { "outputLinesPerFile" : OUTPUT_LINES_PER_FILE }
+    )
+  firstFileTimes = observations.GetLineTimes(lambda line: FIRST_FILE_MARKER in line)
+  sessionsCount = len(observations.GetLineTimes(lambda line: SESSION_START_MARKER in line))
+  timeToFirstFileInSeconds = firstFileTimes[0] if firstFileTimes else None
+  # Memory growth is measured from the first file onwards, i.e. excluding start-up.
+  privateBytesSamples = [
+      privateBytes
+      for elapsedSeconds, privateBytes in observations.privateBytesSamples
+      if timeToFirstFileInSeconds is not None and elapsedSeconds >= timeToFirstFileInSeconds
+    ]
+  return {
+      "orchestrationOverheadPerFileInMilliseconds" : observations.elapsedSeconds * 1000 / filesCount,
+      "timeToFirstFileInSeconds" : timeToFirstFileInSeconds,
+      "monitorProcessorTimePerSessionInMilliseconds" : (
+          observations.processorTimeInMilliseconds / sessionsCount if sessionsCount > 0 else None
+        ),
+      "monitorPrivateBytesGrowthPerFile" : (
+          float(privateBytesSamples[-1] - privateBytesSamples[0]) / filesCount
+          if len(privateBytesSamples) > 1 else None
+        ),
+      "monitorPeakPrivateBytes" : (
+          max(privateBytes for elapsedSeconds, privateBytes in observations.privateBytesSamples)
+          if observations.privateBytesSamples else None
+        )
+    }
+
+def MeasureCrashRun(buildConfig, filesCount):
+  observations = RunBatchRvt(
+      buildConfig,
+      "crash_run",
+      filesCount,
+      { "outputLinesPerFile" : OUTPUT_LINES_PER_FILE, "crashProbability" : CRASH_PROBABILITY, "randomSeed" : 1 }
+    )
+  sessionStartTimes = observations.GetLineTimes(lambda line: SESSION_START_MARKER in line)
+  sessionExitTimes = observations.GetLineTimes(lambda line: SESSION_EXIT_MARKER in line)
+  restartLatencies = []
+  for sessionExitTime in sessionExitTimes:
+    nextSessionStartTimes = [startTime for startTime in sessionStartTimes if startTime > sessionExitTime]
+    if nextSessionStartTimes:
+      restartLatencies.append(nextSessionStartTimes[0] - sessionExitTime)
+  return {
+      "restartLatencyMeanInSeconds" : (sum(restartLatencies) / len(restartLatencies)) if restartLatencies else None,
+      "restartLatencyP95InSeconds" : GetPercentile(restartLatencies, 0.95)
+    }
+
+def MeasurePipeThroughput():
+  import benchmark_pipe_reader
+  metrics = {}
+  for metricName, runReader in [
+      ("chunkedPipeLinesPerSecond", benchmark_pipe_reader.RunChunkedReader),
+      ("framedPipeLinesPerSecond", benchmark_pipe_reader.RunMessageReader)
+    ]:
+    elapsedSeconds, linesPerSecond, isComplete = benchmark_pipe_reader.MeasureReader(runReader, PIPE_LINES_COUNT)
+    metrics[metricName] = linesPerSecond if isComplete else None
+  return metrics
+
+def CompareWithBaseline(metrics, baseline):
+  comparisons = []
+  baselineMetrics = baseline.get("metrics", {})
+  for metricName, threshold in sorted(baseline.get("thresholds", {}).items()):
+    value = metrics.get(metricName)
+    baselineValue = baselineMetrics.get(metricName)
+    comparison = {
+        "metric" : metricName,
+        "value" : value,
+        "baselineValue" : baselineValue,
+        "maxRegressionPercent" : threshold["maxRegressionPercent"],
+        "changePercent" : None,
+        "passed" : True
+      }
+    if value is None or baselineValue is None:
+      comparison["passed"] = False
+    elif baselineValue == 0:
+      comparison["passed"] = (value >= 0) if threshold["higherIsBetter"] else (value <= 0)
+    else:
+      changePercent = (value - baselineValue) * 100.0 / abs(baselineValue)
+      regressionPercent = -changePercent if threshold["higherIsBetter"] else changePercent
+      comparison["changePercent"] = changePercent
+      comparison["passed"] = regressionPercent <= threshold["maxRegressionPercent"]
+    comparisons.append(comparison)
+  return comparisons
+
+def ShowComparisons(comparisons):
+  print
+  for comparison in comparisons:
+    print (
+        "\t" + ("PASS" if comparison["passed"] else "FAIL") + "  " + comparison["metric"] + ": " +
+        (str.Format("{0:0.###}", comparison["value"]) if comparison["value"] is not None else "(not measured)") +
+        (
+          str.Format(" (baseline {0:0.###}, {1:+0.0;-0.0}%)", comparison["baselineValue"], comparison["changePercent"])
+          if comparison["changePercent"] is not None else
+          " (no baseline: record one with --update-baseline)" if comparison["baselineValue"] is None else
+          str.Format(" (baseline {0:0.###})", comparison["baselineValue"])
+        )
+      )
+  return
+
+def ParseArgs(args):
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--files", type=int, default=DEFAULT_FILES_COUNT)
+  parser.add_argument("--crash-files", type=int, default=DEFAULT_CRASH_FILES_COUNT)
+  parser.add_argument("--config", default=DEFAULT_BUILD_CONFIG)
+  parser.add_argument("--output", default=None)
+  parser.add_argument("--update-baseline", action="store_true")
+  return parser.parse_args(args)
+
+def Main(args):
+  options = ParseArgs(args)
+
+  sys.path.append(GetBuildOutputFolderPath(options.config))
+  sys.path.append(SCRIPTS_FOLDER_PATH)
+
+  print
+  print "Running benchmarks (" + str(options.files) + " files, " + str(options.crash_files) + " files with crashes)..."
+  metrics = {}
+  metrics.update(MeasureLargeRun(options.config, options.files))
+  metrics.update(MeasureCrashRun(options.config, options.crash_files))
+  metrics.update(MeasurePipeThroughput())
+
+  baseline = ReadJsonFile(BASELINE_FILE_PATH)
+  comparisons = CompareWithBaseline(metrics, baseline)
+  passed = all(comparison["passed"] for comparison in comparisons)
+  ShowComparisons(comparisons)
+
+  results = {
+      "timestamp" : DateTime.UtcNow.ToString("o"),
+      "machineName" : Environment.MachineName,
+      "parameters" : {
+          "filesCount" : options.files,
+          "crashFilesCount" : options.crash_files,
+          "buildConfig" : options.config
+        },
+      "metrics" : metrics,
+      "comparisons" : comparisons,
+      "passed" : passed
+    }
+  resultsFilePath = options.output or Path.Combine(
+      Path.GetTempPath(),
+      "batchrvt_benchmark",
+      "results_" + DateTime.Now.ToString("yyyyMMdd_HHmmss") + ".json"
+    )
+  WriteJsonFile(resultsFilePath, results)
+  print
+  print "Results: " + resultsFilePath
+
+  if options.update_baseline:
+    baseline["metrics"] = metrics
+    baseline["recorded"] = {
+        "timestamp" : results["timestamp"],
+        "machineName" : results["machineName"],
+        "parameters" : results["parameters"]
+      }
+    WriteJsonFile(BASELINE_FILE_PATH, baseline)
+    print "Baseline updated: " + BASELINE_FILE_PATH
+    passed = True
+
+  print
+  print "PASSED" if passed else "FAILED (see above)"
+  return 0 if passed else 1
+
+sys.exit(Main(sys.argv[1:]))
@@ -0,0 +1,183 @@
+
+# Measures the throughput of the monitor's pipe readers by pushing lines through an anonymous pipe in-process.
+#
+# Three paths are compared:
+#   - stream_io_util.ReadAvailableLines() polled every 250ms (the previous monitor loop), one ReadLineAsync Task per line.
+#   - monitor_process.ChunkedLineReader, which reads 64K chunks and splits lines in bulk (Revit standard output / error).
+#   - ipc_protocol.MessageReader over log frames written with ipc_protocol.MessageWriter (script output).
+#   - As above, with the frames written by ipc_protocol.QueuedMessageWriter (the script host's batched writer).
+#
+# The chunked and framed paths are expected to sustain at least MIN_LINES_PER_SECOND.
+#
+# Usage: ipy64.bat benchmark_pipe_reader.py [linesCount]
+
+import clr
+import System
+
+from System.Diagnostics import Stopwatch
+from System.IO import StreamReader, StreamWriter
+from System.IO.Pipes import AnonymousPipeServerStream, AnonymousPipeClientStream, PipeDirection, HandleInheritability
+from System.Text import UTF8Encoding
+from System.Threading import Thread
+
+import os
+import sys
+import threading
+
+SCRIPTS_FOLDER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "BatchRvtUtil", "Scripts")
+sys.path.append(SCRIPTS_FOLDER_PATH)
+
+import ipc_protocol
+import monitor_process
+import stream_io_util
+
+DEFAULT_LINES_COUNT = 1000000
+# The polling path is far slower, so it is measured over fewer lines.
+POLLING_LINES_COUNT_DIVISOR = 20
+POLLING_MONITOR_INTERVAL_IN_SECONDS = 0.25
+READ_TIMEOUT_IN_SECONDS = 600
+MIN_LINES_PER_SECOND = 100000
+
+WRITER_BUFFER_SIZE = 64 * 1024
+
+def GetLine(lineNumber):
+  return "Processing file " + str(lineNumber) + ": C:\\Projects\\Benchmark\\Model " + str(lineNumber) + ".rvt"
+
+def CreatePipe():
+  serverStream = AnonymousPipeServerStream(PipeDirection.In, HandleInheritability.None)
+  clientStream = AnonymousPipeClientStream(PipeDirection.Out, serverStream.GetClientHandleAsString())
+  serverStream.DisposeLocalCopyOfClientHandle()
+  return serverStream, clientStream
+
+def StartWriter(write):
+  writerThread = threading.Thread(target=write)
+  writerThread.daemon = True
+  writerThread.start()
+  return writerThread
+
+def StartTextWriter(clientStream, linesCount):
+  def write():
+    streamWriter = StreamWriter(clientStream, UTF8Encoding(False), WRITER_BUFFER_SIZE)
+    for lineNumber in xrange(linesCount):
+      streamWriter.WriteLine(GetLine(lineNumber))
+    streamWriter.Dispose()
+    return
+  return StartWriter(write)
+
+def StartMessageWriter(clientStream, linesCount):
+  def write():
+    messageWriter = ipc_protocol.MessageWriter(clientStream)
+    for lineNumber in xrange(linesCount):
+      messageWriter.SendLog(GetLine(lineNumber))
+    clientStream.Dispose()
+    return
+  return StartWriter(write)
+
+def StartQueuedMessageWriter(clientStream, linesCount):
+  def write():
+    messageWriter = ipc_protocol.QueuedMessageWriter(clientStream)
+    for lineNumber in xrange(linesCount):
+      messageWriter.SendLog(GetLine(lineNumber))
+    messageWriter.Close()
+    clientStream.Dispose()
+    return
+  return StartWriter(write)
+
+class LineCounter(object):
+  def __init__(self):
+    self.linesCount = 0
+    self.lastLine = None
+    return
+
+  def OnLines(self, lines):
+    self.linesCount += len(lines)
+    self.lastLine = lines[-1]
+    return
+
+  def OnMessage(self, message):
+    self.linesCount += 1
+    self.lastLine = message[ipc_protocol.MESSAGE__TEXT]
+    return
+
+def RunPollingReader(linesCount, lineCounter):
+  serverStream, clientStream = CreatePipe()
+  streamReader = StreamReader(serverStream)
+  writerThread = StartTextWriter(clientStream, linesCount)
+  pendingReadLineTask = None
+  while True:
+    lines, pendingReadLineTask = stream_io_util.ReadAvailableLines(streamReader, pendingReadLineTask)
+    if lines:
+      lineCounter.OnLines(lines)
+    if pendingReadLineTask is None:
+      break
+    Thread.Sleep(int(POLLING_MONITOR_INTERVAL_IN_SECONDS * 1000))
+  writerThread.join()
+  serverStream.Dispose()
+  return
+
+def RunChunkedReader(linesCount, lineCounter):
+  serverStream, clientStream = CreatePipe()
+  writerThread = StartTextWriter(clientStream, linesCount)
+  monitor_process.DrainStreamReaders(
+      [monitor_process.ChunkedLineReader(StreamReader(serverStream), lineCounter.OnLines)],
+      READ_TIMEOUT_IN_SECONDS
+    )
+  writerThread.join()
+  serverStream.Dispose()
+  return
+
+def RunMessageReader(linesCount, lineCounter, startMessageWriter=StartMessageWriter):
+  serverStream, clientStream = CreatePipe()
+  writerThread = startMessageWriter(clientStream, linesCount)
+  monitor_process.DrainStreamReaders(
+      [ipc_protocol.MessageReader(serverStream, lineCounter.OnMessage)],
+      READ_TIMEOUT_IN_SECONDS
+    )
+  writerThread.join()
+  serverStream.Dispose()
+  return
+
+def MeasureReader(runReader, linesCount):
+  # Returns (elapsedSeconds, linesPerSecond, isComplete). Also used by benchmark_orchestration.py.
+  lineCounter = LineCounter()
+  stopwatch = Stopwatch.StartNew()
+  runReader(linesCount, lineCounter)
+  elapsedSeconds = stopwatch.Elapsed.TotalSeconds
+  linesPerSecond = lineCounter.linesCount / elapsedSeconds if elapsedSeconds > 0 else 0.0
+  isComplete = (lineCounter.linesCount == linesCount and lineCounter.lastLine == GetLine(linesCount - 1))
+  return elapsedSeconds, linesPerSecond, isComplete
+
+def RunBenchmark(readerName, runReader, linesCount, checkThroughput):
+  elapsedSeconds, linesPerSecond, isComplete = MeasureReader(runReader, linesCount)
+  passed = isComplete and (not checkThroughput or linesPerSecond >= MIN_LINES_PER_SECOND)
+  print
+  print readerName
+  print "\t" + "Lines: " + str(linesCount) + (" (complete)" if isComplete else " (INCOMPLETE)")
+  print "\t" + "Wall time: " + str.Format("{0:0.00}s", elapsedSeconds)
+  print "\t" + "Throughput: " + str.Format("{0:0} lines/s", linesPerSecond)
+  if checkThroughput:
+    print "\t" + ("PASS" if passed else "FAIL") + " (minimum " + str(MIN_LINES_PER_SECOND) + " lines/s)"
+  elif not isComplete:
+    print "\t" + "FAIL (incomplete)"
+  return passed
+
+def Main(args):
+  linesCount = int(args[0]) if args else DEFAULT_LINES_COUNT
+  results = [
+      RunBenchmark(
+          "Polling reader (stream_io_util.ReadAvailableLines)",
+          RunPollingReader, max(linesCount / POLLING_LINES_COUNT_DIVISOR, 1), False
+        ),
+      RunBenchmark("Chunked line reader (monitor_process.ChunkedLineReader)", RunChunkedReader, linesCount, True),
+      RunBenchmark("Framed log reader (ipc_protocol.MessageReader)", RunMessageReader, linesCount, True),
+      RunBenchmark(
+          "Framed log reader, queued writer (ipc_protocol.QueuedMessageWriter)",
+          lambda linesCount, lineCounter: RunMessageReader(linesCount, lineCounter, StartQueuedMessageWriter),
+          linesCount, True
+        )
+    ]
+  print
+  return 0 if all(results) else 1
+
+if __name__ == "__main__":
+  sys.exit(Main(sys.argv[1:]))
@@ -0,0 +1,90 @@
+
+# Measures the per-file cost of executing a task script with execfile() (re-read and re-compiled every time) against
+# script_util.ExecuteScript(), which compiles the script once and re-executes the cached code object.
+#
+# The task script is generated: a number of functions and a class per function, so its size (and compile time) can be
+# scaled to resemble a large real-world task script. Executing it only defines those functions.
+#
+# Usage: ipy64.bat benchmark_script_execution.py [functionsCount] [filesCount]
+
+import clr
+import System
+
+from System.Diagnostics import Stopwatch
+from System.IO import Path, File
+
+import os
+import sys
+
+SCRIPTS_FOLDER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "BatchRvtUtil", "Scripts")
+sys.path.append(SCRIPTS_FOLDER_PATH)
+
+import script_util
+
+DEFAULT_FUNCTIONS_COUNT = 500
+DEFAULT_FILES_COUNT = 100
+
+def GetFunctionSource(functionNumber):
+  return "\n".join([
+      "def Function" + str(functionNumber) + "(elements):",
+      "  results = []",
+      "  for element in elements:",
+      "    if element is not None and element.Id > " + str(functionNumber) + ":",
+      "      results.append((element.Id, element.Name))",
+      "  return results",
+      "",
+      "class Handler" + str(functionNumber) + "(object):",
+      "  def __init__(self, doc):",
+      "    self.doc = doc",
+      "    return",
+      "",
+      "  def Run(self, elements):",
+      "    return Function" + str(functionNumber) + "(elements)",
+      ""
+    ])
+
+def CreateTaskScript(functionsCount):
+  scriptFilePath = Path.Combine(Path.GetTempPath(), "benchmark_script_execution.task_script.py")
+  File.WriteAllText(
+      scriptFilePath,
+      "\n".join(GetFunctionSource(functionNumber) for functionNumber in range(functionsCount))
+    )
+  return scriptFilePath
+
+def ExecFileScript(scriptFilePath):
+  scriptGlobals = {}
+  execfile(scriptFilePath, scriptGlobals)
+  return
+
+def RunBenchmark(scriptName, executeScript, scriptFilePath, filesCount):
+  stopwatch = Stopwatch.StartNew()
+  executeScript(scriptFilePath)
+  firstFileInMilliseconds = stopwatch.Elapsed.TotalMilliseconds
+  for fileNumber in range(filesCount - 1):
+    executeScript(scriptFilePath)
+  totalInMilliseconds = stopwatch.Elapsed.TotalMilliseconds
+  perFileInMilliseconds = (
+      (totalInMilliseconds - firstFileInMilliseconds) / (filesCount - 1) if filesCount > 1 else firstFileInMilliseconds
+    )
+  print
+  print scriptName
+  print "\t" + "First file: " + str.Format("{0:0.00}ms", firstFileInMilliseconds)
+  print "\t" + "Subsequent files (mean): " + str.Format("{0:0.00}ms", perFileInMilliseconds)
+  print "\t" + "Total (" + str(filesCount) + " files): " + str.Format("{0:0}ms", totalInMilliseconds)
+  return perFileInMilliseconds
+
+def Main(args):
+  functionsCount = int(args[0]) if len(args) > 0 else DEFAULT_FUNCTIONS_COUNT
+  filesCount = int(args[1]) if len(args) > 1 else DEFAULT_FILES_COUNT
+  scriptFilePath = CreateTaskScript(functionsCount)
+  print
+  print "Task script: " + scriptFilePath + " (" + str(File.ReadAllText(scriptFilePath).Length) + " characters)"
+  execFilePerFileInMilliseconds = RunBenchmark("execfile()", ExecFileScript, scriptFilePath, filesCount)
+  cachedPerFileInMilliseconds = RunBenchmark(
+      "script_util.ExecuteScript() (cached code object)", script_util.ExecuteScript, scriptFilePath, filesCount
+    )
+  print
+  print "Saved per file: " + str.Format("{0:0.00}ms", execFilePerFileInMilliseconds - cachedPerFileInMilliseconds)
+  return
+
+Main(sys.argv[1:])
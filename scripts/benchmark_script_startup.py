@@ -0,0 +1,101 @@
+
+# Measures the startup saving of the precompiled BatchRvt script modules (see compiled_script_modules.py).
+#
+# Each run starts a fresh IronPython process that imports the BatchRvt monitor's script modules, either from source or
+# from the compiled scripts assembly, and reports the time taken. A fresh process is needed per run since IronPython
+# caches imported modules. In per-file mode this saving applies to every Revit session as well as to BatchRvt itself.
+#
+# Usage: ipy64.bat benchmark_script_startup.py [runsCount] [Debug|Release]
+
+import clr
+import System
+
+from System.Diagnostics import Process, ProcessStartInfo
+from System.IO import Path, File
+
+import os
+import sys
+
+REPOSITORY_FOLDER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SCRIPTS_FOLDER_PATH = os.path.join(REPOSITORY_FOLDER_PATH, "BatchRvtUtil", "Scripts")
+
+DEFAULT_RUNS_COUNT = 5
+DEFAULT_BUILD_CONFIG = "Release"
+
+# The modules imported by batch_rvt_monitor.py (which itself runs on import, so is not imported here).
+IMPORTED_MODULE_NAMES = [
+    "path_util",
+    "revit_file_list",
+    "batch_rvt_monitor_util",
+    "snapshot_data_util",
+    "session_data_util",
+    "session_data_exporter",
+    "exception_util",
+    "time_util",
+    "script_util",
+    "file_server_throttle",
+    "session_scheduler",
+    "processing_history",
+    "revit_file_metadata_cache",
+    "execution_plan",
+    "shared_work_queue",
+    "shard_util",
+    "revit_file_priority",
+    "session_watchdog",
+    "thread_util",
+    "revit_process",
+    "batch_rvt_config",
+    "batch_rvt_util"
+  ]
+
+def GetImportScript(buildConfig, useCompiledModules):
+  return "\n".join([
+      "import sys",
+      "sys.path.append(r\"" + Path.GetFullPath(SCRIPTS_FOLDER_PATH) + "\")",
+      "sys.path.append(r\"" + Path.GetFullPath(os.path.join(REPOSITORY_FOLDER_PATH, "BatchRvtUtil", "bin", "x64", buildConfig)) + "\")",
+      "from System.Diagnostics import Stopwatch",
+      "stopwatch = Stopwatch.StartNew()",
+      "import compiled_script_modules",
+      "loaded = compiled_script_modules.LoadOrCompileScriptModules()" if useCompiledModules else "loaded = False",
+      "\n".join("import " + moduleName for moduleName in IMPORTED_MODULE_NAMES),
+      "print str(stopwatch.Elapsed.TotalMilliseconds) + \" \" + str(loaded)",
+      ""
+    ])
+
+def RunImportScript(scriptFilePath):
+  psi = ProcessStartInfo(sys.executable, "\"" + scriptFilePath + "\"")
+  psi.UseShellExecute = False
+  psi.CreateNoWindow = True
+  psi.RedirectStandardOutput = True
+  process = Process.Start(psi)
+  outputLines = process.StandardOutput.ReadToEnd().Split(["\r\n", "\n"], System.StringSplitOptions.RemoveEmptyEntries)
+  process.WaitForExit()
+  elapsedMilliseconds, loaded = outputLines[-1].Split(" ")
+  return float(elapsedMilliseconds), loaded == "True"
+
+def RunBenchmark(benchmarkName, buildConfig, useCompiledModules, runsCount):
+  scriptFilePath = Path.Combine(Path.GetTempPath(), "benchmark_script_startup.import.py")
+  File.WriteAllText(scriptFilePath, GetImportScript(buildConfig, useCompiledModules))
+  if useCompiledModules:
+    # The first run compiles the assembly (if the scripts have changed), so is not counted.
+    RunImportScript(scriptFilePath)
+  results = [RunImportScript(scriptFilePath) for runNumber in range(runsCount)]
+  elapsedMilliseconds = [elapsed for elapsed, loaded in results]
+  meanInMilliseconds = sum(elapsedMilliseconds) / len(elapsedMilliseconds)
+  print
+  print benchmarkName
+  print "\t" + "Compiled modules loaded: " + str(all(loaded for elapsed, loaded in results))
+  print "\t" + "Import time mean: " + str.Format("{0:0}ms", meanInMilliseconds)
+  print "\t" + "Import time min: " + str.Format("{0:0}ms", min(elapsedMilliseconds))
+  return meanInMilliseconds
+
+def Main(args):
+  runsCount = int(args[0]) if len(args) > 0 else DEFAULT_RUNS_COUNT
+  buildConfig = args[1] if len(args) > 1 else DEFAULT_BUILD_CONFIG
+  sourceInMilliseconds = RunBenchmark("Modules imported from source", buildConfig, False, runsCount)
+  compiledInMilliseconds = RunBenchmark("Modules loaded from the compiled scripts assembly", buildConfig, True, runsCount)
+  print
+  print "Saved per process start: " + str.Format("{0:0}ms", sourceInMilliseconds - compiledInMilliseconds)
+  return
+
+Main(sys.argv[1:])